@@ -1,62 +1,393 @@
+import heapq
+import math
+import sys
+from array import array
+from decimal import Decimal
+from itertools import islice
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# QuickSort tuning
+INSERTION_SORT_THRESHOLD = 16  # ranges this small are finished with insertion sort
+NINTHER_THRESHOLD = 128        # ranges this large take the median of three medians as pivot
+STABLE_SAMPLE_SIZE = 1024      # keys sampled to pick the stable strategy (grouping or positions)
+
+# Selection tuning
+FLOYD_RIVEST_SAMPLE_CUTOFF = 600  # ranges this large are first narrowed by selecting from a sample
+
+# Outlier values returned by OutlierDetector.detect_outliers (the count is always exact)
+OUTLIER_SAMPLE_SIZE = 100
+
+# TDigest: centroid budget (accuracy vs size) and values buffered per compression
+TDIGEST_COMPRESSION = 200
+TDIGEST_BUFFER_FACTOR = 5
+
+
+def _swap(keys, items, i, j):
+    keys[i], keys[j] = keys[j], keys[i]
+    if items is not None:
+        items[i], items[j] = items[j], items[i]
+
+
+def _median_of_three(keys, a, b, c):
+    """Index of the median of keys[a], keys[b], keys[c]"""
+    ka, kb, kc = keys[a], keys[b], keys[c]
+    if ka < kb:
+        if kb < kc:
+            return b
+        return c if ka < kc else a
+    if ka < kc:
+        return a
+    return c if kb < kc else b
+
+
+def _choose_pivot(keys, low, high):
+    """Pivot index for keys[low:high]: median of three, or Tukey's ninther for large ranges"""
+    size = high - low
+    mid = low + size // 2
+    last = high - 1
+    if size < NINTHER_THRESHOLD:
+        return _median_of_three(keys, low, mid, last)
+    step = size // 8
+    return _median_of_three(
+        keys,
+        _median_of_three(keys, low, low + step, low + 2 * step),
+        _median_of_three(keys, mid - step, mid, mid + step),
+        _median_of_three(keys, last - 2 * step, last - step, last),
+    )
+
+
+def _partition3(keys, items, low, high, pivot_index):
+    """
+    Dijkstra three-way partition of keys[low:high] around keys[pivot_index].
+    Returns (lt, gt): keys[low:lt] < pivot, keys[lt:gt] == pivot, keys[gt:high] > pivot.
+    """
+    pivot = keys[pivot_index]
+    lt, i, gt = low, low, high
+    while i < gt:
+        value = keys[i]
+        if value < pivot:
+            if lt != i:
+                _swap(keys, items, lt, i)
+            lt += 1
+            i += 1
+        elif pivot < value:
+            gt -= 1
+            _swap(keys, items, i, gt)
+        else:
+            i += 1
+    return lt, gt
+
+
+def _insertion_sort(keys, items, low, high):
+    for i in range(low + 1, high):
+        value = keys[i]
+        item = items[i] if items is not None else None
+        j = i - 1
+        while j >= low and value < keys[j]:
+            keys[j + 1] = keys[j]
+            if items is not None:
+                items[j + 1] = items[j]
+            j -= 1
+        keys[j + 1] = value
+        if items is not None:
+            items[j + 1] = item
+
+
+def _sift_down(keys, items, low, root, size):
+    # Max-heap over keys[low:low + size], heap positions relative to low
+    while True:
+        child = 2 * root + 1
+        if child >= size:
+            return
+        if child + 1 < size and keys[low + child] < keys[low + child + 1]:
+            child += 1
+        if not keys[low + root] < keys[low + child]:
+            return
+        _swap(keys, items, low + root, low + child)
+        root = child
+
+
+def _heapsort(keys, items, low, high):
+    """Fallback when partitioning keeps producing lopsided ranges"""
+    size = high - low
+    for root in range(size // 2 - 1, -1, -1):
+        _sift_down(keys, items, low, root, size)
+    for end in range(size - 1, 0, -1):
+        _swap(keys, items, low, low + end)
+        _sift_down(keys, items, low, 0, end)
+
+
+def _presorted(keys):
+    """
+    1 when keys never descend, -1 when they strictly descend (reversing them
+    moves no equal keys past each other), otherwise 0. ORDER BY results often
+    arrive sorted one way or the other, and both checks are O(n).
+    """
+    if not any(b < a for a, b in zip(keys, islice(keys, 1, None))):
+        return 1
+    if all(b < a for a, b in zip(keys, islice(keys, 1, None))):
+        return -1
+    return 0
+
+
+def _introsort(keys, items):
+    """Sort keys ascending in place, applying the same moves to items (unless None)"""
+    presorted = _presorted(keys)
+    if presorted:
+        if presorted < 0:
+            keys.reverse()
+            if items is not None:
+                items.reverse()
+        return
+
+    stack = [(0, len(keys), 2 * len(keys).bit_length())]
+    while stack:
+        low, high, depth = stack.pop()
+        # Loop on the smaller side and push the larger one, so the stack stays O(log n)
+        while high - low > INSERTION_SORT_THRESHOLD:
+            if depth == 0:
+                _heapsort(keys, items, low, high)
+                break
+            depth -= 1
+            lt, gt = _partition3(keys, items, low, high, _choose_pivot(keys, low, high))
+            if lt - low < high - gt:
+                stack.append((gt, high, depth))
+                high = lt
+            else:
+                stack.append((low, lt, depth))
+                low = gt
+        else:
+            _insertion_sort(keys, items, low, high)
+
+
+def _group_sorted(keys, items):
+    """Stable sort for keys with few distinct values; raises TypeError for unhashable keys"""
+    # Each group is already in input order, so only the distinct keys are sorted
+    groups = {}
+    for value, item in zip(keys, items):
+        group = groups.get(value)
+        if group is None:
+            groups[value] = [item]
+        else:
+            group.append(item)
+    distinct = list(groups)
+    _introsort(distinct, None)
+    return [item for value in distinct for item in groups[value]]
+
+
+def _position_sorted(keys, items):
+    """Stable sort for mostly distinct keys: input positions break the (short) runs of ties"""
+    keys = list(keys)
+    order = list(range(len(keys)))
+    _introsort(keys, order)
+    start = 0
+    for i in range(1, len(keys) + 1):
+        if i == len(keys) or keys[start] < keys[i]:
+            if i - start > 1:
+                run = order[start:i]
+                _introsort(run, None)
+                order[start:i] = run
+            start = i
+    return [items[position] for position in order]
+
+
+def _stable_sorted(keys, items):
+    """items in ascending key order, items with equal keys in input order"""
+    # Grouping wins when a sample of the keys repeats a lot (hour_of_day, categories)
+    sample = keys[::max(1, len(keys) // STABLE_SAMPLE_SIZE)]
+    try:
+        if 2 * len(set(sample)) <= len(sample):
+            return _group_sorted(keys, items)
+    except TypeError:
+        pass  # unhashable keys
+    return _position_sorted(keys, items)
+
+
 class QuickSort:
+    """
+    Introsort with the recursive quicksort's interface. Keys are computed once
+    per element; ranges are partitioned three ways around a median-of-three
+    (ninther for large ranges) pivot, small ranges are insertion sorted, and
+    heapsort takes over when partitioning goes past 2*log2(n) levels, so sorted,
+    reversed and duplicate-heavy inputs all stay O(n log n) without recursion.
+    """
     
     @staticmethod
-    def sort(arr, key=None, reverse=False):
+    def sort(arr, key=None, reverse=False, stable=False):
+        """
+        Return a sorted copy of arr. With stable=True, elements with equal keys
+        keep their original relative order (also when reverse=True).
+        """
         if not arr:
             return []
         
-        # Create a copy to avoid modifying original
-        result = arr[:]
+        result = list(arr)
+        if stable and reverse:
+            # Reversing before and after an ascending stable sort keeps ties in input order
+            result.reverse()
         
-        def get_value(item):
-            """Extract sorting value from item"""
-            if key:
-                return key(item)
-            return item
+        if key is None and not stable:
+            _introsort(result, None)
+        elif not stable:
+            keys = [key(item) for item in result]
+            _introsort(keys, result)
+        else:
+            keys = [key(item) for item in result] if key else result
+            presorted = _presorted(keys)
+            if presorted < 0:
+                result.reverse()
+            elif not presorted:
+                result = _stable_sorted(keys, result)
         
-        def partition(low, high):
-            """
-            Lomuto partition scheme
-            Places pivot element at its correct position
-            """
-            # Choose last element as pivot
-            pivot_val = get_value(result[high])
-            i = low - 1
-            
-            for j in range(low, high):
-                current_val = get_value(result[j])
-                
-                # Comparison based on sort order
-                if reverse:
-                    should_swap = current_val > pivot_val
-                else:
-                    should_swap = current_val < pivot_val
-                
-                if should_swap:
-                    i += 1
-                    result[i], result[j] = result[j], result[i]
-            
-            result[i + 1], result[high] = result[high], result[i + 1]
-            return i + 1
+        if reverse:
+            result.reverse()
+        return result
+
+
+def _floyd_rivest(values, left, right, k, depth):
+    """
+    Rearrange values[left:right + 1] so values[k] holds the k-th smallest, with
+    nothing larger before it and nothing smaller after it. Large ranges first
+    narrow [left, right] around k by recursively selecting from a sample; after
+    depth narrowing rounds the rest of the range is heapsorted instead.
+    """
+    while right > left:
+        if depth == 0:
+            _heapsort(values, None, left, right + 1)
+            return
+        depth -= 1
+        size = right - left + 1
+        if size > FLOYD_RIVEST_SAMPLE_CUTOFF:
+            rank = k - left + 1
+            z = math.log(size)
+            sample = 0.5 * math.exp(2 * z / 3)
+            deviation = 0.5 * math.sqrt(z * sample * (size - sample) / size)
+            if rank < size / 2:
+                deviation = -deviation
+            new_left = max(left, int(k - rank * sample / size + deviation))
+            new_right = min(right, int(k + (size - rank) * sample / size + deviation))
+            _floyd_rivest(values, new_left, new_right, k, depth)
+
+        # Hoare partition of [left, right] around values[k], with sentinels at both ends
+        pivot = values[k]
+        values[left], values[k] = values[k], values[left]
+        if pivot < values[right]:
+            values[left], values[right] = values[right], values[left]
+        i, j = left, right
+        while i < j:
+            values[i], values[j] = values[j], values[i]
+            i += 1
+            j -= 1
+            while values[i] < pivot:
+                i += 1
+            while pivot < values[j]:
+                j -= 1
+        if values[left] == pivot:
+            values[left], values[j] = values[j], values[left]
+        else:
+            j += 1
+            values[j], values[right] = values[right], values[j]
+
+        if j <= k:
+            left = j + 1
+        if k <= j:
+            right = j - 1
+
+
+class Selection:
+    """
+    Order statistics without sorting: Floyd-Rivest selection with an
+    introselect-style heapsort fallback. Works in place on a mutable sequence,
+    normally an array('d') copy of the data (see to_buffer).
+    """
+    
+    @staticmethod
+    def to_buffer(data):
+        """Copy numeric data into a float64 array that selection may rearrange"""
+        return array('d', data)
+    
+    @staticmethod
+    def select(values, k):
+        """k-th smallest element (0-based), expected O(n); partially reorders values"""
+        if not 0 <= k < len(values):
+            raise IndexError("selection rank out of range")
+        _floyd_rivest(values, 0, len(values) - 1, k, 4 * len(values).bit_length())
+        return values[k]
+    
+    @staticmethod
+    def select_many(values, ranks):
+        """
+        Several order statistics at once: {rank: value}. Each selection splits the
+        range, so ranks on either side only search their own part of the buffer.
+        """
+        ranks = sorted(set(ranks))
+        if ranks and not (0 <= ranks[0] and ranks[-1] < len(values)):
+            raise IndexError("selection rank out of range")
+        depth = 4 * len(values).bit_length()
         
-        def quicksort_recursive(low, high):
-            """Recursive QuickSort implementation"""
-            if low < high:
-                # Partition and get pivot index
-                pi = partition(low, high)
-                
-                # Recursively sort elements before and after partition
-                quicksort_recursive(low, pi - 1)
-                quicksort_recursive(pi + 1, high)
+        result = {}
+        stack = [(0, len(values) - 1, 0, len(ranks))]
+        while stack:
+            left, right, first, last = stack.pop()
+            if first >= last:
+                continue
+            middle = (first + last) // 2
+            k = ranks[middle]
+            _floyd_rivest(values, left, right, k, depth)
+            result[k] = values[k]
+            stack.append((left, k - 1, first, middle))
+            stack.append((k + 1, right, middle + 1, last))
+        return result
+    
+    @staticmethod
+    def quantiles(values, fractions):
+        """
+        Exact quantiles (linear interpolation between the closest ranks, position
+        q * (n - 1)) for each fraction in [0, 1]; partially reorders values
+        """
+        n = len(values)
+        positions = [q * (n - 1) for q in fractions]
+        ranks = set()
+        for position in positions:
+            ranks.add(int(position))
+            ranks.add(min(int(position) + 1, n - 1))
+        picked = Selection.select_many(values, ranks)
         
-        quicksort_recursive(0, len(result) - 1)
+        result = []
+        for position in positions:
+            low = int(position)
+            high = min(low + 1, n - 1)
+            result.append(picked[low] + (picked[high] - picked[low]) * (position - low))
         return result
 
 
 class RouteFrequencyCounter:
+    """
+    Counts trips per rounded (pickup, dropoff) route.
+
+    By default every route gets an exact counter. With capacity set, the counter
+    runs the Space-Saving algorithm instead: at most capacity routes are tracked,
+    and a new route replaces the least-counted one, inheriting its count as
+    possible overestimate. Memory stays fixed however long the stream is, every
+    route seen more than total/capacity times is guaranteed to be tracked, and each
+    reported count is at most its error above the true count.
+    """
     
-    def __init__(self):
+    def __init__(self, capacity=None):
+        if capacity is not None and capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
         self.frequency_map = {}
+        self.errors = {}        # bounded mode: route -> maximum overestimate of its count
+        self.total_routes = 0   # routes added so far
+        self.evictions = 0
+        self._min_heap = []     # bounded mode: (count, route), counts may be stale (too low)
     
     def add_route(self, pickup_coords, dropoff_coords):
         # Round coordinates to reduce granularity (group nearby locations)
@@ -64,89 +395,148 @@ class RouteFrequencyCounter:
         dropoff_rounded = (round(dropoff_coords[0], 3), round(dropoff_coords[1], 3))
         
         route_key = (pickup_rounded, dropoff_rounded)
+        self.total_routes += 1
         
-        if route_key in self.frequency_map:
-            self.frequency_map[route_key] += 1
-        else:
+        count = self.frequency_map.get(route_key)
+        if count is not None:
+            self.frequency_map[route_key] = count + 1
+        elif self.capacity is None:
+            self.frequency_map[route_key] = 1
+        elif len(self.frequency_map) < self.capacity:
             self.frequency_map[route_key] = 1
+            self.errors[route_key] = 0
+            heapq.heappush(self._min_heap, (1, route_key))
+        else:
+            # Replace the least-counted route; the newcomer may have been it all along
+            evicted_count = self._pop_min()
+            self.evictions += 1
+            self.frequency_map[route_key] = evicted_count + 1
+            self.errors[route_key] = evicted_count
+            heapq.heappush(self._min_heap, (evicted_count + 1, route_key))
+    
+    def _pop_min(self):
+        # Stale heap entries are refreshed until the top holds the true minimum
+        while True:
+            count, route = self._min_heap[0]
+            current = self.frequency_map[route]
+            if current == count:
+                heapq.heappop(self._min_heap)
+                del self.frequency_map[route]
+                del self.errors[route]
+                return count
+            heapq.heapreplace(self._min_heap, (current, route))
     
     def get_top_routes(self, n=10):
-        if not self.frequency_map:
-            return []
-        
-        # Convert to list of tuples
-        routes_list = []
-        for route, freq in self.frequency_map.items():
-            routes_list.append((route, freq))
-        
-        # Manual selection sort to find top N
-        # We only need top N, so we can optimize by doing N passes
-        result = []
-        
-        for _ in range(min(n, len(routes_list))):
-            if not routes_list:
-                break
-            
-            # Find maximum frequency in remaining routes
-            max_idx = 0
-            max_freq = routes_list[0][1]
-            
-            for i in range(1, len(routes_list)):
-                if routes_list[i][1] > max_freq:
-                    max_freq = routes_list[i][1]
-                    max_idx = i
-            
-            # Add to result and remove from list
-            result.append(routes_list[max_idx])
-            routes_list.pop(max_idx)
-        
-        return result
+        """The n most frequent routes as (route, count), highest first; ties keep first-seen order"""
+        # Bounded heap of size n over the counts: O(routes * log n)
+        return heapq.nlargest(n, self.frequency_map.items(), key=itemgetter(1))
+    
+    def get_top_routes_with_errors(self, n=10):
+        """
+        Like get_top_routes, as (route, count, error): the true count lies in
+        [count - error, count]. Errors are always 0 in exact mode.
+        """
+        return [(route, count, self.errors.get(route, 0)) for route, count in self.get_top_routes(n)]
+    
+    def get_error_bound(self):
+        """Largest possible true count of a route that is not being tracked (0 when exact)"""
+        if not self.evictions:
+            return 0
+        return min(self.frequency_map.values())
+    
+    def is_exact(self):
+        """True while every count is exact (no route has been evicted yet)"""
+        return not self.evictions
     
     def get_total_unique_routes(self):
-        """Get count of unique routes"""
+        """Get count of unique routes (only a lower bound once routes have been evicted)"""
         return len(self.frequency_map)
 
 
+def _median_ranks(offset, size):
+    # Positions (in sorted order) whose average is the median of size values from offset
+    return offset + (size - 1) // 2, offset + size // 2
+
+
+def _size(data):
+    return 0 if data is None else len(data)
+
+
 class OutlierDetector:
+    """
+    IQR outlier detection and summary statistics.
+
+    Inputs may be lists, array('d')/memoryview buffers or NumPy arrays. With
+    NumPy installed, buffers and arrays are used in place (no copy) and the work
+    is vectorized; otherwise everything runs in pure Python. Both paths return the
+    same order statistics, bounds, outlier counts and samples; mean and std_dev
+    agree up to floating-point summation order.
+    """
     
     @staticmethod
-    def calculate_quartiles(data):
-        if not data:
-            return None, None, None
-        
-        # Sort data manually using our QuickSort
-        sorted_data = QuickSort.sort(data)
-        n = len(sorted_data)
+    def _as_array(data):
+        # NumPy view of data (a copy only for lists and non-numeric buffers), or None
+        if np is None:
+            return None
+        values = np.asarray(data)
+        if values.dtype.kind not in 'iuf':
+            values = values.astype(np.float64)
+        return values.reshape(-1)
+    
+    @staticmethod
+    def five_number_summary(data):
+        """
+        min, Q1, median, Q3 and max of data in expected linear time, by selecting
+        only the needed order statistics (np.partition, or Selection on an
+        array('d') copy). Quartiles are the medians of the lower and upper halves
+        (the median itself excluded when n is odd).
+        """
+        n = _size(data)
+        if not n:
+            return None
         
-        # Calculate median (Q2)
-        if n % 2 == 0:
-            q2 = (sorted_data[n // 2 - 1] + sorted_data[n // 2]) / 2
-        else:
-            q2 = sorted_data[n // 2]
+        half = n // 2
+        median_ranks = _median_ranks(0, n)
+        lower_ranks = _median_ranks(0, half) if half else median_ranks
+        upper_ranks = _median_ranks(n - half, half) if half else median_ranks
+        ranks = (0, n - 1) + median_ranks + lower_ranks + upper_ranks
         
-        # Calculate Q1 (median of lower half)
-        lower_half = sorted_data[:n // 2]
-        if len(lower_half) % 2 == 0:
-            q1 = (lower_half[len(lower_half) // 2 - 1] + lower_half[len(lower_half) // 2]) / 2
+        values = OutlierDetector._as_array(data)
+        if values is not None:
+            unique_ranks = sorted(set(ranks))
+            partitioned = np.partition(values, unique_ranks)
+            picked = {rank: float(partitioned[rank]) for rank in unique_ranks}
         else:
-            q1 = lower_half[len(lower_half) // 2]
+            picked = Selection.select_many(Selection.to_buffer(data), ranks)
         
-        # Calculate Q3 (median of upper half)
-        if n % 2 == 0:
-            upper_half = sorted_data[n // 2:]
-        else:
-            upper_half = sorted_data[n // 2 + 1:]
+        def median(ranks):
+            low, high = ranks
+            return picked[low] if low == high else (picked[low] + picked[high]) / 2
         
-        if len(upper_half) % 2 == 0:
-            q3 = (upper_half[len(upper_half) // 2 - 1] + upper_half[len(upper_half) // 2]) / 2
-        else:
-            q3 = upper_half[len(upper_half) // 2]
+        return {
+            'min': picked[0],
+            'q1': median(lower_ranks),
+            'median': median(median_ranks),
+            'q3': median(upper_ranks),
+            'max': picked[n - 1],
+        }
+    
+    @staticmethod
+    def calculate_quartiles(data, summary=None):
+        if not _size(data):
+            return None, None, None
         
-        return q1, q2, q3
+        summary = summary or OutlierDetector.five_number_summary(data)
+        return summary['q1'], summary['median'], summary['q3']
     
     @staticmethod
-    def detect_outliers(data, multiplier=1.5):
-        if not data or len(data) < 4:
+    def detect_outliers(data, multiplier=1.5, summary=None, sample_size=OUTLIER_SAMPLE_SIZE):
+        """
+        IQR bounds plus the exact outlier count. 'outliers' holds at most
+        sample_size outlier values, the first ones in input order.
+        """
+        n = _size(data)
+        if n < 4:
             return {
                 'outliers': [],
                 'lower_bound': None,
@@ -157,36 +547,46 @@ class OutlierDetector:
                 'iqr': None
             }
         
-        q1, q2, q3 = OutlierDetector.calculate_quartiles(data)
+        q1, q2, q3 = OutlierDetector.calculate_quartiles(data, summary)
         iqr = q3 - q1
         
         # Calculate bounds
         lower_bound = q1 - (multiplier * iqr)
         upper_bound = q3 + (multiplier * iqr)
         
-        # Find outliers
-        outliers = []
-        for value in data:
-            if value < lower_bound or value > upper_bound:
-                outliers.append(value)
+        # Count outliers, keeping only a sample of the values
+        values = OutlierDetector._as_array(data)
+        if values is not None:
+            mask = (values < lower_bound) | (values > upper_bound)
+            outlier_count = int(np.count_nonzero(mask))
+            outliers = values[np.flatnonzero(mask)[:sample_size]].tolist()
+        else:
+            outlier_count = 0
+            outliers = []
+            for value in data:
+                if value < lower_bound or value > upper_bound:
+                    outlier_count += 1
+                    if len(outliers) < sample_size:
+                        outliers.append(value)
         
         return {
             'outliers': outliers,
-            'outlier_count': len(outliers),
-            'outlier_percentage': (len(outliers) / len(data)) * 100,
+            'outlier_count': outlier_count,
+            'outliers_truncated': outlier_count > len(outliers),
+            'outlier_percentage': (outlier_count / n) * 100,
             'lower_bound': lower_bound,
             'upper_bound': upper_bound,
             'q1': q1,
             'q2': q2,
             'q3': q3,
             'iqr': iqr,
-            'total_values': len(data)
+            'total_values': n
         }
     
     @staticmethod
-    def calculate_statistics(data):
-
-        if not data:
+    def calculate_statistics(data, summary=None):
+        n = _size(data)
+        if not n:
             return {
                 'mean': None,
                 'median': None,
@@ -196,31 +596,28 @@ class OutlierDetector:
                 'std_dev': None
             }
         
-        n = len(data)
-        
-        # Calculate mean
-        total = 0
-        for value in data:
-            total += value
-        mean = total / n
-        
-        # Calculate median
-        sorted_data = QuickSort.sort(data)
-        if n % 2 == 0:
-            median = (sorted_data[n // 2 - 1] + sorted_data[n // 2]) / 2
+        # Mean and (population) standard deviation
+        values = OutlierDetector._as_array(data)
+        if values is not None:
+            mean = float(values.mean(dtype=np.float64))
+            std_dev = float(values.std(dtype=np.float64))
         else:
-            median = sorted_data[n // 2]
+            # Welford: one pass, no catastrophic cancellation
+            count = 0
+            mean = 0.0
+            m2 = 0.0
+            for value in data:
+                count += 1
+                delta = value - mean
+                mean += delta / count
+                m2 += delta * (value - mean)
+            std_dev = (m2 / n) ** 0.5
         
-        # Calculate min and max
-        min_val = sorted_data[0]
-        max_val = sorted_data[-1]
-        
-        # Calculate standard deviation
-        variance_sum = 0
-        for value in data:
-            variance_sum += (value - mean) ** 2
-        variance = variance_sum / n
-        std_dev = variance ** 0.5
+        # Median, min and max by selection (or from the caller's five_number_summary)
+        summary = summary or OutlierDetector.five_number_summary(data)
+        median = summary['median']
+        min_val = summary['min']
+        max_val = summary['max']
         
         return {
             'mean': mean,
@@ -233,73 +630,370 @@ class OutlierDetector:
         }
 
 
-class TimeSeriesGrouper:
+class TDigest:
+    """
+    Mergeable quantile sketch (merging t-digest, arcsine scale function).
+    Values are summarized by at most about compression centroids: small ones
+    near the tails, so extreme quantiles stay accurate. Digests built on separate
+    data merge into a digest of the union, and serialize to a few kilobytes.
+    """
+    
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.centroids = []  # (mean, weight), sorted by mean
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self._buffer = []    # (value, weight) not yet merged into centroids
+    
+    def add(self, value, weight=1.0):
+        self.add_many(((value, weight),))
+    
+    def add_values(self, values):
+        """Add unweighted values"""
+        self.add_many([(float(value), 1.0) for value in values])
+    
+    def add_many(self, pairs):
+        """Add (value, weight) pairs"""
+        for value, weight in pairs:
+            self._buffer.append((value, weight))
+            self.total += weight
+            if value < self.minimum:
+                self.minimum = value
+            if value > self.maximum:
+                self.maximum = value
+        if len(self._buffer) >= TDIGEST_BUFFER_FACTOR * self.compression:
+            self._compress()
+    
+    def merge(self, other):
+        """Fold other into self"""
+        other._compress()
+        self.add_many(other.centroids)
+        if other.centroids:
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+        return self
+    
+    def _q_limit(self, q):
+        # Largest quantile the centroid starting at q may reach: one unit of k1(q) = d/2pi * asin(2q - 1)
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+    
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = self.centroids + self._buffer
+        points.sort(key=itemgetter(0))
+        self._buffer = []
+        
+        total = self.total
+        merged = []
+        cumulative = 0.0
+        mean, weight = points[0]
+        limit = self._q_limit(0.0) * total
+        for point_mean, point_weight in islice(points, 1, None):
+            if cumulative + weight + point_weight <= limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                limit = self._q_limit(min(cumulative / total, 1.0)) * total
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+    
+    def count(self):
+        return self.total
+    
+    def quantile(self, q):
+        """Approximate value at quantile q (0..1), None when empty"""
+        self._compress()
+        if not self.centroids:
+            return None
+        if q <= 0:
+            return self.minimum
+        if q >= 1:
+            return self.maximum
+        centroids = self.centroids
+        if len(centroids) == 1:
+            return centroids[0][0]
+        
+        # Each centroid's weight is centered on its mean; interpolate between
+        # neighbouring centers, and towards min/max outside the first/last one
+        target = q * self.total
+        first_mean, first_weight = centroids[0]
+        if target < first_weight / 2:
+            return self.minimum + (first_mean - self.minimum) * target / (first_weight / 2)
+        cumulative = first_weight / 2
+        for (left_mean, left_weight), (right_mean, right_weight) in zip(centroids, islice(centroids, 1, None)):
+            step = (left_weight + right_weight) / 2
+            if cumulative + step >= target:
+                return left_mean + (right_mean - left_mean) * (target - cumulative) / step
+            cumulative += step
+        last_mean, last_weight = centroids[-1]
+        fraction = (target - cumulative) / (last_weight / 2)
+        return last_mean + (self.maximum - last_mean) * min(fraction, 1.0)
+    
+    def to_bytes(self):
+        """Compact little-endian float64 encoding: compression, min, max, then (mean, weight) pairs"""
+        self._compress()
+        values = array('d', (self.compression, self.minimum, self.maximum))
+        for mean, weight in self.centroids:
+            values.append(mean)
+            values.append(weight)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data):
+        values = array('d')
+        values.frombytes(bytes(data))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        digest = cls(compression=values[0])
+        digest.minimum = values[1]
+        digest.maximum = values[2]
+        digest.centroids = list(zip(values[3::2], values[4::2]))
+        digest.total = math.fsum(values[4::2])
+        return digest
 
+
+class RunningStats:
+    """
+    Streaming count, sum, min, max and Welford mean/variance of one metric.
+    Two RunningStats merge exactly (Chan et al.), so shards can be combined.
+    """
+    
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'mean', 'm2')
     
     def __init__(self):
-        self.groups = {}
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
     
-    def add_to_group(self, key, value):
-
-        if key not in self.groups:
-            self.groups[key] = []
-        self.groups[key].append(value)
+    def add(self, value):
+        # Sum and convert first, so a value that cannot be summed changes nothing
+        total = self.total + value
+        number = float(value)
+        self.count += 1
+        self.total = total
+        if self.count == 1:
+            self.minimum = self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        delta = number - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (number - self.mean)
+    
+    def merge(self, other):
+        """Fold other's values into self"""
+        if not other.count:
+            return self
+        if not self.count:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        if other.minimum < self.minimum:
+            self.minimum = other.minimum
+        if other.maximum > self.maximum:
+            self.maximum = other.maximum
+        return self
     
-    def aggregate(self, metric_keys):
+    def variance(self):
+        """Population variance (None when empty)"""
+        return self.m2 / self.count if self.count else None
+    
+    def std_dev(self):
+        variance = self.variance()
+        return None if variance is None else math.sqrt(variance)
+
 
+class TimeSeriesGrouper:
+    """
+    Groups values by key, keeping only a row count and one RunningStats per
+    metric per group: memory is O(groups), not O(rows). Groupers built on
+    separate shards combine with merge().
+    
+    By default every non-None metric value is accumulated as given, as when the
+    rows themselves were kept: bools count as 0/1, Decimals stay Decimals, NaN
+    carries into the sum and average, and aggregate() raises TypeError for a
+    metric whose values cannot be summed (strings). numeric_only=True instead
+    skips bools, strings and NaN and converts Decimals to float.
+    """
+    
+    def __init__(self, numeric_only=False):
+        self.numeric_only = numeric_only
+        self.groups = {}  # key -> [row count, {metric: RunningStats}]
+        self.errors = {}  # (key, metric) -> TypeError from adding a value, raised by aggregate()
+    
+    def _group(self, key):
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [0, {}]
+        return group
+    
+    def _add_value(self, key, metrics, metric, value):
+        if value is None:
+            return
+        if self.numeric_only:
+            if isinstance(value, Decimal):
+                value = float(value)
+            elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                return
+            if value != value:  # NaN
+                return
+        elif (key, metric) in self.errors:
+            return
+        stats = metrics.get(metric)
+        if stats is None:
+            stats = metrics[metric] = RunningStats()
+        try:
+            stats.add(value)
+        except TypeError as e:
+            self.errors[(key, metric)] = e
+    
+    def add_to_group(self, key, value):
+        """Add one row: a dict of metric values (any other value only counts as a row)"""
+        group = self._group(key)
+        group[0] += 1
+        if isinstance(value, dict):
+            metrics = group[1]
+            for metric, metric_value in value.items():
+                self._add_value(key, metrics, metric, metric_value)
+    
+    def add_many(self, keys, values):
+        """
+        Bulk path: keys is a sequence (or NumPy array) of group keys and values maps
+        each metric to an equally long sequence of values, added as add_to_group
+        would. With NumPy the statistics of float columns are computed per group
+        vectorized, then merged in; other columns (and, without numeric_only,
+        float columns holding NaN) are added value by value.
+        """
+        if np is None:
+            columns = list(values.items())
+            for row, key in enumerate(keys):
+                self.add_to_group(key, {metric: column[row] for metric, column in columns})
+            return
+        
+        if isinstance(keys, np.ndarray) and keys.ndim == 1:
+            group_keys, codes = np.unique(keys, return_inverse=True)
+            group_keys = group_keys.tolist()
+        else:
+            # Arbitrary hashable keys (tuples, strings): factorize in one dict pass
+            index = {}
+            codes = np.fromiter((index.setdefault(key, len(index)) for key in keys), dtype=np.intp)
+            group_keys = list(index)
+        groups = len(group_keys)
+        
+        rows = np.bincount(codes, minlength=groups)
+        for key, count in zip(group_keys, rows.tolist()):
+            self._group(key)[0] += count
+        
+        for metric, column in values.items():
+            array = np.asarray(column)
+            vectorized = array.ndim == 1 and array.dtype.kind == 'f'
+            if vectorized:
+                column = array.astype(np.float64, copy=False)
+                present = ~np.isnan(column)
+                vectorized = self.numeric_only or present.all()
+            if not vectorized:
+                column = column.tolist() if isinstance(column, np.ndarray) else column
+                group_metrics = [self._group(key)[1] for key in group_keys]
+                for code, value in zip(codes.tolist(), column):
+                    self._add_value(group_keys[code], group_metrics[code], metric, value)
+                continue
+            
+            metric_codes = codes[present]
+            column = column[present]
+            
+            counts = np.bincount(metric_codes, minlength=groups)
+            totals = np.bincount(metric_codes, weights=column, minlength=groups)
+            means = np.divide(totals, counts, out=np.zeros(groups), where=counts > 0)
+            deviations = column - means[metric_codes]
+            m2 = np.bincount(metric_codes, weights=deviations * deviations, minlength=groups)
+            minimums = np.full(groups, np.inf)
+            maximums = np.full(groups, -np.inf)
+            np.minimum.at(minimums, metric_codes, column)
+            np.maximum.at(maximums, metric_codes, column)
+            
+            for position in np.flatnonzero(counts).tolist():
+                shard = RunningStats()
+                shard.count = int(counts[position])
+                shard.total = float(totals[position])
+                shard.minimum = float(minimums[position])
+                shard.maximum = float(maximums[position])
+                shard.mean = float(means[position])
+                shard.m2 = float(m2[position])
+                metrics = self._group(group_keys[position])[1]
+                stats = metrics.get(metric)
+                if stats is None:
+                    metrics[metric] = shard
+                else:
+                    stats.merge(shard)
+    
+    def merge(self, other):
+        """Fold another grouper's groups into this one"""
+        for key, error in other.errors.items():
+            self.errors.setdefault(key, error)
+        for key, (count, metrics) in other.groups.items():
+            group = self._group(key)
+            group[0] += count
+            for metric, stats in metrics.items():
+                mine = group[1].get(metric)
+                if mine is None:
+                    mine = group[1][metric] = RunningStats()
+                mine.merge(stats)
+        return self
+    
+    def aggregate(self, metric_keys, include_std=False):
+        """Per group: count and {metric}_sum/_avg/_min/_max (plus _std with include_std)"""
         result = {}
         
-        for group_key, values in self.groups.items():
-            if not values:
+        for group_key, (count, metrics) in self.groups.items():
+            if not count:
                 continue
             
             group_result = {
-                'count': len(values)
+                'count': count
             }
             
-            # Calculate aggregates for each metric
             for metric in metric_keys:
-                metric_values = []
-                for item in values:
-                    if metric in item and item[metric] is not None:
-                        metric_values.append(item[metric])
-                
-                if metric_values:
-                    # Calculate sum
-                    total = 0
-                    for val in metric_values:
-                        total += val
-                    
-                    # Calculate average
-                    avg = total / len(metric_values)
-                    
-                    # Find min and max
-                    min_val = metric_values[0]
-                    max_val = metric_values[0]
-                    for val in metric_values[1:]:
-                        if val < min_val:
-                            min_val = val
-                        if val > max_val:
-                            max_val = val
-                    
-                    group_result[f'{metric}_sum'] = total
-                    group_result[f'{metric}_avg'] = avg
-                    group_result[f'{metric}_min'] = min_val
-                    group_result[f'{metric}_max'] = max_val
+                error = self.errors.get((group_key, metric))
+                if error is not None:
+                    raise error
+                stats = metrics.get(metric)
+                if stats is None or not stats.count:
+                    continue
+                group_result[f'{metric}_sum'] = stats.total
+                group_result[f'{metric}_avg'] = stats.total / stats.count
+                group_result[f'{metric}_min'] = stats.minimum
+                group_result[f'{metric}_max'] = stats.maximum
+                if include_std:
+                    group_result[f'{metric}_std'] = stats.std_dev()
             
             result[group_key] = group_result
         
         return result
     
     def get_sorted_groups(self, sort_by='count', reverse=True):
-
-        # First aggregate
-        aggregated = self.aggregate([])
         
-        # Convert to list
-        groups_list = []
-        for key, metrics in aggregated.items():
-            groups_list.append((key, metrics))
+        # Counts are kept per group, no aggregation pass needed
+        groups_list = [(key, {'count': count}) for key, (count, _) in self.groups.items() if count]
         
         # Sort using our QuickSort
         if sort_by in ['count'] and groups_list:
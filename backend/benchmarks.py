@@ -0,0 +1,220 @@
+"""
+Micro-benchmarks for the custom algorithms in algorithms.py
+
+Each suite times an algorithm on synthetic inputs shaped like the data the API
+feeds it, checks the result against a reference (usually the standard library)
+and prints both timings side by side:
+
+    python backend/benchmarks.py                        # every suite, default sizes
+    python backend/benchmarks.py sort --sizes 1000000,4000000
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+from algorithms import QuickSort, OutlierDetector, RouteFrequencyCounter, TimeSeriesGrouper
+
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+
+# A stable sort fails the suite when it is slower than the unstable key sort of the
+# same input (its baseline) by more than this factor and this many seconds
+STABLE_MAX_SLOWDOWN = 1.25
+STABLE_MIN_DELTA = 0.01
+
+
+def _sort_inputs(size, rng):
+    """Input distributions for the sort suite: name -> list"""
+    values = [rng.random() * 100 for _ in range(size)]
+    return {
+        # ORDER BY results arrive already sorted (or reversed)
+        'sorted': sorted(values),
+        'reversed': sorted(values, reverse=True),
+        # hour_of_day and the categorical columns have a handful of distinct values
+        'duplicates': [rng.randrange(24) for _ in range(size)],
+        'random': values,
+    }
+
+
+def _timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def bench_sort(sizes, rng):
+    """
+    QuickSort.sort against sorted(), plain, with a key, and stable; stable rows
+    also fail when slower than the unstable key sort (see STABLE_MAX_SLOWDOWN)
+    """
+    rows = []
+    for size in sizes:
+        for name, data in _sort_inputs(size, rng).items():
+            rows_data = [{'value': value} for value in data]
+            cases = (
+                ('plain', lambda: QuickSort.sort(data), lambda: sorted(data)),
+                ('key', lambda: QuickSort.sort(rows_data, key=lambda row: row['value']),
+                 lambda: sorted(rows_data, key=lambda row: row['value'])),
+                ('stable desc', lambda: QuickSort.sort(rows_data, key=lambda row: row['value'],
+                                                       reverse=True, stable=True),
+                 lambda: sorted(rows_data, key=lambda row: row['value'], reverse=True)),
+            )
+            for mode, ours, reference in cases:
+                result, seconds = _timed(ours)
+                expected, reference_seconds = _timed(reference)
+                if mode == 'stable desc':
+                    ok = all(a is b for a, b in zip(result, expected))
+                    ok = ok and seconds <= max(key_seconds * STABLE_MAX_SLOWDOWN, key_seconds + STABLE_MIN_DELTA)
+                else:
+                    ok = result == expected
+                if mode == 'key':
+                    key_seconds = seconds
+                rows.append((f"{name} ({mode})", size, seconds, reference_seconds, ok))
+    return rows
+
+
+def _sorted_summary(data):
+    # Reference five-number summary: sort, then read the same positions
+    ordered = sorted(data)
+    n = len(ordered)
+
+    def median(values):
+        middle = len(values) // 2
+        return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+    lower = ordered[:n // 2] or ordered
+    upper = (ordered[n // 2:] if n % 2 == 0 else ordered[n // 2 + 1:]) or ordered
+    return {'min': ordered[0], 'q1': median(lower), 'median': median(ordered),
+            'q3': median(upper), 'max': ordered[-1]}
+
+
+def bench_select(sizes, rng):
+    """OutlierDetector.five_number_summary (selection) against sorted()"""
+    rows = []
+    for size in sizes:
+        inputs = _sort_inputs(size, rng)
+        # Skewed like trip speeds and distances
+        inputs['lognormal'] = [rng.lognormvariate(2, 0.7) for _ in range(size)]
+        for name, data in inputs.items():
+            data = [float(value) for value in data]
+            result, seconds = _timed(lambda: OutlierDetector.five_number_summary(data))
+            expected, reference_seconds = _timed(lambda: _sorted_summary(data))
+            rows.append((f"{name} (five numbers)", size, seconds, reference_seconds, result == expected))
+    return rows
+
+
+def _routes(size, rng):
+    """Skewed (pickup, dropoff) pairs on a grid of 0.001-degree cells, like real trips"""
+    cells = [(-74.0 + rng.randrange(200) / 1000, 40.7 + rng.randrange(200) / 1000) for _ in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(cells))]
+    pickups = rng.choices(cells, weights, k=size)
+    dropoffs = rng.choices(cells, weights, k=size)
+    return list(zip(pickups, dropoffs))
+
+
+def bench_top_routes(sizes, rng, limit=10, capacity=10000):
+    """RouteFrequencyCounter top-k, exact and Space-Saving, against Counter.most_common"""
+    rows = []
+    for size in sizes:
+        routes = _routes(size, rng)
+        true_counts, reference_seconds = _timed(lambda: Counter(
+            ((round(p[0], 3), round(p[1], 3)), (round(d[0], 3), round(d[1], 3))) for p, d in routes
+        ))
+        expected = true_counts.most_common(limit)
+
+        for name, counter in (('exact', RouteFrequencyCounter()),
+                              (f"capacity {capacity:,}", RouteFrequencyCounter(capacity=capacity))):
+            def count():
+                for pickup, dropoff in routes:
+                    counter.add_route(pickup, dropoff)
+                return counter.get_top_routes_with_errors(limit)
+            result, seconds = _timed(count)
+            if counter.is_exact():
+                ok = [(route, frequency) for route, frequency, _ in result] == expected
+            else:
+                # Every reported count brackets the true count
+                ok = all(frequency - error <= true_counts[route] <= frequency for route, frequency, error in result)
+            rows.append((f"routes ({name})", size, seconds, reference_seconds, ok))
+    return rows
+
+
+def bench_group(sizes, rng):
+    """TimeSeriesGrouper.add_many (vectorized with NumPy) against row-by-row add_to_group"""
+    metrics = ['trip_distance_miles', 'avg_speed_mph']
+    rows = []
+    for size in sizes:
+        keys = [(rng.randrange(7), rng.randrange(24)) for _ in range(size)]
+        values = {
+            'trip_distance_miles': [rng.lognormvariate(0.8, 0.8) for _ in range(size)],
+            'avg_speed_mph': [rng.uniform(2, 40) for _ in range(size)],
+        }
+
+        def bulk():
+            grouper = TimeSeriesGrouper()
+            grouper.add_many(keys, values)
+            return grouper.aggregate(metrics, include_std=True)
+
+        def row_by_row():
+            grouper = TimeSeriesGrouper()
+            for row, key in enumerate(keys):
+                grouper.add_to_group(key, {metric: values[metric][row] for metric in metrics})
+            return grouper.aggregate(metrics, include_std=True)
+
+        result, seconds = _timed(bulk)
+        expected, reference_seconds = _timed(row_by_row)
+        ok = result.keys() == expected.keys() and all(
+            math.isclose(result[key][field], expected[key][field], rel_tol=1e-9)
+            for key in expected for field in expected[key]
+        )
+        rows.append(("(day, hour) groups, bulk", size, seconds, reference_seconds, ok))
+    return rows
+
+
+SUITES = {
+    'sort': bench_sort,
+    'select': bench_select,
+    'top-routes': bench_top_routes,
+    'group': bench_group,
+}
+
+
+def print_rows(suite, rows):
+    print(f"\n{suite}")
+    print(f"{'input':<28} {'n':>10} {'ours (s)':>10} {'reference (s)':>14} {'ratio':>7}  ok")
+    for name, size, seconds, reference_seconds, ok in rows:
+        ratio = seconds / reference_seconds if reference_seconds else float('inf')
+        print(f"{name:<28} {size:>10,} {seconds:>10.3f} {reference_seconds:>14.3f} {ratio:>6.1f}x  "
+              f"{'yes' if ok else 'NO'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the custom algorithms")
+    parser.add_argument('suites', nargs='*', help=f"suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated input sizes")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for the inputs")
+    args = parser.parse_args()
+
+    unknown = [suite for suite in args.suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(unknown)}")
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    rng = random.Random(args.seed)
+    failed = False
+    for suite in args.suites or list(SUITES):
+        rows = SUITES[suite](sizes, rng)
+        print_rows(suite, rows)
+        failed = failed or not all(row[-1] for row in rows)
+
+    if failed:
+        print("\nSome results did not match the reference implementation or were slower than their baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+In-memory columnar engine for the analytic endpoints
+
+The statistics, insights, dashboard and hourly-pattern endpoints aggregate a few
+numeric columns, and /api/trips counts rows matching simple filters. With the
+engine enabled, the server loads those columns once into NumPy arrays and answers
+them with vectorized masks and bincount grouping, instead of asking the database
+to scan and join every row again.
+
+Grouping columns are dictionary-encoded: each holds small integer codes plus the
+list of distinct values, so a group-by is np.ravel_multi_index + np.bincount.
+A snapshot is immutable and tagged with the dataset generation, a counter
+data_processor.py increments after every load, rebuild and outlier flag run.
+The engine re-checks the generation (one primary key lookup) at most every
+refresh_interval seconds and reloads when it changed. Requests that arrive
+during a reload keep using the previous snapshot.
+
+NumPy is optional; without it the server answers everything from SQL.
+"""
+
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+LOAD_FETCH_SIZE = 50000  # rows per fetchmany() while loading
+
+# Columns kept as raw values (for sums and range filters), with their dtype
+VALUE_COLUMNS = {
+    'trip_duration': 'int64',
+    'passenger_count': 'int64',
+    'trip_distance_miles': 'float64',
+    'avg_speed_mph': 'float64',
+    'trip_efficiency': 'float64',
+}
+
+# Columns dictionary-encoded for grouping and equality filters
+# (zone IDs load trips without a zone as 0, which no taxi zone uses)
+KEY_COLUMNS = ('vendor_id', 'hour_of_day', 'day_of_week', 'is_weekend', 'time_period', 'distance_category',
+               'pickup_zone_id', 'dropoff_zone_id')
+
+# /api/trips filter parameter -> (column, comparison, parser); same meaning as the SQL filters
+TRIP_FILTERS = {
+    'min_distance': ('trip_distance_miles', '>=', float),
+    'max_distance': ('trip_distance_miles', '<=', float),
+    'min_duration': ('trip_duration', '>=', int),
+    'max_duration': ('trip_duration', '<=', int),
+    'vendor_id': ('vendor_id', '=', int),
+    'hour': ('hour_of_day', '=', int),
+    'day_of_week': ('day_of_week', '=', int),
+    'is_weekend': ('is_weekend', '=', lambda value: int(value.lower() == 'true')),
+    'pickup_zone_id': ('pickup_zone_id', '=', int),
+    'dropoff_zone_id': ('dropoff_zone_id', '=', int),
+}
+
+# Unmasked group-by results kept per snapshot
+GROUP_CACHE_SIZE = 32
+
+
+def available():
+    """True when NumPy is installed"""
+    return np is not None
+
+
+def _format_datetime(value):
+    return str(value).replace('T', ' ')
+
+
+class TripColumns:
+    """Immutable column snapshot of the joined trips/trip_metrics rows"""
+
+    def __init__(self, generation, values, codes, labels, pickup):
+        self.generation = generation
+        self.values = values    # column -> ndarray
+        self.codes = codes      # key column -> ndarray of codes into labels
+        self.labels = labels    # key column -> list of distinct values, in code order
+        self.pickup = pickup    # pickup_datetime as datetime64[s]
+        self.size = len(pickup)
+        self._group_cache = {}
+        self._index_cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, storage, cursor, generation):
+        """Read every row of storage.stream_columnar_trips through cursor (tuple rows)"""
+        storage.stream_columnar_trips(cursor)
+        names = list(cursor.column_names)
+        raw = {name: [] for name in names}
+        while True:
+            rows = cursor.fetchmany(LOAD_FETCH_SIZE)
+            if not rows:
+                break
+            for name, column in zip(names, zip(*rows)):
+                raw[name].extend(column)
+
+        values = {name: np.asarray(raw[name], dtype=dtype) for name, dtype in VALUE_COLUMNS.items()}
+        codes = {}
+        labels = {}
+        for name in KEY_COLUMNS:
+            distinct, inverse = np.unique(np.asarray(raw[name]), return_inverse=True)
+            labels[name] = distinct.tolist()
+            codes[name] = inverse.astype(np.min_scalar_type(max(len(distinct) - 1, 0)))
+        pickup = np.asarray([str(value) for value in raw['pickup_datetime']], dtype='datetime64[s]')
+
+        return cls(generation, values, codes, labels, pickup)
+
+    def filter_mask(self, params):
+        """Boolean row mask for /api/trips filter parameters, or None when unfiltered"""
+        mask = None
+        for name, (column, comparison, parse) in TRIP_FILTERS.items():
+            if name not in params:
+                continue
+            value = parse(params[name][0])
+            if column in self.codes:
+                # Compare codes, not values: one byte per row
+                try:
+                    condition = self.codes[column] == self.labels[column].index(value)
+                except ValueError:
+                    condition = np.zeros(self.size, dtype=bool)
+            elif comparison == '>=':
+                condition = self.values[column] >= value
+            else:
+                condition = self.values[column] <= value
+
+            if mask is None:
+                mask = condition
+            else:
+                mask &= condition
+        return mask
+
+    def count(self, params):
+        """Number of trips matching /api/trips filter parameters"""
+        mask = self.filter_mask(params)
+        return self.size if mask is None else int(np.count_nonzero(mask))
+
+    def histogram(self, column, bins, value_range=None, log=False, mask=None):
+        """
+        Trip counts of a value column in bins equal-width bins (equal-ratio with
+        log, over positive values only), binned like /api/histogram's SQL:
+        FLOOR((value - low) / width), with the high edge in the last bin.
+        value_range defaults to the rows' min and max. Returns (low, high, counts)
+        or None when no row is in range.
+        """
+        values = self.values[column] if mask is None else self.values[column][mask]
+        if log:
+            values = values[values > 0]
+        if value_range is not None:
+            values = values[(values >= value_range[0]) & (values <= value_range[1])]
+        if not len(values):
+            return None
+        low, high = value_range or (float(values.min()), float(values.max()))
+        
+        scaled = np.log(values) if log else values.astype(np.float64)
+        start, stop = (np.log(low), np.log(high)) if log else (low, high)
+        width = (stop - start) / bins or 1.0
+        index = np.clip(np.floor((scaled - start) / width), 0, bins - 1).astype(np.intp)
+        return low, high, np.bincount(index, minlength=bins).tolist()
+
+    def _group_index(self, keys):
+        # Flat group number per row; cached since snapshots never change
+        index = self._index_cache.get(keys)
+        if index is None:
+            dims = tuple(len(self.labels[key]) for key in keys)
+            index = np.ravel_multi_index([self.codes[key] for key in keys], dims)
+            self._index_cache[keys] = index
+        return index
+
+    def group_by(self, keys, sums=None, averages=None, mask=None, pickup_range=False):
+        """
+        Aggregate rows per combination of key columns, like SQL GROUP BY.
+        Returns one dict per non-empty group with the key values, trip_count,
+        each sums/averages output name (mapped to its source column) and, with
+        pickup_range, earliest_trip/latest_trip. Groups come out in key order.
+        Unmasked results are cached; callers must not modify them.
+        """
+        keys = tuple(keys)
+        sums = sums or {}
+        averages = averages or {}
+        cache_key = None
+        if mask is None:
+            cache_key = (keys, tuple(sums.items()), tuple(averages.items()), pickup_range)
+            cached = self._group_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        if self.size == 0:
+            return []
+
+        dims = tuple(len(self.labels[key]) for key in keys)
+        cells = int(np.prod(dims))
+        index = self._group_index(keys)
+        if mask is not None:
+            index = index[mask]
+
+        counts = np.bincount(index, minlength=cells)
+        totals = {}
+        for column in set(sums.values()) | set(averages.values()):
+            column_values = self.values[column] if mask is None else self.values[column][mask]
+            totals[column] = np.bincount(index, weights=column_values, minlength=cells)
+
+        if pickup_range:
+            pickup = self.pickup.view('int64')
+            if mask is not None:
+                pickup = pickup[mask]
+            earliest = np.full(cells, np.iinfo(np.int64).max, dtype=np.int64)
+            latest = np.full(cells, np.iinfo(np.int64).min, dtype=np.int64)
+            np.minimum.at(earliest, index, pickup)
+            np.maximum.at(latest, index, pickup)
+
+        present = np.flatnonzero(counts)
+        key_codes = np.unravel_index(present, dims)
+        rows = []
+        for position, cell in enumerate(present.tolist()):
+            row = {key: self.labels[key][int(key_codes[k][position])] for k, key in enumerate(keys)}
+            count = int(counts[cell])
+            row['trip_count'] = count
+            for name, column in sums.items():
+                row[name] = float(totals[column][cell])
+            for name, column in averages.items():
+                row[name] = float(totals[column][cell]) / count
+            if pickup_range:
+                row['earliest_trip'] = _format_datetime(np.datetime64(int(earliest[cell]), 's'))
+                row['latest_trip'] = _format_datetime(np.datetime64(int(latest[cell]), 's'))
+            rows.append(row)
+
+        if cache_key is not None:
+            with self._lock:
+                if len(self._group_cache) >= GROUP_CACHE_SIZE:
+                    self._group_cache.pop(next(iter(self._group_cache)))
+                self._group_cache[cache_key] = rows
+        return rows
+
+
+class ColumnarEngine:
+    """Holds the current TripColumns snapshot and reloads it when the dataset changes"""
+
+    def __init__(self, storage, refresh_interval=5.0):
+        if np is None:
+            raise RuntimeError("The columnar engine requires NumPy")
+        self.storage = storage
+        self.refresh_interval = refresh_interval
+        self._columns = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def columns(self, connect):
+        """
+        Current snapshot. connect() supplies a database connection when the
+        generation has to be checked or the columns (re)loaded.
+        """
+        if self._columns is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return self._columns
+
+        # One thread checks and reloads; the others carry on with the current snapshot
+        if not self._lock.acquire(blocking=self._columns is None):
+            return self._columns
+        try:
+            if self._columns is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+                try:
+                    self._refresh(connect)
+                except Exception as e:
+                    if self._columns is None:
+                        raise
+                    print(f"Error refreshing columnar engine, serving previous snapshot: {str(e)}")
+                self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+        return self._columns
+
+    def _refresh(self, connect):
+        conn = connect()
+        try:
+            cursor = conn.cursor()
+            try:
+                generation = self.storage.dataset_generation(cursor)
+                if self._columns is None or generation != self._columns.generation:
+                    started = time.perf_counter()
+                    self._columns = TripColumns.load(self.storage, cursor, generation)
+                    print(f"Columnar engine loaded {self._columns.size:,} trips "
+                          f"in {time.perf_counter() - started:.2f}s")
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
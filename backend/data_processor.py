@@ -1,7 +1,15 @@
+import argparse
 import csv
-import mysql.connector
-from datetime import datetime
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import product
+from pathlib import Path
 import math
+from storage import create_storage
+from algorithms import TDigest, OutlierDetector
+import heatmap
+from zones import ZoneIndex
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -10,11 +18,49 @@ DB_CONFIG = {
     'database': 'kk_team_nyc_taxi_db'
 }
 
+# Storage backend: 'mysql' (DB_CONFIG) or 'sqlite' (embedded file at SQLITE_DB_PATH)
+STORAGE_BACKEND = 'mysql'
+SQLITE_DB_PATH = Path(__file__).resolve().parent.parent / 'data' / 'nyc_taxi.sqlite3'
 
 # Data processing parameters
 DATA_FILE_PATH = 'data/train.csv'  # Adjust path if needed
+# Taxi zone polygons (GeoJSON in longitude/latitude). Optional: without the file,
+# coordinates are only checked against the NYC bounding box and get no zone IDs.
+ZONES_FILE_PATH = 'data/taxi_zones.geojson'
 BATCH_SIZE = 1000
 
+# route_counts: coordinates are grouped the way RouteFrequencyCounter rounds them
+ROUTE_CELL_DECIMALS = 3
+ALL_VALUES = -1  # hour_of_day / is_weekend value of the rows that count every hour / day
+AGGREGATE_FETCH_SIZE = 50000
+
+# metric_sketches: t-digest per metric and (hour, day_of_week, vendor) slice. Sketches
+# live in memory during a load and are written every SKETCH_FLUSH_BATCHES batches
+# and at the end, so they lag the committed trips by up to SKETCH_FLUSH_BATCHES - 1
+# batches. sketch_watermark records the last metric_id they cover; after an
+# interrupted load it stays put until --rebuild-aggregates recomputes the sketches.
+SKETCH_METRICS = ('speed', 'distance', 'duration')
+SKETCH_FLUSH_BATCHES = 50
+
+# timeseries_buckets: pickup times are bucketed by TIMESERIES_BUCKET_MINUTES ('15m'),
+# then each coarser granularity is rolled up from the one before it:
+# (granularity, finer granularity, bucket start -> coarser bucket start)
+TIMESERIES_BUCKET_MINUTES = 15
+TIMESERIES_ROLLUPS = (
+    ('hour', '15m', lambda start: start.replace(minute=0)),
+    ('day', 'hour', lambda start: start.replace(hour=0)),
+    ('week', 'day', lambda start: start - timedelta(days=start.weekday())),
+)
+
+# Outlier flags: IQR bounds per metric over every loaded trip, written as a bitmask
+# to trip_metrics.outlier_flags OUTLIER_UPDATE_CHUNK metric_ids per UPDATE (each
+# chunk commits on its own, so the job never holds locks on the whole table).
+# outlier_bounds.flagged_at is NULL while the chunks run, so /api/outliers never
+# lists a mix of old and new flags.
+OUTLIER_FLAGS = {'speed': 1, 'distance': 2, 'duration': 4}
+OUTLIER_MULTIPLIER = 1.5
+OUTLIER_UPDATE_CHUNK = 20000
+
 # Data validation thresholds
 MIN_TRIP_DURATION = 60
 MAX_TRIP_DURATION = 86400
@@ -30,10 +76,16 @@ MAX_SPEED = 100
 MAX_TRIP_DISTANCE = 100
 
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, storage=None):
+        self.storage = storage or create_storage(STORAGE_BACKEND, DB_CONFIG, SQLITE_DB_PATH)
         self.conn = None
         self.cursor = None
         self.issues_log = []
+        self.zones = None             # ZoneIndex, set by load_zones()
+        self.sketches = None          # (metric, hour, day_of_week, vendor) -> TDigest, loaded on first use
+        self.dirty_sketches = set()
+        self.batches_since_flush = 0
+        self.sketches_complete = False  # the loaded sketches cover every trip (watermark may advance)
         self.stats = {
             'total': 0,
             'valid': 0,
@@ -42,12 +94,13 @@ class DataProcessor:
         }
         
     def connect_db(self):
-        """Connect to MySQL database"""
+        """Connect to the configured database"""
         try:
-            self.conn = mysql.connector.connect(**DB_CONFIG)
+            self.storage.initialize_schema()
+            self.conn = self.storage.connect()
             self.cursor = self.conn.cursor()
-            print("Connected to database successfully")
-        except mysql.connector.Error as err:
+            print(f"Connected to {self.storage.name} database successfully")
+        except self.storage.Error as err:
             print(f"Database connection failed: {err}")
             raise
         
@@ -107,6 +160,21 @@ class DataProcessor:
                              f'{dropoff_lon},{dropoff_lat}'))
                 return False, issues
             
+            # Check that both points fall in a taxi zone (not in the water or New Jersey);
+            # the zone IDs are kept on the row for compute_derived_features
+            if self.zones is not None:
+                row['pickup_zone_id'] = self.zones.zone_at(pickup_lon, pickup_lat)
+                if row['pickup_zone_id'] is None:
+                    issues.append(('invalid_coords', 'Pickup outside every taxi zone', 'pickup_coords',
+                                 f'{pickup_lon},{pickup_lat}'))
+                    return False, issues
+                
+                row['dropoff_zone_id'] = self.zones.zone_at(dropoff_lon, dropoff_lat)
+                if row['dropoff_zone_id'] is None:
+                    issues.append(('invalid_coords', 'Dropoff outside every taxi zone', 'dropoff_coords',
+                                 f'{dropoff_lon},{dropoff_lat}'))
+                    return False, issues
+            
             # Check for zero distance trips
             if abs(pickup_lon - dropoff_lon) < 0.0001 and abs(pickup_lat - dropoff_lat) < 0.0001:
                 issues.append(('zero_distance', 'Pickup and dropoff same location', 'coordinates', ''))
@@ -244,7 +312,9 @@ class DataProcessor:
             'time_period': time_period,
             'distance_category': distance_category,
             'duration_category': duration_category,
-            'speed_category': speed_category
+            'speed_category': speed_category,
+            'pickup_zone_id': row.get('pickup_zone_id'),
+            'dropoff_zone_id': row.get('dropoff_zone_id')
         }
     
     def log_issue(self, record_id, issue_type, description, field_name, value):
@@ -257,12 +327,33 @@ class DataProcessor:
             'value': str(value)[:100]  # Limit value length
         })
     
+    def load_zones(self):
+        """
+        Index the taxi zone polygons for validate_record and (re)fill the zones
+        table; without the zone file only the bounding box check applies
+        """
+        if not Path(ZONES_FILE_PATH).exists():
+            print(f"Zone file {ZONES_FILE_PATH} not found; checking coordinates against the NYC bounding box only")
+            return
+        
+        self.zones = ZoneIndex.load(ZONES_FILE_PATH)
+        print(f"Loaded {len(self.zones.zones)} zone polygons from {ZONES_FILE_PATH}")
+        try:
+            self.storage.replace_zones(self.cursor, self.zones.zone_rows())
+            self.conn.commit()
+        except self.storage.Error as err:
+            print(f"Error loading zones: {err}")
+            self.conn.rollback()
+            raise
+    
     def process_and_load_data(self):
         """Main function to process CSV and load into database"""
         print("\n")
         print("DATA PROCESSING PIPELINE")
         print("\n")
         
+        self.load_zones()
+        
         print("Reading data from:", DATA_FILE_PATH)
         
         valid_records = []
@@ -347,6 +438,9 @@ class DataProcessor:
             # Insert remaining records
             if valid_records:
                 self.insert_batch(valid_records)
+            self.flush_aggregates()
+            # Also bumps the dataset generation, so the server reloads the new trips
+            self.flag_outliers()
             
             # Insert issues log
             self.insert_issues_log()
@@ -365,6 +459,11 @@ class DataProcessor:
     def insert_batch(self, records):
         """Insert batch of records into database"""
         try:
+            # Sketches are read before this batch's trips exist, so a gap left by an
+            # interrupted load is told apart from the batch itself
+            if self.sketches is None:
+                self.load_sketches()
+            
             # Insert trips
             trip_data = []
             for rec in records:
@@ -383,13 +482,7 @@ class DataProcessor:
                     int(row['trip_duration'])
                 ))
             
-            self.cursor.executemany(
-                """INSERT INTO trips (trip_id, vendor_id, pickup_datetime, dropoff_datetime,
-                   passenger_count, pickup_longitude, pickup_latitude, dropoff_longitude, 
-                   dropoff_latitude, store_and_fwd_flag, trip_duration)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                trip_data
-            )
+            self.storage.insert_trips(self.cursor, trip_data)
             
             # Insert metrics
             metrics_data = []
@@ -409,24 +502,294 @@ class DataProcessor:
                     features['time_period'],
                     features['distance_category'],
                     features['duration_category'],
-                    features['speed_category']
+                    features['speed_category'],
+                    features['pickup_zone_id'],
+                    features['dropoff_zone_id']
                 ))
             
-            self.cursor.executemany(
-                """INSERT INTO trip_metrics (trip_id, trip_distance_miles, avg_speed_mph, 
-                   trip_efficiency, hour_of_day, day_of_week, day_of_month, month_of_year,
-                   is_weekend, time_period, distance_category, duration_category, speed_category)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                metrics_data
-            )
+            self.storage.insert_trip_metrics(self.cursor, metrics_data)
+            
+            # Route counts, time buckets and heatmap cells commit with the trips; the
+            # sketches (and their watermark) only every SKETCH_FLUSH_BATCHES batches
+            self.update_aggregates(records)
             
             self.conn.commit()
             
-        except mysql.connector.Error as err:
+        except self.storage.Error as err:
             print(f"Error inserting batch: {err}")
             self.conn.rollback()
             raise
     
+    @staticmethod
+    def route_cell(coordinate):
+        """Coordinate rounded to ROUTE_CELL_DECIMALS, as an integer number of cells"""
+        return round(round(coordinate, ROUTE_CELL_DECIMALS) * 10 ** ROUTE_CELL_DECIMALS)
+    
+    @staticmethod
+    def aggregate_row(rec):
+        """A valid record as a storage.stream_aggregate_trips row"""
+        row = rec['row']
+        features = rec['features']
+        return (
+            row['pickup_longitude'],
+            row['pickup_latitude'],
+            row['dropoff_longitude'],
+            row['dropoff_latitude'],
+            features['hour_of_day'],
+            features['is_weekend'],
+            features['day_of_week'],
+            int(row['vendor_id']),
+            features['avg_speed_mph'],
+            features['trip_distance_miles'],
+            int(row['trip_duration']),
+            row['pickup_datetime']
+        )
+    
+    def count_routes(self, trips, counts=None):
+        """
+        Count storage.stream_aggregate_trips rows into a Counter keyed like route_counts rows.
+        Each trip counts towards its own hour and day type and towards the
+        ALL_VALUES rows for either or both.
+        """
+        counts = Counter() if counts is None else counts
+        cell = self.route_cell
+        for pickup_lon, pickup_lat, dropoff_lon, dropoff_lat, hour, is_weekend, *_ in trips:
+            route = (cell(float(pickup_lon)), cell(float(pickup_lat)),
+                     cell(float(dropoff_lon)), cell(float(dropoff_lat)))
+            weekend = int(is_weekend)
+            counts[(hour, weekend) + route] += 1
+            counts[(hour, ALL_VALUES) + route] += 1
+            counts[(ALL_VALUES, weekend) + route] += 1
+            counts[(ALL_VALUES, ALL_VALUES) + route] += 1
+        return counts
+    
+    @staticmethod
+    def route_count_rows(counts):
+        """route_counts rows for storage.upsert_route_counts"""
+        return [key + (count,) for key, count in counts.items()]
+    
+    @staticmethod
+    def sketch_trips(trips, sketches):
+        """
+        Add the speed, distance and duration of storage.stream_aggregate_trips rows to the
+        digests of every slice they belong to (8 per metric, counting the ALL_VALUES
+        combinations). Returns the keys of the digests that changed.
+        """
+        pending = {}
+        for *_, hour, _, day, vendor, speed, distance, duration, _ in trips:
+            values = (float(speed), float(distance), float(duration))
+            for slice_key in product((hour, ALL_VALUES), (day, ALL_VALUES), (vendor, ALL_VALUES)):
+                for metric, value in zip(SKETCH_METRICS, values):
+                    pending.setdefault((metric,) + slice_key, []).append(value)
+        
+        for key, values in pending.items():
+            digest = sketches.get(key)
+            if digest is None:
+                digest = sketches[key] = TDigest()
+            digest.add_values(values)
+        return pending.keys()
+    
+    @staticmethod
+    def bucket_trips(trips, buckets=None):
+        """
+        Add storage.stream_aggregate_trips rows to 15-minute pickup buckets:
+        bucket start -> [trip_count, total_distance, total_duration, total_speed]
+        """
+        buckets = {} if buckets is None else buckets
+        for *_, speed, distance, duration, pickup in trips:
+            pickup = datetime.fromisoformat(str(pickup))
+            start = pickup.replace(minute=pickup.minute - pickup.minute % TIMESERIES_BUCKET_MINUTES,
+                                   second=0, microsecond=0)
+            totals = buckets.get(start)
+            if totals is None:
+                totals = buckets[start] = [0, 0.0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += float(distance)
+            totals[2] += int(duration)
+            totals[3] += float(speed)
+        return buckets
+    
+    @staticmethod
+    def timeseries_rows(buckets):
+        """
+        timeseries_buckets rows for 15-minute buckets plus every coarser
+        granularity, each rolled up from the previous one
+        """
+        levels = {'15m': buckets}
+        for granularity, finer, truncate in TIMESERIES_ROLLUPS:
+            level = levels[granularity] = {}
+            for start, totals in levels[finer].items():
+                rolled = level.get(truncate(start))
+                if rolled is None:
+                    level[truncate(start)] = list(totals)
+                else:
+                    for position, value in enumerate(totals):
+                        rolled[position] += value
+        return [(granularity, start.strftime('%Y-%m-%d %H:%M:%S'), *totals)
+                for granularity, level in levels.items() for start, totals in level.items()]
+    
+    def load_sketches(self):
+        """Read the stored sketches so new batches are merged into them"""
+        self.sketches = {tuple(row[:4]): TDigest.from_bytes(row[4])
+                         for row in self.storage.metric_sketch_rows(self.cursor)}
+        self.dirty_sketches = set()
+        
+        # Trips past the watermark were committed but never flushed to the sketches
+        watermark, _ = self.storage.sketch_watermark(self.cursor)
+        self.sketches_complete = self.storage.last_metric_id(self.cursor) <= watermark
+        if not self.sketches_complete:
+            print("Warning: metric_sketches is missing trips from an interrupted load; "
+                  "run with --rebuild-aggregates to recompute them")
+    
+    def write_sketches(self, keys=None, last_metric_id=None):
+        """
+        Upsert the changed sketches (or the given keys) and, when they cover every
+        trip, move the watermark to last_metric_id (default: the last trip in
+        this transaction); caller commits
+        """
+        keys = self.dirty_sketches if keys is None else keys
+        rows = [key + (self.sketches[key].to_bytes(),) for key in keys]
+        for start in range(0, len(rows), BATCH_SIZE):
+            self.storage.upsert_metric_sketches(self.cursor, rows[start:start + BATCH_SIZE])
+        if self.sketches_complete:
+            if last_metric_id is None:
+                last_metric_id = self.storage.last_metric_id(self.cursor)
+            self.storage.upsert_sketch_watermark(self.cursor, last_metric_id)
+        self.dirty_sketches = set()
+        self.batches_since_flush = 0
+    
+    def update_aggregates(self, records):
+        """
+        Add a batch of valid records to route_counts, timeseries_buckets,
+        heatmap_cells and the metric sketches (caller commits)
+        """
+        trips = [self.aggregate_row(rec) for rec in records]
+        self.storage.upsert_route_counts(self.cursor, self.route_count_rows(self.count_routes(trips)))
+        self.storage.upsert_timeseries_buckets(self.cursor, self.timeseries_rows(self.bucket_trips(trips)))
+        self.storage.upsert_heatmap_cells(self.cursor, heatmap.pyramid_rows(heatmap.count_cells(trips)))
+        
+        self.dirty_sketches.update(self.sketch_trips(trips, self.sketches))
+        self.batches_since_flush += 1
+        if self.batches_since_flush >= SKETCH_FLUSH_BATCHES:
+            self.write_sketches()
+    
+    def flush_aggregates(self):
+        """Write sketches still held in memory at the end of a load"""
+        if not self.dirty_sketches:
+            return
+        try:
+            self.write_sketches()
+            self.conn.commit()
+        except self.storage.Error as err:
+            print(f"Error writing metric sketches: {err}")
+            self.conn.rollback()
+            raise
+    
+    def rebuild_aggregates(self):
+        """
+        Recompute route_counts, timeseries_buckets, heatmap_cells and
+        metric_sketches from the trips already in the database
+        """
+        print("Rebuilding the pre-aggregated tables from loaded trips...")
+        try:
+            # Watermark of the rebuilt sketches: the last trip before the scan
+            last_metric_id = self.storage.last_metric_id(self.cursor)
+            self.storage.stream_aggregate_trips(self.cursor)
+            counts = Counter()
+            buckets = {}
+            cells = {}
+            sketches = {}
+            trips = 0
+            while True:
+                rows = self.cursor.fetchmany(AGGREGATE_FETCH_SIZE)
+                if not rows:
+                    break
+                self.count_routes(rows, counts)
+                self.bucket_trips(rows, buckets)
+                heatmap.count_cells(rows, cells)
+                self.sketch_trips(rows, sketches)
+                trips += len(rows)
+            rows = self.route_count_rows(counts)
+            bucket_rows = self.timeseries_rows(buckets)
+            cell_rows = heatmap.pyramid_rows(cells)
+            
+            self.storage.clear_aggregates(self.cursor)
+            for start in range(0, len(rows), AGGREGATE_FETCH_SIZE):
+                self.storage.upsert_route_counts(self.cursor, rows[start:start + AGGREGATE_FETCH_SIZE])
+            for start in range(0, len(bucket_rows), AGGREGATE_FETCH_SIZE):
+                self.storage.upsert_timeseries_buckets(self.cursor, bucket_rows[start:start + AGGREGATE_FETCH_SIZE])
+            for start in range(0, len(cell_rows), AGGREGATE_FETCH_SIZE):
+                self.storage.upsert_heatmap_cells(self.cursor, cell_rows[start:start + AGGREGATE_FETCH_SIZE])
+            self.sketches = sketches
+            self.sketches_complete = True
+            self.write_sketches(list(sketches), last_metric_id)
+            self.storage.bump_dataset_generation(self.cursor)
+            self.conn.commit()
+            print(f"Aggregated {trips:,} trips into {len(rows):,} route_counts rows, "
+                  f"{len(bucket_rows):,} time buckets, {len(cell_rows):,} heatmap cells "
+                  f"and {len(sketches):,} metric sketches")
+            
+        except self.storage.Error as err:
+            print(f"Error rebuilding aggregates: {err}")
+            self.conn.rollback()
+            raise
+    
+    def flag_outliers(self):
+        """
+        Compute IQR bounds per metric over every loaded trip, store them, then
+        rewrite trip_metrics.outlier_flags in chunked UPDATEs; the last chunk
+        sets outlier_bounds.flagged_at in its transaction
+        """
+        print("Flagging IQR outliers in trip_metrics...")
+        try:
+            self.storage.stream_outlier_values(self.cursor)
+            values = {metric: array('d') for metric in OUTLIER_FLAGS}
+            while True:
+                rows = self.cursor.fetchmany(AGGREGATE_FETCH_SIZE)
+                if not rows:
+                    break
+                for metric, column in zip(OUTLIER_FLAGS, zip(*rows)):
+                    values[metric].extend([float(value) for value in column])
+            
+            trip_count = len(values['speed'])
+            bounds = {}
+            for metric, metric_values in values.items():
+                info = OutlierDetector.detect_outliers(metric_values, OUTLIER_MULTIPLIER, sample_size=0)
+                if info['lower_bound'] is None:
+                    print(f"Too few trips ({trip_count}) to compute outlier bounds; clearing outlier flags")
+                    self.storage.clear_outlier_flags(self.cursor)
+                    self.storage.bump_dataset_generation(self.cursor)
+                    self.conn.commit()
+                    return
+                bounds[metric] = (info['q1'], info['q3'], info['lower_bound'], info['upper_bound'])
+            del values
+            
+            # New bounds first, marked as not yet applied (flagged_at NULL)
+            self.storage.replace_outlier_bounds(
+                self.cursor, [(metric,) + bounds[metric] + (trip_count,) for metric in OUTLIER_FLAGS]
+            )
+            self.conn.commit()
+            
+            first_id, last_id = self.storage.metric_id_range(self.cursor)
+            for start in range(first_id, last_id + 1, OUTLIER_UPDATE_CHUNK):
+                self.storage.update_outlier_flags(
+                    self.cursor, OUTLIER_FLAGS, {metric: bounds[metric][2:] for metric in OUTLIER_FLAGS},
+                    start, start + OUTLIER_UPDATE_CHUNK
+                )
+                if start + OUTLIER_UPDATE_CHUNK > last_id:
+                    self.storage.mark_outlier_flags_applied(self.cursor)
+                    self.storage.bump_dataset_generation(self.cursor)
+                self.conn.commit()
+            
+            # Every non-zero combination of OUTLIER_FLAGS bits
+            flagged = self.storage.count_outliers(self.cursor, range(1, 1 << len(OUTLIER_FLAGS)))
+            print(f"Flagged {flagged:,} of {trip_count:,} trips as outliers in at least one metric")
+            
+        except self.storage.Error as err:
+            print(f"Error flagging outliers: {err}")
+            self.conn.rollback()
+            raise
+    
     def insert_issues_log(self):
         """Insert data quality issues into log table"""
         if not self.issues_log:
@@ -441,17 +804,12 @@ class DataProcessor:
                 issue['value']
             ) for issue in self.issues_log]
             
-            self.cursor.executemany(
-                """INSERT INTO data_quality_log (record_id, issue_type, issue_description, 
-                   field_name, original_value)
-                   VALUES (%s, %s, %s, %s, %s)""",
-                log_data
-            )
+            self.storage.insert_quality_issues(self.cursor, log_data)
             
             self.conn.commit()
             print(f"Logged {len(self.issues_log)} data quality issues")
             
-        except mysql.connector.Error as err:
+        except self.storage.Error as err:
             print(f"Error logging issues: {err}")
     
     def print_summary(self):
@@ -484,12 +842,26 @@ class DataProcessor:
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description="Clean the trip CSV and load it into the database")
+    parser.add_argument('--rebuild-aggregates', action='store_true',
+                        help="only recompute the pre-aggregated tables from the trips already loaded")
+    parser.add_argument('--flag-outliers', action='store_true',
+                        help="only recompute outlier_bounds and trip_metrics.outlier_flags")
+    args = parser.parse_args()
+    
     processor = DataProcessor()
     
     try:
         # Connect to database
         processor.connect_db()
         
+        if args.rebuild_aggregates or args.flag_outliers:
+            if args.rebuild_aggregates:
+                processor.rebuild_aggregates()
+            if args.flag_outliers:
+                processor.flag_outliers()
+            return 0
+        
         # Process and load data
         processor.process_and_load_data()
         
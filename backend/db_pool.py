@@ -0,0 +1,123 @@
+"""
+Thread-safe database connection pool
+
+Connections are created lazily up to a fixed size and handed out wrapped in a
+PooledConnection, whose close() returns the connection to the pool instead of
+disconnecting. Callers therefore keep the usual conn.close() pattern.
+"""
+
+import queue
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the wait timeout"""
+
+
+class ConnectionPool:
+    """Fixed-size pool of DB-API connections created by a connect() callable"""
+
+    def __init__(self, connect, size, timeout=None, recycle=300):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle  # seconds a connection may sit idle before it is replaced
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout=None):
+        """Borrow a connection, waiting up to timeout seconds for a free slot"""
+        wait = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=wait):
+            raise PoolTimeout(f"No database connection available after {wait}s")
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+
+                # The server may have dropped connections that sat idle for too long
+                if self.recycle is not None and time.monotonic() - idle_since > self.recycle:
+                    self._close_quietly(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+
+        return PooledConnection(self, conn)
+
+    def _release(self, conn, reusable=True):
+        """Return a connection to the pool, or drop it if it is no longer usable"""
+        try:
+            if reusable:
+                # End any open transaction so the next borrower gets a fresh snapshot
+                conn.rollback()
+                self._idle.put((conn, time.monotonic()))
+            else:
+                self._close_quietly(conn)
+        except Exception:
+            self._close_quietly(conn)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Disconnect every idle connection"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close_quietly(conn)
+
+
+class PooledConnection:
+    """Proxy around a pooled connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise AttributeError(f"Connection already returned to the pool ({name})")
+        return getattr(conn, name)
+
+    @property
+    def raw_connection(self):
+        return self._conn
+
+    def close(self):
+        """Return the connection to the pool"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn)
+
+    def discard(self):
+        """Disconnect instead of returning to the pool (e.g. after a protocol error)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn, reusable=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Safety net for handlers that exit early without closing
+        if self.__dict__.get('_conn') is not None:
+            self.close()
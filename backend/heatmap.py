@@ -0,0 +1,88 @@
+"""
+Pickup/dropoff density pyramid for /api/heatmap
+
+Cells are Web Mercator map tiles (the x/y/zoom scheme of slippy-map tile
+servers), so a cell at zoom z splits into exactly four cells at zoom z + 1 and a
+map client can place them without extra metadata. data_processor.py counts each
+trip's pickup and dropoff into HEATMAP_MAX_ZOOM cells, per hour of day and for
+all hours, then rolls every zoom up from the next finer one by halving the tile
+coordinates. The rows go to the heatmap_cells table with summing upserts, so a
+viewport query reads at most the cells it covers, however many trips there are.
+"""
+
+import math
+
+
+HEATMAP_MIN_ZOOM = 10  # the whole city in a handful of cells
+HEATMAP_MAX_ZOOM = 17  # ~230 m cells at NYC's latitude
+MAX_MERCATOR_LATITUDE = 85.05112878
+ALL_VALUES = -1  # hour_of_day of the cells that count every hour
+
+
+def tile_x(longitude, zoom):
+    """Tile column of a longitude at zoom"""
+    tiles = 1 << zoom
+    return min(max(int((longitude + 180.0) / 360.0 * tiles), 0), tiles - 1)
+
+
+def tile_y(latitude, zoom):
+    """Tile row of a latitude at zoom (rows count down from the north)"""
+    tiles = 1 << zoom
+    latitude = math.radians(min(max(latitude, -MAX_MERCATOR_LATITUDE), MAX_MERCATOR_LATITUDE))
+    return min(max(int((1.0 - math.asinh(math.tan(latitude)) / math.pi) / 2.0 * tiles), 0), tiles - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """(west, south, east, north) of a tile in degrees"""
+    tiles = 1 << zoom
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / tiles))))
+
+    return (x / tiles * 360.0 - 180.0, latitude(y + 1), (x + 1) / tiles * 360.0 - 180.0, latitude(y))
+
+
+def count_cells(trips, cells=None):
+    """
+    Count the pickups and dropoffs of rows starting (pickup_longitude,
+    pickup_latitude, dropoff_longitude, dropoff_latitude, hour_of_day, ...) into
+    HEATMAP_MAX_ZOOM cells: (hour_of_day, x, y) -> [pickup_count, dropoff_count].
+    Each trip also counts towards the ALL_VALUES hour.
+    """
+    cells = {} if cells is None else cells
+    for pickup_lon, pickup_lat, dropoff_lon, dropoff_lat, hour, *_ in trips:
+        pickup = (tile_x(float(pickup_lon), HEATMAP_MAX_ZOOM), tile_y(float(pickup_lat), HEATMAP_MAX_ZOOM))
+        dropoff = (tile_x(float(dropoff_lon), HEATMAP_MAX_ZOOM), tile_y(float(dropoff_lat), HEATMAP_MAX_ZOOM))
+        for hour_key in (hour, ALL_VALUES):
+            for position, cell in enumerate((pickup, dropoff)):
+                key = (hour_key,) + cell
+                counts = cells.get(key)
+                if counts is None:
+                    counts = cells[key] = [0, 0]
+                counts[position] += 1
+    return cells
+
+
+def pyramid_rows(cells):
+    """
+    heatmap_cells rows (zoom, hour_of_day, cell_x, cell_y, pickup_count,
+    dropoff_count) for count_cells() output and every coarser zoom down to
+    HEATMAP_MIN_ZOOM, each rolled up from the one above it
+    """
+    rows = []
+    level = cells
+    for zoom in range(HEATMAP_MAX_ZOOM, HEATMAP_MIN_ZOOM - 1, -1):
+        rows.extend((zoom, hour, x, y, pickups, dropoffs) for (hour, x, y), (pickups, dropoffs) in level.items())
+        if zoom == HEATMAP_MIN_ZOOM:
+            break
+        parents = {}
+        for (hour, x, y), (pickups, dropoffs) in level.items():
+            key = (hour, x >> 1, y >> 1)
+            counts = parents.get(key)
+            if counts is None:
+                parents[key] = [pickups, dropoffs]
+            else:
+                counts[0] += pickups
+                counts[1] += dropoffs
+        level = parents
+    return rows
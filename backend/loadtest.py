@@ -0,0 +1,458 @@
+"""
+HTTP load test and latency regression check for the API server
+
+Replays a weighted mix of the requests the dashboard (frontend/app.js) makes:
+the batched page load, the separate-request fallback, filtered trip queries with
+the same parameter combinations the filter form produces, and keyset paging.
+Reports throughput and p50/p95/p99 per endpoint, optionally compares the run
+against a stored baseline and exits non-zero when a threshold is exceeded.
+
+Against a running server (MySQL):
+    python backend/loadtest.py --url http://localhost:8000 --save-baseline loadtest_baseline.json
+    python backend/loadtest.py --url http://localhost:8000 --baseline loadtest_baseline.json
+
+Fully local, with server.py running in-process on a synthetic SQLite dataset:
+    python backend/loadtest.py --embedded --duration 20 --concurrency 8
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+
+from storage import SQLiteStorage
+
+
+DEFAULT_URL = 'http://localhost:8000'
+DEFAULT_DURATION = 30  # seconds of measured load
+DEFAULT_WARMUP = 3  # seconds of unmeasured load first
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_REGRESSION = 0.20  # p95/p99 may grow (throughput shrink) by this fraction
+DEFAULT_MIN_DELTA_MS = 2.0  # latency changes smaller than this never count as regressions
+DEFAULT_MAX_ERROR_RATE = 0.01
+REQUEST_TIMEOUT = 60
+
+# Embedded stand-in backend
+EMBEDDED_TRIPS = 20000
+EMBEDDED_SEED = 42
+
+# Values offered by the filter form in frontend/index.html
+PAGE_SIZE = 50
+SORT_FIELDS = ('pickup_datetime', 'distance', 'duration', 'speed')
+SORT_ORDERS = ('desc', 'asc')
+
+
+class LoadClient:
+    """One simulated browser tab: a keep-alive connection plus latency recording"""
+
+    def __init__(self, url, results, rng):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.results = results
+        self.rng = rng
+        self.recording = False
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def request(self, label, method, path, params=None, body=None):
+        """Send one request and record its latency under label; returns parsed JSON or None"""
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+        headers = {'Accept-Encoding': 'gzip'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        start = time.perf_counter()
+        try:
+            conn = self._connection()
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.close()
+            status, data = None, b''
+        elapsed = time.perf_counter() - start
+
+        if self.recording:
+            self.results.record(label, elapsed, status is not None and status < 400)
+        if status != 200:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+
+# Request mix ----------------------------------------------------------------
+
+def random_filters(rng):
+    """A filter set as built by applyFilters() in app.js"""
+    filters = {}
+    if rng.random() < 0.3:
+        filters['vendor_id'] = rng.choice(('1', '2'))
+    if rng.random() < 0.3:
+        filters['hour'] = str(rng.randrange(24))
+    if rng.random() < 0.2:
+        filters['day_of_week'] = str(rng.randrange(7))
+    if rng.random() < 0.2:
+        filters['is_weekend'] = rng.choice(('true', 'false'))
+    if rng.random() < 0.25:
+        min_distance = round(rng.uniform(0, 5), 1)
+        filters['min_distance'] = str(min_distance)
+        if rng.random() < 0.5:
+            filters['max_distance'] = str(round(min_distance + rng.uniform(1, 20), 1))
+    if rng.random() < 0.15:
+        filters['min_duration'] = str(rng.choice((60, 300, 600)))
+    if rng.random() < 0.15:
+        filters['max_duration'] = str(rng.choice((900, 1800, 3600)))
+    # The sort selects always have a value
+    filters['sort_by'] = rng.choice(SORT_FIELDS)
+    filters['order'] = rng.choice(SORT_ORDERS)
+    return filters
+
+
+def page_through(client, filters, pages):
+    """Load the first page of trips, then follow next_cursor like changePage(1)"""
+    params = dict(filters, limit=PAGE_SIZE)
+    data = client.request('GET /api/trips', 'GET', '/api/trips', params)
+    for _ in range(pages):
+        if not data or not data.get('has_more') or not data.get('next_cursor'):
+            return
+        params = dict(filters, limit=PAGE_SIZE, cursor=data['next_cursor'], include_total='false')
+        data = client.request('GET /api/trips (next page)', 'GET', '/api/trips', params)
+
+
+def scenario_page_load(client):
+    """initializeApp(): everything in one batch request"""
+    client.request('POST /api/batch', 'POST', '/api/batch', body={'requests': [
+        {'id': 'dashboard', 'path': '/api/dashboard'},
+        {'id': 'trips', 'path': '/api/trips', 'params': {'limit': PAGE_SIZE}},
+        {'id': 'topRoutes', 'path': '/api/top-routes', 'params': {'limit': 10}},
+    ]})
+
+
+def scenario_page_load_fallback(client):
+    """initializeApp() when the batch request fails: one request per section"""
+    client.request('GET /api/statistics', 'GET', '/api/statistics')
+    client.request('GET /api/insights', 'GET', '/api/insights')
+    client.request('GET /api/trips', 'GET', '/api/trips', {'limit': PAGE_SIZE})
+    client.request('GET /api/top-routes', 'GET', '/api/top-routes', {'limit': 10})
+
+
+def scenario_apply_filters(client):
+    """applyFilters(), then sometimes a few clicks on Next"""
+    pages = client.rng.choice((0, 0, 1, 2, 3))
+    page_through(client, random_filters(client.rng), pages)
+
+
+def scenario_reset_filters(client):
+    """resetFilters(): unfiltered first page"""
+    page_through(client, {}, client.rng.choice((0, 1)))
+
+
+# (scenario, relative weight)
+SCENARIOS = (
+    (scenario_page_load, 3),
+    (scenario_page_load_fallback, 1),
+    (scenario_apply_filters, 5),
+    (scenario_reset_filters, 1),
+)
+
+
+# Results --------------------------------------------------------------------
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadResults:
+    """Latencies and error counts per endpoint label, shared by all workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, label, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, elapsed, concurrency):
+        endpoints = {}
+        total = errors = 0
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            count = len(values)
+            total += count
+            errors += self.errors.get(label, 0)
+            endpoints[label] = {
+                'requests': count,
+                'errors': self.errors.get(label, 0),
+                'throughput_rps': round(count / elapsed, 2),
+                'mean_ms': round(sum(values) / count * 1000, 2),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+            }
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'duration_s': round(elapsed, 2),
+            'concurrency': concurrency,
+            'requests': total,
+            'errors': errors,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+def run_load(url, duration, concurrency, warmup=0, seed=None):
+    """Run the scenario mix from concurrency workers; returns the summary dict"""
+    results = LoadResults()
+    scenarios = [scenario for scenario, _ in SCENARIOS]
+    weights = [weight for _, weight in SCENARIOS]
+    started = threading.Event()
+    stop = threading.Event()
+
+    def worker(index):
+        client = LoadClient(url, results, random.Random(None if seed is None else seed + index))
+        try:
+            while not stop.is_set():
+                client.recording = started.is_set()
+                client.rng.choices(scenarios, weights)[0](client)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(warmup)
+    started.set()
+    measure_start = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(REQUEST_TIMEOUT)
+    # Scenarios in flight when the clock stopped still count, so use the real elapsed time
+    elapsed = time.perf_counter() - measure_start
+
+    return results.summary(elapsed, concurrency)
+
+
+def print_summary(summary):
+    print("=" * 92)
+    print(f"LOAD TEST: {summary['requests']} requests in {summary['duration_s']}s "
+          f"at concurrency {summary['concurrency']} "
+          f"({summary['throughput_rps']} req/s, {summary['errors']} errors)")
+    print("=" * 92)
+    print(f"{'endpoint':<32}{'reqs':>7}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>9}")
+    for label, stats in summary['endpoints'].items():
+        print(f"{label:<32}{stats['requests']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>9}")
+
+
+def compare_to_baseline(summary, baseline, max_regression=DEFAULT_MAX_REGRESSION,
+                        min_delta_ms=DEFAULT_MIN_DELTA_MS, max_error_rate=DEFAULT_MAX_ERROR_RATE):
+    """Return a list of human-readable threshold violations (empty = pass)"""
+    failures = []
+
+    if summary['requests']:
+        error_rate = summary['errors'] / summary['requests']
+        if error_rate > max_error_rate:
+            failures.append(f"error rate {error_rate:.2%} exceeds {max_error_rate:.2%}")
+
+    floor = baseline['throughput_rps'] * (1 - max_regression)
+    if summary['throughput_rps'] < floor:
+        failures.append(f"throughput {summary['throughput_rps']} req/s below "
+                        f"{floor:.2f} (baseline {baseline['throughput_rps']})")
+
+    for label, before in baseline['endpoints'].items():
+        after = summary['endpoints'].get(label)
+        if after is None:
+            continue
+        for metric in ('p95_ms', 'p99_ms'):
+            limit = max(before[metric] * (1 + max_regression), before[metric] + min_delta_ms)
+            if after[metric] > limit:
+                failures.append(f"{label} {metric} {after[metric]} > {limit:.2f} (baseline {before[metric]})")
+
+    return failures
+
+
+# Embedded stand-in backend --------------------------------------------------
+
+def build_standin_database(storage, trips=EMBEDDED_TRIPS, seed=EMBEDDED_SEED):
+    """Fill a SQLite storage with synthetic trips derived the same way DataProcessor does"""
+    from data_processor import DataProcessor
+
+    processor = DataProcessor(storage)
+    rng = random.Random(seed)
+    # Trips start and end near a few hotspots so popular routes repeat
+    hotspots = [(rng.uniform(-74.02, -73.93), rng.uniform(40.70, 40.80)) for _ in range(40)]
+    start = datetime(2016, 1, 1)
+
+    trip_rows = []
+    metric_rows = []
+    for index in range(trips):
+        pickup = rng.choice(hotspots)
+        dropoff = rng.choice(hotspots)
+        pickup = (round(pickup[0] + rng.gauss(0, 0.0005), 6), round(pickup[1] + rng.gauss(0, 0.0005), 6))
+        dropoff = (round(dropoff[0] + rng.gauss(0, 0.0005), 6), round(dropoff[1] + rng.gauss(0, 0.0005), 6))
+        distance = processor.haversine_distance(pickup[0], pickup[1], dropoff[0], dropoff[1])
+        duration = max(60, int(distance / rng.uniform(5, 30) * 3600) + rng.randrange(60, 300))
+        pickup_dt = start + timedelta(seconds=rng.randrange(180 * 86400))
+        row = {
+            'id': f"id{index:07d}",
+            'pickup_datetime': pickup_dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'trip_duration': duration,
+        }
+        features = processor.compute_derived_features(row, distance)
+
+        trip_rows.append((
+            row['id'], rng.choice((1, 2)), row['pickup_datetime'],
+            (pickup_dt + timedelta(seconds=duration)).strftime('%Y-%m-%d %H:%M:%S'),
+            rng.randint(1, 6), pickup[0], pickup[1], dropoff[0], dropoff[1], 'N', duration,
+        ))
+        metric_rows.append((
+            row['id'], features['trip_distance_miles'], features['avg_speed_mph'],
+            features['trip_efficiency'], features['hour_of_day'], features['day_of_week'],
+            features['day_of_month'], features['month_of_year'], features['is_weekend'],
+            features['time_period'], features['distance_category'],
+            features['duration_category'], features['speed_category'],
+            features['pickup_zone_id'], features['dropoff_zone_id'],
+        ))
+
+    storage.initialize_schema()
+    conn = storage.connect()
+    try:
+        cursor = conn.cursor()
+        storage.insert_trips(cursor, trip_rows)
+        storage.insert_trip_metrics(cursor, metric_rows)
+        conn.commit()
+        # Pre-aggregated tables and outlier flags, computed the same way as after a real load
+        processor.conn, processor.cursor = conn, cursor
+        processor.rebuild_aggregates()
+        processor.flag_outliers()
+    finally:
+        conn.close()
+
+
+class EmbeddedServer:
+    """Runs server.py in-process on a free port, backed by a synthetic SQLite dataset"""
+
+    def __init__(self, trips=EMBEDDED_TRIPS, columnar=False):
+        self.trips = trips
+        self.columnar = columnar
+        self.url = None
+        self._tmpdir = None
+        self._httpd = None
+        self._saved_storage = None
+
+    def __enter__(self):
+        import server
+
+        self._tmpdir = tempfile.TemporaryDirectory(prefix='taxi-loadtest-')
+        storage = SQLiteStorage(os.path.join(self._tmpdir.name, 'trips.sqlite3'))
+        print(f"Building stand-in dataset with {self.trips} trips...")
+        build_standin_database(storage, self.trips)
+
+        self._saved_storage = server.storage
+        server.configure_storage(storage)
+        if self.columnar:
+            server.enable_columnar_engine()
+
+        self._httpd = server.TaxiHTTPServer(('127.0.0.1', 0), server.TaxiAPIHandler)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        import server
+
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        server.configure_storage(self._saved_storage)
+        self._tmpdir.cleanup()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the taxi API and check for latency regressions")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default=DEFAULT_URL, help="server to test (default %(default)s)")
+    target.add_argument('--embedded', action='store_true',
+                        help="run server.py in-process on a synthetic SQLite dataset")
+    parser.add_argument('--trips', type=int, default=EMBEDDED_TRIPS, help="stand-in dataset size")
+    parser.add_argument('--columnar', action='store_true',
+                        help="with --embedded, serve aggregates from the NumPy columnar engine")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION)
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--seed', type=int, default=None, help="make the request mix reproducible")
+    parser.add_argument('--output', help="write this run's results as JSON")
+    parser.add_argument('--save-baseline', metavar='FILE', help="store this run as the baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="fail if this run regressed against FILE")
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION)
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS)
+    parser.add_argument('--max-error-rate', type=float, default=DEFAULT_MAX_ERROR_RATE)
+    args = parser.parse_args(argv)
+
+    if args.embedded:
+        with EmbeddedServer(args.trips, args.columnar) as embedded:
+            summary = run_load(embedded.url, args.duration, args.concurrency, args.warmup, args.seed)
+        summary['target'] = 'embedded'
+    else:
+        summary = run_load(args.url, args.duration, args.concurrency, args.warmup, args.seed)
+        summary['target'] = args.url
+
+    print_summary(summary)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare_to_baseline(summary, baseline, args.max_regression,
+                                       args.min_delta_ms, args.max_error_rate)
+        if failures:
+            print(f"\nREGRESSION against {args.baseline}:")
+            for failure in failures:
+                print(f"  - {failure}")
+            return 1
+        print(f"\nNo regression against {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
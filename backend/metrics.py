@@ -0,0 +1,274 @@
+"""
+Request instrumentation and Prometheus-style metrics
+
+Each request gets a RequestTimer that accumulates time per phase (waiting for a
+connection, executing SQL, Python post-processing, serialization, socket write)
+plus rows fetched and the individual SQL statements run. The timer is reported
+back to the client as a Server-Timing header, and when the request finishes it is
+folded into the process-wide MetricsRegistry, which renders the Prometheus text format.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Phases a request's time is split into
+PHASES = ('db_wait', 'db_execute', 'processing', 'serialization', 'socket_write')
+
+# Server-Timing metric name for each phase (socket_write happens after the headers)
+SERVER_TIMING_NAMES = (('db_wait', 'connect'), ('processing', 'algorithm'), ('serialization', 'encode'))
+SERVER_TIMING_DESC_LENGTH = 60  # characters of SQL shown per statement
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestTimer:
+    """Thread-safe accumulator of phase timings for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.rows_fetched = 0
+        self.statements = []  # one dict per executed statement: sql, params, seconds, rows
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows_fetched += count
+
+    def add_statement(self, sql, params):
+        """Start recording a statement; returns the entry its fetches are charged to"""
+        statement = {'sql': sql, 'params': params, 'seconds': 0.0, 'rows': 0}
+        with self._lock:
+            self.statements.append(statement)
+        return statement
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of code into the named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+
+class TimedCursor:
+    """Cursor proxy that charges execute/fetch time to db_execute and counts rows"""
+
+    def __init__(self, cursor, timer):
+        self._cursor = cursor
+        self._timer = timer
+        self._statement = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._timer.add('db_execute', elapsed)
+            if self._statement is not None:
+                self._statement['seconds'] += elapsed
+
+    def _count_rows(self, count):
+        self._timer.add_rows(count)
+        if self._statement is not None:
+            self._statement['rows'] += count
+
+    def execute(self, operation, params=None):
+        self._statement = self._timer.add_statement(operation, params)
+        return self._timed(self._cursor.execute, operation, params)
+
+    def executemany(self, operation, seq_params):
+        self._statement = self._timer.add_statement(operation, None)
+        return self._timed(self._cursor.executemany, operation, seq_params)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._count_rows(1)
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._timed(self._cursor.fetchmany, size)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._count_rows(len(rows))
+        return rows
+
+    def close(self):
+        return self._cursor.close()
+
+
+class TimedConnection:
+    """Connection proxy whose cursors report into a RequestTimer"""
+
+    def __init__(self, conn, timer):
+        self._conn = conn
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._timer)
+
+    def close(self):
+        return self._conn.close()
+
+
+def acquire_timed(pool, timer, timeout=None):
+    """Borrow a pooled connection, charging the wait to db_wait"""
+    if timer is None:
+        return pool.acquire(timeout=timeout)
+    with timer.phase('db_wait'):
+        conn = pool.acquire(timeout=timeout)
+    return TimedConnection(conn, timer)
+
+
+def _timing_desc(text):
+    # Server-Timing desc is a quoted-string: collapse whitespace, escape quotes
+    text = ' '.join(text.split())
+    if len(text) > SERVER_TIMING_DESC_LENGTH:
+        text = text[:SERVER_TIMING_DESC_LENGTH - 3] + '...'
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def server_timing(timer):
+    """Render a RequestTimer as a Server-Timing header value (durations in ms)"""
+    entries = []
+    for phase, name in SERVER_TIMING_NAMES:
+        if timer.phases.get(phase):
+            entries.append(f"{name};dur={timer.phases[phase] * 1000:.2f}")
+    for index, statement in enumerate(list(timer.statements), start=1):
+        entries.append(
+            f"sql-{index};dur={statement['seconds'] * 1000:.2f};desc={_timing_desc(str(statement['sql']))}"
+        )
+    entries.append(f"total;dur={(time.perf_counter() - timer.started) * 1000:.2f}")
+    return ', '.join(entries)
+
+
+class Histogram:
+    """Cumulative-bucket histogram matching the Prometheus data model"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _labels(**labels):
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class MetricsRegistry:
+    """Process-wide request metrics, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}          # (route, status) -> count
+        self.latency = {}           # (route, status) -> Histogram
+        self.phase_latency = {}     # (route, phase) -> Histogram
+        self.rows_fetched = {}      # route -> rows
+        self.bytes_sent = {}        # route -> bytes
+        self.started_at = time.time()
+
+    def observe_request(self, route, status, duration, timer, bytes_sent):
+        with self._lock:
+            key = (route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(key, Histogram()).observe(duration)
+
+            for phase, seconds in timer.phases.items():
+                self.phase_latency.setdefault((route, phase), Histogram()).observe(seconds)
+
+            self.rows_fetched[route] = self.rows_fetched.get(route, 0) + timer.rows_fetched
+            self.bytes_sent[route] = self.bytes_sent.get(route, 0) + bytes_sent
+
+    @staticmethod
+    def _render_histogram(lines, name, key_labels, histogram):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**key_labels, le=repr(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**key_labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(**key_labels)} {histogram.total!r}")
+        lines.append(f"{name}_count{_labels(**key_labels)} {histogram.count}")
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP taxi_api_requests_total Requests handled, by route and status code.',
+                '# TYPE taxi_api_requests_total counter',
+            ]
+            for (route, status), count in sorted(self.requests.items()):
+                lines.append(f"taxi_api_requests_total{_labels(route=route, status=status)} {count}")
+
+            lines += [
+                '# HELP taxi_api_request_duration_seconds Request latency, by route and status code.',
+                '# TYPE taxi_api_request_duration_seconds histogram',
+            ]
+            for (route, status), histogram in sorted(self.latency.items()):
+                self._render_histogram(lines, 'taxi_api_request_duration_seconds',
+                                       {'route': route, 'status': status}, histogram)
+
+            lines += [
+                '# HELP taxi_api_request_phase_seconds Time spent per request phase, by route.',
+                '# TYPE taxi_api_request_phase_seconds histogram',
+            ]
+            for (route, phase), histogram in sorted(self.phase_latency.items()):
+                self._render_histogram(lines, 'taxi_api_request_phase_seconds',
+                                       {'route': route, 'phase': phase}, histogram)
+
+            lines += [
+                '# HELP taxi_api_rows_fetched_total Database rows fetched, by route.',
+                '# TYPE taxi_api_rows_fetched_total counter',
+            ]
+            for route, rows in sorted(self.rows_fetched.items()):
+                lines.append(f"taxi_api_rows_fetched_total{_labels(route=route)} {rows}")
+
+            lines += [
+                '# HELP taxi_api_response_bytes_total Response body bytes sent, by route.',
+                '# TYPE taxi_api_response_bytes_total counter',
+            ]
+            for route, sent in sorted(self.bytes_sent.items()):
+                lines.append(f"taxi_api_response_bytes_total{_labels(route=route)} {sent}")
+
+            lines += [
+                '# HELP taxi_api_start_time_seconds Unix time the server started.',
+                '# TYPE taxi_api_start_time_seconds gauge',
+                f"taxi_api_start_time_seconds {self.started_at!r}",
+            ]
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,89 @@
+"""
+Per-request profiling for diagnosing slow API calls
+
+A RequestProfiler runs cProfile around one handler and, when the response is
+about to be sent, reports the top functions by cumulative time together with
+every SQL statement the request executed and its EXPLAIN plan. The server only
+enables it for ?profile=1 when PROFILE_ENABLED is set.
+"""
+
+import cProfile
+import pstats
+
+
+class RequestProfiler:
+    """cProfile session plus SQL EXPLAIN report for a single request"""
+
+    def __init__(self, timer, top_n=25):
+        self.timer = timer
+        self.top_n = top_n
+        self._profile = cProfile.Profile()
+        self._running = False
+
+    def start(self):
+        self._profile.enable()
+        self._running = True
+
+    def stop(self):
+        if self._running:
+            self._profile.disable()
+            self._running = False
+
+    def top_functions(self):
+        """The top_n functions by cumulative time, calling thread only"""
+        stats = pstats.Stats(self._profile).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+
+        functions = []
+        for (filename, line, name), (primitive_calls, calls, own, cumulative, _) in ranked[:self.top_n]:
+            functions.append({
+                'function': f"{filename}:{line}({name})",
+                'calls': calls if calls == primitive_calls else f"{calls}/{primitive_calls}",
+                'own_ms': round(own * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3),
+            })
+        return functions
+
+    def report(self, storage, pool):
+        """Stop profiling and build the profile section attached to the response"""
+        self.stop()
+
+        statements = []
+        for statement in list(self.timer.statements):
+            statements.append({
+                'sql': ' '.join(str(statement['sql']).split()),
+                'params': list(statement['params']) if statement['params'] else [],
+                'duration_ms': round(statement['seconds'] * 1000, 3),
+                'rows': statement['rows'],
+                'explain': explain(storage, pool, statement['sql'], statement['params']),
+            })
+
+        return {
+            'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in self.timer.phases.items()},
+            'functions': self.top_functions(),
+            'sql': statements,
+        }
+
+
+def explain(storage, pool, sql, params, plan_format=None):
+    """
+    Run the storage backend's EXPLAIN for a SELECT on its own pooled connection.
+    Returns the plan (the JSON document with plan_format='JSON' on MySQL), None for
+    other statements, or an error message when the plan could not be produced.
+    """
+    if str(sql).lstrip()[:6].upper() != 'SELECT':
+        return None
+
+    conn = None
+    try:
+        conn = pool.acquire()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return storage.explain(cursor, sql, params, plan_format)
+        finally:
+            cursor.close()
+    except Exception as e:
+        return {'error': str(e)}
+    finally:
+        if conn is not None:
+            conn.close()
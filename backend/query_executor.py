@@ -0,0 +1,111 @@
+"""
+Concurrent execution of independent queries
+
+Handlers that need several unrelated result sets hand them to a QueryExecutor,
+which runs each one on its own pooled connection and merges the results by name.
+Endpoint latency then follows the slowest query instead of the sum of all of them.
+"""
+
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from metrics import acquire_timed
+
+
+# sql/params: the statement; fetch: 'all' or 'one'; timeout: seconds (None = executor default).
+# sql may instead be a callable taking a plain cursor (params and fetch unused):
+# Query(storage.overall_statistics, timeout=5) runs it with its own timeout.
+Query = namedtuple('Query', ['sql', 'params', 'fetch', 'timeout'])
+Query.__new__.__defaults__ = ((), 'all', None)
+
+
+class QueryTimeout(Exception):
+    """Raised when one or more queries did not finish within their timeout"""
+
+
+def with_time_limit(sql, timeout):
+    """
+    Add a MAX_EXECUTION_TIME optimizer hint so MySQL aborts the statement itself.
+    Other databases treat the hint as an ordinary comment.
+    """
+    stripped = sql.lstrip()
+    if timeout is None or stripped[:6].upper() != 'SELECT':
+        return sql
+    return f"SELECT /*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */{stripped[6:]}"
+
+
+class TimeLimitedCursor:
+    """Cursor proxy adding the with_time_limit() hint to every statement it executes"""
+
+    def __init__(self, cursor, timeout):
+        self._cursor = cursor
+        self._timeout = timeout
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, operation, params=None):
+        return self._cursor.execute(with_time_limit(operation, self._timeout), params)
+
+
+class QueryExecutor:
+    """Runs named, independent queries concurrently on connections from a pool"""
+
+    def __init__(self, pool, max_workers=8, default_timeout=30):
+        self.pool = pool
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query')
+
+    def _timeout(self, query):
+        """A query's own timeout, or the executor default"""
+        timeout = getattr(query, 'timeout', None)
+        return self.default_timeout if timeout is None else timeout
+
+    def _run_one(self, query, deadline, timer):
+        timeout = self._timeout(query)
+        if isinstance(query, Query) and callable(query.sql):
+            query = query.sql
+        conn = acquire_timed(self.pool, timer, timeout=max(0.0, deadline - time.monotonic()))
+        try:
+            # Callables (typically Storage reads) receive a plain cursor and return their own result
+            cursor = conn.cursor() if callable(query) else conn.cursor(dictionary=True)
+            try:
+                if callable(query):
+                    return query(TimeLimitedCursor(cursor, timeout))
+
+                cursor.execute(with_time_limit(query.sql, timeout), query.params)
+                return cursor.fetchone() if query.fetch == 'one' else cursor.fetchall()
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def run(self, queries, timer=None):
+        """
+        Execute a dict of name -> Query (or callable taking a plain cursor, run with
+        the default timeout) concurrently.
+        A RequestTimer, when given, receives connection-wait and execution times.
+        Returns a dict of name -> result; raises the first query error, or QueryTimeout
+        when a query is still running past its own timeout.
+        """
+        now = time.monotonic()
+        tasks = []
+        for name, query in queries.items():
+            deadline = now + self._timeout(query)
+            tasks.append((deadline, name, self._executor.submit(self._run_one, query, deadline, timer)))
+
+        # Collect in deadline order so each query is held to its own timeout
+        tasks.sort(key=lambda task: task[0])
+        results = {}
+        try:
+            for deadline, name, future in tasks:
+                try:
+                    results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeout:
+                    raise QueryTimeout(f"Query '{name}' timed out")
+        finally:
+            for _, _, future in tasks:
+                future.cancel()
+
+        return results
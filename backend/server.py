@@ -2,10 +2,32 @@ import http.server
 import socketserver
 import json
 import urllib.parse
+import csv
+import io
+import gzip
+import hashlib
+import base64
+import math
+import datetime
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
 from decimal import Decimal
-import mysql.connector
-from algorithms import QuickSort, RouteFrequencyCounter, OutlierDetector, TimeSeriesGrouper
+from algorithms import QuickSort, RouteFrequencyCounter, OutlierDetector, TimeSeriesGrouper, Selection, TDigest
+import serialization
+from heatmap import HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM, tile_x, tile_y
+from serialization import row_encoder_for
+from db_pool import ConnectionPool
+from storage import create_storage
+import columnar
+from columnar import ColumnarEngine
+from query_executor import QueryExecutor, QueryTimeout
+from metrics import RequestTimer, MetricsRegistry, acquire_timed, server_timing
+from profiling import RequestProfiler
+from slow_query_log import SlowQueryLog
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -14,10 +36,126 @@ DB_CONFIG = {
     'database': 'kk_team_nyc_taxi_db'
 }
 
+# Storage backend: 'mysql' (DB_CONFIG) or 'sqlite' (an embedded copy at SQLITE_DB_PATH,
+# filled by running data_processor.py with STORAGE_BACKEND = 'sqlite')
+STORAGE_BACKEND = 'mysql'
+SQLITE_DB_PATH = Path(__file__).resolve().parent.parent / 'data' / 'nyc_taxi.sqlite3'
+
 # Server configuration
 SERVER_HOST = 'localhost'
 SERVER_PORT = 8000
 
+# Connection pool shared by all request threads
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 10  # seconds to wait for a free connection
+
+# Concurrent fan-out of independent queries inside a handler
+QUERY_EXECUTOR_WORKERS = 8
+QUERY_TIMEOUT = 30  # seconds, per query
+
+# Batch endpoint (/api/batch)
+BATCH_MAX_REQUESTS = 10
+BATCH_MAX_BODY_BYTES = 64 * 1024
+BATCH_MAX_WORKERS = 4
+
+# Optional in-memory columnar engine (needs NumPy) for the aggregate endpoints and trip counts
+COLUMNAR_ENGINE = False
+COLUMNAR_REFRESH_INTERVAL = 5  # seconds between dataset generation checks
+
+# JSON encoding: 'stdlib' (byte-identical output) or 'orjson' (faster, compact)
+JSON_BACKEND = 'stdlib'
+
+# Static frontend assets, loaded once at startup and served from memory
+FRONTEND_DIR = Path(__file__).resolve().parent.parent / 'frontend'
+STATIC_FILES = {
+    '/': ('index.html', 'text/html; charset=utf-8'),
+    '/index.html': ('index.html', 'text/html; charset=utf-8'),
+    '/styles.css': ('styles.css', 'text/css; charset=utf-8'),
+    '/app.js': ('app.js', 'application/javascript; charset=utf-8'),
+}
+STATIC_RELOAD = False  # Development only: reload assets when their mtime changes
+STATIC_RELOAD_INTERVAL = 1.0  # seconds between mtime checks
+
+# Cached /api/trips totals (per filter set)
+TOTAL_COUNT_CACHE_TTL = 60  # seconds
+TOTAL_COUNT_CACHE_SIZE = 256
+
+# ?profile=1 attaches cProfile output and EXPLAIN plans to JSON responses.
+# It runs EXPLAIN for every statement and exposes SQL, so keep it off in production.
+PROFILE_ENABLED = False
+PROFILE_TOP_N = 25  # functions listed, by cumulative time
+
+# Slow query log: statements over the threshold (seconds, None = off) are written
+# with their EXPLAIN plan; summarize with `python backend/slow_query_log.py`
+SLOW_QUERY_THRESHOLD = 0.5
+SLOW_QUERY_LOG_PATH = Path(__file__).resolve().parent / 'logs' / 'slow_queries.log'
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# /api/top-routes reads the route_counts table that data_processor.py maintains.
+# With TOP_ROUTES_FROM_AGGREGATES off it scans trips instead, counting
+# TOP_ROUTES_FETCH_SIZE rows at a time; TOP_ROUTES_CAPACITY None counts every
+# route exactly, a number switches to bounded-memory Space-Saving counting
+# (approximate counts with reported error bounds).
+TOP_ROUTES_FROM_AGGREGATES = True
+TOP_ROUTES_FETCH_SIZE = 50000
+TOP_ROUTES_CAPACITY = None
+ROUTE_CELL_SIZE = 0.001  # degrees per route_counts cell
+ALL_VALUES = -1  # route_counts hour_of_day / is_weekend for "any"
+
+# /api/timeseries reads timeseries_buckets (filled by data_processor.py);
+# metric -> total column averaged per bucket, None for the trip count
+TIMESERIES_GRANULARITIES = ('15m', 'hour', 'day', 'week')
+TIMESERIES_METRICS = {
+    'trips': None,
+    'distance': 'total_distance',
+    'duration': 'total_duration',
+    'speed': 'total_speed',
+}
+TIMESERIES_MAX_POINTS = 10000
+
+# /api/histogram metric -> columnar engine column. Bins are counted in the database
+# (Storage.histogram_bins, over the indexed column) or by the columnar engine;
+# scale=log bins LN(value) instead.
+HISTOGRAM_METRICS = {
+    'speed': 'avg_speed_mph',
+    'distance': 'trip_distance_miles',
+    'duration': 'trip_duration',
+}
+HISTOGRAM_DEFAULT_BINS = 50
+HISTOGRAM_MAX_BINS = 1000
+
+# /api/heatmap reads heatmap_cells (see heatmap.py); a viewport may cover at most
+# HEATMAP_MAX_CELLS tiles, so the response size does not grow with the data
+HEATMAP_DEFAULT_ZOOM = 12
+HEATMAP_DEFAULT_BBOX = (-74.2591, 40.4774, -73.7004, 40.9176)  # west, south, east, north (NYC)
+HEATMAP_MAX_CELLS = 65536
+
+# /api/outliers lists the trips flagged by data_processor.py's outlier job
+# (trip_metrics.outlier_flags, one bit per metric) in idx_outlier_flags order
+OUTLIER_FLAGS = {'speed': 1, 'distance': 2, 'duration': 4}
+OUTLIER_PAGE_SIZE = 100
+OUTLIER_FETCH_SIZE = 50000  # rows per fetchmany() when reading raw metric values
+
+# /api/percentiles and /api/outlier-bounds read the metric_sketches t-digests;
+# with exact=true they select from the slice's values instead (for validation).
+# Sketch responses report unsketched_trips: trips loaded after the sketch watermark.
+# Slice parameter -> (column, largest value)
+SKETCH_METRICS = ('speed', 'distance', 'duration')
+SKETCH_SLICE_PARAMS = {
+    'hour': ('hour_of_day', 23),
+    'day_of_week': ('day_of_week', 6),
+    'vendor_id': ('vendor_id', 127),
+}
+DEFAULT_PERCENTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# Streaming export (/api/trips/export)
+EXPORT_FETCH_SIZE = 2000  # rows pulled from the server-side cursor per chunk
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'trips.ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'trips.csv'),
+}
+
 
 class DecimalEncoder(json.JSONEncoder):
     """Custom JSON encoder to handle Decimal objects"""
@@ -27,66 +165,449 @@ class DecimalEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+StaticAsset = namedtuple('StaticAsset', [
+    'body', 'gzip_body', 'content_type', 'content_length', 'gzip_length', 'etag', 'gzip_etag', 'mtime'
+])
+
+
+class StaticAssetCache:
+    """
+    Immutable in-memory table of encoded frontend assets.
+    Files are read, encoded and compressed once; the request path only does a dict lookup.
+    Reloading builds a complete new table and swaps it in, so readers never see a partial update.
+    """
+    
+    def __init__(self, root, files):
+        self.root = Path(root)
+        self.files = dict(files)
+        self._assets = MappingProxyType({})
+        self._reloader = None
+    
+    @staticmethod
+    def build_asset(filepath, content_type):
+        """Read a file and precompute everything needed to serve it"""
+        mtime = filepath.stat().st_mtime
+        body = filepath.read_text(encoding='utf-8').encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        
+        # Keep the compressed variant only when it actually saves bytes
+        gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gzip_body) >= len(body):
+            gzip_body = None
+        
+        return StaticAsset(
+            body=body,
+            gzip_body=gzip_body,
+            content_type=content_type,
+            content_length=str(len(body)),
+            gzip_length=str(len(gzip_body)) if gzip_body is not None else None,
+            etag=f'"{digest}"',
+            gzip_etag=f'"{digest}-gzip"',
+            mtime=mtime
+        )
+    
+    def load(self):
+        """Load every configured file and atomically replace the asset table"""
+        by_filename = {}
+        assets = {}
+        
+        for url_path, (filename, content_type) in self.files.items():
+            if filename not in by_filename:
+                try:
+                    by_filename[filename] = self.build_asset(self.root / filename, content_type)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Warning: could not load static asset {filename}: {e}")
+                    by_filename[filename] = None
+            
+            if by_filename[filename] is not None:
+                assets[url_path] = by_filename[filename]
+        
+        self._assets = MappingProxyType(assets)
+        return len(by_filename)
+    
+    def get(self, url_path):
+        """Return the preloaded asset for a URL path, or None"""
+        return self._assets.get(url_path)
+    
+    def is_stale(self):
+        """Check whether any file on disk differs from the loaded table"""
+        loaded = {filename: None for filename, _ in self.files.values()}
+        for url_path, asset in self._assets.items():
+            loaded[self.files[url_path][0]] = asset.mtime
+        
+        for filename, mtime in loaded.items():
+            try:
+                if (self.root / filename).stat().st_mtime != mtime:
+                    return True
+            except OSError:
+                if mtime is not None:
+                    return True
+        return False
+    
+    def start_reloader(self, interval=STATIC_RELOAD_INTERVAL):
+        """Poll file mtimes in a background thread and reload on change (development mode)"""
+        if self._reloader is not None:
+            return
+        
+        def watch():
+            while True:
+                time.sleep(interval)
+                if self.is_stale():
+                    self.load()
+                    print("Static assets reloaded")
+        
+        self._reloader = threading.Thread(target=watch, name='static-reloader', daemon=True)
+        self._reloader.start()
+
+
+static_assets = StaticAssetCache(FRONTEND_DIR, STATIC_FILES)
+
+
+
+# API routes and the handler method serving each one
+API_ROUTES = {
+    '/api/trips': 'handle_get_trips',
+    '/api/trips/export': 'handle_export_trips',
+    '/api/statistics': 'handle_get_statistics',
+    '/api/insights': 'handle_get_insights',
+    '/api/dashboard': 'handle_dashboard',
+    '/api/hourly-patterns': 'handle_hourly_patterns',
+    '/api/timeseries': 'handle_timeseries',
+    '/api/histogram': 'handle_histogram',
+    '/api/top-routes': 'handle_top_routes',
+    '/api/heatmap': 'handle_heatmap',
+    '/api/outliers': 'handle_outliers',
+    '/api/percentiles': 'handle_percentiles',
+    '/api/outlier-bounds': 'handle_outlier_bounds',
+    '/api/metrics': 'handle_metrics',
+}
+
+# Dashboard summary: one GROUP BY over these keys yields every statistics/insights grouping
+DASHBOARD_CELL_KEYS = ('vendor_id', 'hour_of_day', 'is_weekend', 'time_period', 'distance_category')
+DASHBOARD_SUM_FIELDS = ('trip_count', 'sum_distance', 'sum_speed', 'sum_duration', 'sum_passengers', 'sum_efficiency')
+DISTANCE_CATEGORY_ORDER = ('short', 'medium', 'long', 'very_long')
+# Dashboard cell sums computed by the columnar engine, mapped to their source columns
+DASHBOARD_CELL_SUMS = {
+    'sum_distance': 'trip_distance_miles',
+    'sum_speed': 'avg_speed_mph',
+    'sum_duration': 'trip_duration',
+    'sum_passengers': 'passenger_count',
+    'sum_efficiency': 'trip_efficiency'
+}
+
+# Streaming and non-JSON responses cannot be captured into a combined batch response
+BATCH_EXCLUDED_ROUTES = {'/api/trips/export', '/api/metrics'}
+
+storage = create_storage(STORAGE_BACKEND, DB_CONFIG, SQLITE_DB_PATH)
+db_pool = ConnectionPool(storage.connect_reader, DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+metrics_registry = MetricsRegistry()
+slow_query_log = SlowQueryLog(
+    SLOW_QUERY_LOG_PATH, SLOW_QUERY_THRESHOLD, SLOW_QUERY_LOG_MAX_BYTES, SLOW_QUERY_LOG_BACKUPS,
+    pool=db_pool, storage=storage
+)
+columnar_engine = None  # created by run_server() when COLUMNAR_ENGINE is set
+query_executor = QueryExecutor(db_pool, max_workers=QUERY_EXECUTOR_WORKERS, default_timeout=QUERY_TIMEOUT)
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='batch')
+
+# Sortable fields for /api/trips, mapped to the result column holding the sort value
+TRIP_SORT_FIELDS = {
+    'distance': 'trip_distance_miles',
+    'duration': 'trip_duration',
+    'speed': 'avg_speed_mph',
+    'pickup_datetime': 'pickup_datetime'
+}
+
+# /api/trips page size: limit is clamped to 1..TRIPS_MAX_LIMIT
+TRIPS_DEFAULT_LIMIT = 100
+TRIPS_MAX_LIMIT = 10000
+
+# /api/trips filter parameter -> value parser (storage.TRIP_FILTER_CONDITIONS has the SQL)
+TRIP_FILTER_PARSERS = {
+    'min_distance': float,
+    'max_distance': float,
+    'min_duration': int,
+    'max_duration': int,
+    'vendor_id': int,
+    'hour': int,
+    'day_of_week': int,
+    'is_weekend': lambda value: value.lower() == 'true',
+    'pickup_zone_id': int,
+    'dropoff_zone_id': int,
+}
+
+
+def histogram_edges(low, high, bins, log=False):
+    """bins + 1 bin edges from low to high, equal-width or (log) equal-ratio"""
+    start, stop = (math.log(low), math.log(high)) if log else (low, high)
+    width = (stop - start) / bins or 1.0
+    edges = [start + width * position for position in range(bins + 1)]
+    return [math.exp(edge) for edge in edges] if log else edges
+
+
+def encode_page_cursor(sort_by, order, sort_value, trip_id):
+    """Build an opaque keyset cursor from the last row of a page"""
+    if isinstance(sort_value, (Decimal, datetime.datetime)):
+        sort_value = str(sort_value)
+    payload = json.dumps([sort_by, order, sort_value, trip_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(token, sort_by, order):
+    """Decode a keyset cursor and check that it belongs to the requested ordering"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_sort_by, cursor_order, sort_value, trip_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("malformed token")
+    
+    if cursor_sort_by != sort_by or cursor_order != order:
+        raise ValueError("cursor was issued for a different sort order")
+    
+    # Bind numeric keys as exact decimals so they compare like the stored column
+    if sort_by in ('distance', 'speed'):
+        sort_value = Decimal(str(sort_value))
+    elif sort_by == 'duration':
+        sort_value = int(sort_value)
+    
+    return sort_value, str(trip_id)
+
+
+class TotalCountCache:
+    """Small thread-safe LRU cache of trip totals keyed by filter set, with a TTL"""
+    
+    def __init__(self, max_entries=TOTAL_COUNT_CACHE_SIZE, ttl=TOTAL_COUNT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+total_count_cache = TotalCountCache()
+
+
+def rollup_cells(cells, key_field):
+    """Merge pre-aggregated dashboard cells into one group per value of key_field"""
+    groups = {}
+    for cell in cells:
+        key = cell[key_field]
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = dict.fromkeys(DASHBOARD_SUM_FIELDS, 0)
+        for field in DASHBOARD_SUM_FIELDS:
+            group[field] += cell[field] or 0
+    return groups
+
+
+def average(total, count):
+    return total / count if count else None
+
+
+def summarize_dashboard_cells(cells):
+    """
+    Split the single-scan dashboard cells back into the /api/statistics and
+    /api/insights response shapes. Averages are recombined from sums and counts.
+    """
+    total = dict.fromkeys(DASHBOARD_SUM_FIELDS, 0)
+    earliest_trip = None
+    latest_trip = None
+    for cell in cells:
+        for field in DASHBOARD_SUM_FIELDS:
+            total[field] += cell[field] or 0
+        if cell['earliest_trip'] is not None and (earliest_trip is None or cell['earliest_trip'] < earliest_trip):
+            earliest_trip = cell['earliest_trip']
+        if cell['latest_trip'] is not None and (latest_trip is None or cell['latest_trip'] > latest_trip):
+            latest_trip = cell['latest_trip']
+    
+    trip_count = total['trip_count']
+    overall_stats = {
+        'total_trips': trip_count,
+        'avg_distance': average(total['sum_distance'], trip_count),
+        'avg_speed': average(total['sum_speed'], trip_count),
+        'avg_duration': average(total['sum_duration'], trip_count),
+        'avg_passengers': average(total['sum_passengers'], trip_count),
+        'total_distance': total['sum_distance'] if trip_count else None,
+        'earliest_trip': str(earliest_trip),
+        'latest_trip': str(latest_trip)
+    }
+    
+    by_vendor = rollup_cells(cells, 'vendor_id')
+    vendor_stats = [{
+        'vendor_id': vendor_id,
+        'trip_count': group['trip_count'],
+        'avg_distance': average(group['sum_distance'], group['trip_count']),
+        'avg_speed': average(group['sum_speed'], group['trip_count'])
+    } for vendor_id, group in by_vendor.items()]
+    vendor_stats = QuickSort.sort(vendor_stats, key=lambda row: row['vendor_id'])
+    
+    by_period = rollup_cells(cells, 'time_period')
+    time_periods = QuickSort.sort([
+        {'time_period': period, 'trip_count': group['trip_count']}
+        for period, group in by_period.items()
+    ], key=lambda row: row['trip_count'], reverse=True)
+    
+    by_distance = rollup_cells(cells, 'distance_category')
+    distance_distribution = [
+        {'distance_category': category, 'trip_count': by_distance[category]['trip_count']}
+        for category in DISTANCE_CATEGORY_ORDER if category in by_distance
+    ]
+    
+    by_hour = rollup_cells(cells, 'hour_of_day')
+    hourly_data = QuickSort.sort([{
+        'hour_of_day': hour,
+        'trip_count': group['trip_count'],
+        'avg_distance': average(group['sum_distance'], group['trip_count']),
+        'avg_speed': average(group['sum_speed'], group['trip_count'])
+    } for hour, group in by_hour.items()], key=lambda row: row['hour_of_day'])
+    
+    by_weekend = rollup_cells(cells, 'is_weekend')
+    weekend_comparison = QuickSort.sort([{
+        'is_weekend': is_weekend,
+        'trip_count': group['trip_count'],
+        'avg_distance': average(group['sum_distance'], group['trip_count']),
+        'avg_speed': average(group['sum_speed'], group['trip_count']),
+        'avg_efficiency': average(group['sum_efficiency'], group['trip_count'])
+    } for is_weekend, group in by_weekend.items()], key=lambda row: row['is_weekend'])
+    
+    speed_by_period = QuickSort.sort([{
+        'time_period': period,
+        'avg_speed': average(group['sum_speed'], group['trip_count']),
+        'trip_count': group['trip_count']
+    } for period, group in by_period.items()], key=lambda row: row['avg_speed'] or 0, reverse=True)
+    
+    statistics = {
+        'success': True,
+        'overall': overall_stats,
+        'by_vendor': vendor_stats,
+        'by_time_period': time_periods,
+        'distance_distribution': distance_distribution
+    }
+    insights = {
+        'success': True,
+        'hourly_patterns': hourly_data,
+        'weekend_vs_weekday': weekend_comparison,
+        'speed_by_time_period': speed_by_period
+    }
+    return statistics, insights
+
+
+def export_value(value):
+    """Convert a database value to something json/csv can write"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return str(value)
+    return value
+
+
 class TaxiAPIHandler(http.server.BaseHTTPRequestHandler):
     """Custom HTTP request handler for NYC Taxi API"""
     
+    # HTTP/1.1 gives keep-alive connections and chunked streaming for exports
+    protocol_version = 'HTTP/1.1'
+    _chunked = False
+    
+    # Per-request instrumentation, reset at the start of every request
+    timer = None
+    profiler = None
+    _status = None
+    _bytes_sent = 0
+    
     def _set_cors_headers(self):
         """Set CORS headers to allow cross-origin requests"""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
     
-    def _set_json_headers(self):
+    def _set_server_timing_header(self):
+        """Expose the request's phase and per-statement timings to browser devtools"""
+        self.send_header('Server-Timing', server_timing(self.timer))
+    
+    def _set_json_headers(self, content_length):
         """Set headers for JSON response"""
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
+        self._set_server_timing_header()
         self._set_cors_headers()
         self.end_headers()
     
-    def _set_html_headers(self):
-        """Set headers for HTML response"""
-        self.send_header('Content-type', 'text/html')
-        self._set_cors_headers()
-        self.end_headers()
-    
-    def _set_css_headers(self):
-        """Set headers for CSS response"""
-        self.send_header('Content-type', 'text/css')
-        self._set_cors_headers()
-        self.end_headers()
+    def _send_json_response(self, data, status_code=200):
+        """Send JSON response with proper encoding"""
+        if self.profiler is not None and isinstance(data, dict):
+            data = dict(data, profile=self.profiler.report(storage, db_pool))
+        
+        # Decimals and datetimes are handled by the converter/encoder, in one pass
+        with self.timer.phase('serialization'):
+            body = serialization.dumps(data)
+        
+        self.send_response(status_code)
+        self._set_json_headers(len(body))
+        self._write_body(body)
     
-    def _set_js_headers(self):
-        """Set headers for JavaScript response"""
-        self.send_header('Content-type', 'application/javascript')
-        self._set_cors_headers()
-        self.end_headers()
+    def _write_body(self, data):
+        """Write response bytes to the socket, recording time and size"""
+        with self.timer.phase('socket_write'):
+            self.wfile.write(data)
+        self._bytes_sent += len(data)
     
-    def _convert_decimals(self, data):
-        """Recursively convert Decimal objects to float in nested structures"""
-        if isinstance(data, list):
-            return [self._convert_decimals(item) for item in data]
-        elif isinstance(data, dict):
-            return {key: self._convert_decimals(value) for key, value in data.items()}
-        elif isinstance(data, Decimal):
-            return float(data)
+    def _write_chunk(self, data):
+        """Write one piece of a streamed body, framed for chunked encoding when in use"""
+        if not data:
+            return
+        if self._chunked:
+            self._write_body(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
         else:
-            return data
+            self._write_body(data)
     
-    def _send_json_response(self, data, status_code=200):
-        """Send JSON response with proper encoding"""
-        self.send_response(status_code)
-        self._set_json_headers()
-        # Convert all Decimals before encoding
-        converted_data = self._convert_decimals(data)
-        self.wfile.write(json.dumps(converted_data).encode('utf-8'))
+    def send_response(self, code, message=None):
+        """Remember the status code for metrics before sending it"""
+        self._status = code
+        super().send_response(code, message)
+    
+    def _begin_request(self):
+        self.timer = RequestTimer()
+        self.profiler = None
+        self._status = None
+        self._bytes_sent = 0
+        return time.perf_counter()
+    
+    def _finish_request(self, route, started):
+        if self.profiler is not None:
+            self.profiler.stop()
+        slow_query_log.record_timer(self.timer, route)
+        metrics_registry.observe_request(
+            route, self._status or 0, time.perf_counter() - started, self.timer, self._bytes_sent
+        )
     
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS"""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self._set_cors_headers()
         self.end_headers()
     
     def do_GET(self):
         """Handle GET requests"""
+        started = self._begin_request()
+        route = 'unmatched'
         try:
             # Parse URL and query parameters
             parsed_path = urllib.parse.urlparse(self.path)
@@ -94,187 +615,197 @@ class TaxiAPIHandler(http.server.BaseHTTPRequestHandler):
             query_params = urllib.parse.parse_qs(parsed_path.query)
             
             # Route requests
-            if path == '/' or path == '/index.html':
-                self.serve_file('frontend/index.html', 'html')
-            elif path == '/styles.css':
-                self.serve_file('frontend/styles.css', 'css')
-            elif path == '/app.js':
-                self.serve_file('frontend/app.js', 'js')
-            elif path == '/api/trips':
-                self.handle_get_trips(query_params)
-            elif path == '/api/statistics':
-                self.handle_get_statistics()
-            elif path == '/api/insights':
-                self.handle_get_insights()
-            elif path == '/api/hourly-patterns':
-                self.handle_hourly_patterns()
-            elif path == '/api/top-routes':
-                self.handle_top_routes(query_params)
-            elif path == '/api/outliers':
-                self.handle_outliers(query_params)
+            asset = static_assets.get(path)
+            if asset is not None:
+                route = 'static'
+                self.serve_static(asset)
+            elif path in STATIC_FILES:
+                route = 'static'
+                self.send_error(404, f"File not found: {STATIC_FILES[path][0]}")
+            elif path in API_ROUTES:
+                route = path
+                if PROFILE_ENABLED and query_params.get('profile', [''])[0] == '1':
+                    self.profiler = RequestProfiler(self.timer, top_n=PROFILE_TOP_N)
+                    self.profiler.start()
+                getattr(self, API_ROUTES[path])(query_params)
             else:
                 self.send_error(404, "Endpoint not found")
         except Exception as e:
             print(f"Error in do_GET: {str(e)}")
             self.send_error(500, f"Server error: {str(e)}")
+        finally:
+            self._finish_request(route, started)
     
-    def serve_file(self, filepath, file_type):
-        """Serve static files"""
+    def do_POST(self):
+        """Handle POST requests"""
+        started = self._begin_request()
+        route = 'unmatched'
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
+            path = urllib.parse.urlparse(self.path).path
             
-            self.send_response(200)
-            if file_type == 'html':
-                self._set_html_headers()
-            elif file_type == 'css':
-                self._set_css_headers()
-            elif file_type == 'js':
-                self._set_js_headers()
-            
-            self.wfile.write(content.encode('utf-8'))
-        except FileNotFoundError:
-            self.send_error(404, f"File not found: {filepath}")
+            if path == '/api/batch':
+                route = path
+                self.handle_batch()
+            else:
+                self.send_error(404, "Endpoint not found")
         except Exception as e:
+            print(f"Error in do_POST: {str(e)}")
             self.send_error(500, f"Server error: {str(e)}")
+        finally:
+            self._finish_request(route, started)
+    
+    def _accepts_gzip(self):
+        """Check whether the client accepts a gzip-encoded response"""
+        header = self.headers.get('Accept-Encoding', '')
+        for token in header.split(','):
+            coding, _, params = token.partition(';')
+            if coding.strip().lower() not in ('gzip', '*'):
+                continue
+            # An explicit q=0 means "not acceptable"
+            name, _, value = params.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+            return True
+        return False
+    
+    def serve_static(self, asset):
+        """Serve a preloaded static asset from memory"""
+        use_gzip = asset.gzip_body is not None and self._accepts_gzip()
+        etag = asset.gzip_etag if use_gzip else asset.etag
+        
+        # Conditional request: the client already has this exact version
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in if_none_match):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self._set_cors_headers()
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', asset.gzip_length)
+        else:
+            self.send_header('Content-Length', asset.content_length)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self._set_cors_headers()
+        self.end_headers()
+        
+        self._write_body(asset.gzip_body if use_gzip else asset.body)
     
     def get_db_connection(self):
-        """Create database connection"""
-        return mysql.connector.connect(**DB_CONFIG)
+        """Borrow a database connection from the pool (close() returns it)"""
+        # DECIMAL and DATETIME values arrive already in their JSON-ready types;
+        # the wait and every statement are timed into this request's metrics
+        return acquire_timed(db_pool, self.timer)
+    
+    def _trip_columns(self):
+        """The columnar engine's current snapshot, or None to answer from SQL"""
+        if columnar_engine is None:
+            return None
+        try:
+            return columnar_engine.columns(self.get_db_connection)
+        except Exception as e:
+            print(f"Columnar engine unavailable, using SQL: {str(e)}")
+            return None
+    
+    def _columnar_dashboard(self, columns):
+        """Statistics and insights responses computed from the columnar snapshot"""
+        with self.timer.phase('processing'):
+            cells = columns.group_by(DASHBOARD_CELL_KEYS, sums=DASHBOARD_CELL_SUMS, pickup_range=True)
+            return summarize_dashboard_cells(cells)
     
     def handle_get_trips(self, params):
         """
         GET /api/trips
         Query parameters:
-            - limit: number of records (default 100)
-            - offset: pagination offset (default 0)
-            - sort_by: field to sort by (distance, duration, speed)
+            - limit: number of records (default 100, clamped to 1..TRIPS_MAX_LIMIT)
+            - cursor: opaque token from a previous page's next_cursor (keyset pagination)
+            - offset: pagination offset (default 0, ignored when cursor is given)
+            - sort_by: field to sort by (distance, duration, speed, pickup_datetime)
             - order: asc or desc
+            - include_total: set to false to skip the total count
             - min_distance, max_distance: filter by distance
             - min_duration, max_duration: filter by duration
             - vendor_id: filter by vendor
             - hour: filter by hour of day
             - day_of_week: filter by day (0-6)
+            - is_weekend: filter by weekend flag (true/false)
         """
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Parse parameters
-            limit = int(params.get('limit', [100])[0])
+            limit = int(params.get('limit', [TRIPS_DEFAULT_LIMIT])[0])
             offset = int(params.get('offset', [0])[0])
+            filters = self._trip_filters(params)
+        except ValueError as e:
+            self.send_error(400, f"Invalid parameter value: {str(e)}")
+            return
+        limit = min(max(limit, 1), TRIPS_MAX_LIMIT)
+        offset = max(offset, 0)
+        
+        try:
             sort_by = params.get('sort_by', ['pickup_datetime'])[0]
-            order = params.get('order', ['desc'])[0]
-            
-            # Build WHERE clause
-            where_conditions = []
-            query_params = []
-            
-            if 'min_distance' in params:
-                where_conditions.append("tm.trip_distance_miles >= %s")
-                query_params.append(float(params['min_distance'][0]))
+            order = 'ASC' if params.get('order', ['desc'])[0].lower() == 'asc' else 'DESC'
+            include_total = params.get('include_total', ['true'])[0].lower() != 'false'
             
-            if 'max_distance' in params:
-                where_conditions.append("tm.trip_distance_miles <= %s")
-                query_params.append(float(params['max_distance'][0]))
+            if sort_by not in TRIP_SORT_FIELDS:
+                sort_by = 'pickup_datetime'
             
-            if 'min_duration' in params:
-                where_conditions.append("t.trip_duration >= %s")
-                query_params.append(int(params['min_duration'][0]))
+            # Seek past the last row of the previous page instead of skipping rows
+            after = None
+            if 'cursor' in params:
+                try:
+                    after = decode_page_cursor(params['cursor'][0], sort_by, order)
+                except ValueError as e:
+                    self.send_error(400, f"Invalid cursor: {str(e)}")
+                    return
+                offset = 0
             
-            if 'max_duration' in params:
-                where_conditions.append("t.trip_duration <= %s")
-                query_params.append(int(params['max_duration'][0]))
+            # Before borrowing a connection: a snapshot refresh borrows one of its own
+            columns_snapshot = self._trip_columns() if include_total else None
             
-            if 'vendor_id' in params:
-                where_conditions.append("t.vendor_id = %s")
-                query_params.append(int(params['vendor_id'][0]))
-            
-            if 'hour' in params:
-                where_conditions.append("tm.hour_of_day = %s")
-                query_params.append(int(params['hour'][0]))
-            
-            if 'day_of_week' in params:
-                where_conditions.append("tm.day_of_week = %s")
-                query_params.append(int(params['day_of_week'][0]))
-            
-            if 'is_weekend' in params:
-                where_conditions.append("tm.is_weekend = %s")
-                query_params.append(params['is_weekend'][0].lower() == 'true')
-            
-            where_clause = ""
-            if where_conditions:
-                where_clause = "WHERE " + " AND ".join(where_conditions)
-            
-            # Map sort field
-            sort_field_map = {
-                'distance': 'tm.trip_distance_miles',
-                'duration': 't.trip_duration',
-                'speed': 'tm.avg_speed_mph',
-                'pickup_datetime': 't.pickup_datetime'
-            }
-            sort_field = sort_field_map.get(sort_by, 't.pickup_datetime')
-            
-            # Build query
-            query = f"""
-                SELECT 
-                    t.trip_id,
-                    t.vendor_id,
-                    t.pickup_datetime,
-                    t.dropoff_datetime,
-                    t.passenger_count,
-                    t.pickup_longitude,
-                    t.pickup_latitude,
-                    t.dropoff_longitude,
-                    t.dropoff_latitude,
-                    t.trip_duration,
-                    tm.trip_distance_miles,
-                    tm.avg_speed_mph,
-                    tm.trip_efficiency,
-                    tm.hour_of_day,
-                    tm.day_of_week,
-                    tm.is_weekend,
-                    tm.time_period,
-                    tm.distance_category,
-                    tm.duration_category
-                FROM trips t
-                INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id
-                {where_clause}
-                ORDER BY {sort_field} {order.upper()}
-                LIMIT %s OFFSET %s
-            """
-            
-            query_params.extend([limit, offset])
-            cursor.execute(query, query_params)
-            
-            trips = cursor.fetchall()
-            
-            # Convert datetime to string
-            for trip in trips:
-                if trip.get('pickup_datetime'):
-                    trip['pickup_datetime'] = str(trip['pickup_datetime'])
-                if trip.get('dropoff_datetime'):
-                    trip['dropoff_datetime'] = str(trip['dropoff_datetime'])
-            
-            # Get total count
-            count_query = f"""
-                SELECT COUNT(*) as total
-                FROM trips t
-                INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id
-                {where_clause}
-            """
-            cursor.execute(count_query, query_params[:-2])  # Exclude limit and offset
-            total_count = cursor.fetchone()['total']
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            
+            # Fetch one extra row to know whether another page exists
+            columns, trips = storage.select_trips(cursor, filters, sort_by, order, limit + 1, offset, after)
+            has_more = len(trips) > limit
+            trips = trips[:limit]
+            
+            next_cursor = None
+            if has_more and trips:
+                last_trip = trips[-1]
+                sort_value = last_trip[columns.index(TRIP_SORT_FIELDS[sort_by])]
+                next_cursor = encode_page_cursor(sort_by, order, sort_value, last_trip[columns.index('trip_id')])
+            
+            # Get total count (cached per filter set)
+            total_count = None
+            if include_total:
+                if columns_snapshot is not None:
+                    with self.timer.phase('processing'):
+                        total_count = columns_snapshot.count(params)
+                else:
+                    total_count = self._get_total_count(cursor, filters)
             
             cursor.close()
             conn.close()
             
             response = {
                 'success': True,
-                'data': trips,
+                'data': row_encoder_for(columns).encode_rows(trips),
                 'total': total_count,
                 'limit': limit,
-                'offset': offset
+                'offset': offset,
+                'has_more': has_more,
+                'next_cursor': next_cursor
             }
             
             self._send_json_response(response)
@@ -283,169 +814,256 @@ class TaxiAPIHandler(http.server.BaseHTTPRequestHandler):
             print(f"Error in handle_get_trips: {str(e)}")
             self.send_error(500, f"Error fetching trips: {str(e)}")
     
-    def handle_get_statistics(self):
-        """GET /api/statistics - Get overall dataset statistics"""
+    def handle_export_trips(self, params):
+        """
+        GET /api/trips/export - Stream every matching trip as NDJSON or CSV
+        Query parameters:
+            - format: ndjson (default) or csv
+            - sort_by, order: optional ordering (same fields as /api/trips)
+            - same filters as /api/trips
+        Rows are read through an unbuffered server-side cursor in batches and written
+        as they arrive, so memory use does not depend on the number of rows exported.
+        """
+        export_format = params.get('format', ['ndjson'])[0].lower()
+        if export_format not in EXPORT_FORMATS:
+            self.send_error(400, "Invalid format. Use: ndjson or csv")
+            return
+        content_type, filename = EXPORT_FORMATS[export_format]
+        
+        try:
+            filters = self._trip_filters(params)
+        except ValueError as e:
+            self.send_error(400, f"Invalid filter value: {str(e)}")
+            return
+        
+        # Ordering is optional; without it MySQL can stream rows in storage order
+        sort_by = None
+        order = 'DESC'
+        if 'sort_by' in params and params['sort_by'][0] in TRIP_SORT_FIELDS:
+            sort_by = params['sort_by'][0]
+            order = 'ASC' if params.get('order', ['desc'])[0].lower() == 'asc' else 'DESC'
+        
+        conn = None
+        cursor = None
+        headers_sent = False
         try:
             conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Overall statistics
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_trips,
-                    AVG(tm.trip_distance_miles) as avg_distance,
-                    AVG(tm.avg_speed_mph) as avg_speed,
-                    AVG(t.trip_duration) as avg_duration,
-                    AVG(t.passenger_count) as avg_passengers,
-                    SUM(tm.trip_distance_miles) as total_distance,
-                    MIN(t.pickup_datetime) as earliest_trip,
-                    MAX(t.pickup_datetime) as latest_trip
-                FROM trips t
-                INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id
-            """)
-            
-            overall_stats = cursor.fetchone()
+            cursor = conn.cursor(buffered=False)
+            storage.stream_trips(cursor, filters, sort_by, order)
+            columns = cursor.column_names
+            
+            self._chunked = self.request_version == 'HTTP/1.1'
+            self.send_response(200)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+            if self._chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                # HTTP/1.0 clients read until the connection closes
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            self._set_server_timing_header()
+            self._set_cors_headers()
+            self.end_headers()
+            headers_sent = True
+            
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                writer.writerow(columns)
+            else:
+                encoder = row_encoder_for(columns)
+            
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                
+                if export_format == 'csv':
+                    writer.writerows([[export_value(value) for value in row] for row in rows])
+                    chunk = buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                else:
+                    chunk = ''.join([encoder.encode_row(row) + '\n' for row in rows])
+                self._write_chunk(chunk.encode('utf-8'))
+            
+            if export_format == 'csv' and buffer.tell():
+                self._write_chunk(buffer.getvalue().encode('utf-8'))
+            
+            if self._chunked:
+                self._write_body(b"0\r\n\r\n")
+            
+        except (BrokenPipeError, ConnectionResetError):
+            print("Client disconnected during export")
+            self.close_connection = True
+        except Exception as e:
+            print(f"Error in handle_export_trips: {str(e)}")
+            if headers_sent:
+                # Too late for an error status; dropping the connection signals a truncated body
+                self.close_connection = True
+            else:
+                self.send_error(500, f"Error exporting trips: {str(e)}")
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            if conn is not None:
+                conn.close()
+    
+    def _trip_filters(self, params):
+        """Parse the /api/trips filter parameters into a {filter name: value} dict"""
+        return {name: parse(params[name][0]) for name, parse in TRIP_FILTER_PARSERS.items() if name in params}
+    
+    def _get_total_count(self, cursor, filters):
+        """Count trips matching a filter set, reusing a recent result when available"""
+        cache_key = tuple(filters.items())
+        total_count = total_count_cache.get(cache_key)
+        if total_count is not None:
+            return total_count
+        
+        total_count = storage.count_trips(cursor, filters)
+        total_count_cache.put(cache_key, total_count)
+        return total_count
+    
+    def handle_get_statistics(self, params=None):
+        """GET /api/statistics - Get overall dataset statistics"""
+        try:
+            columns = self._trip_columns()
+            if columns is not None:
+                statistics, _ = self._columnar_dashboard(columns)
+                self._send_json_response(statistics)
+                return
+            
+            # The four result sets are independent, so they run concurrently
+            results = query_executor.run(timer=self.timer, queries={
+                'overall': storage.overall_statistics,
+                'by_vendor': storage.vendor_statistics,
+                'by_time_period': storage.time_period_counts,
+                'distance_distribution': storage.distance_category_counts
+            })
+            
+            overall_stats = results['overall']
             if overall_stats:
                 overall_stats['earliest_trip'] = str(overall_stats['earliest_trip'])
                 overall_stats['latest_trip'] = str(overall_stats['latest_trip'])
             
-            # Vendor statistics
-            cursor.execute("""
-                SELECT 
-                    vendor_id,
-                    COUNT(*) as trip_count,
-                    AVG(tm.trip_distance_miles) as avg_distance,
-                    AVG(tm.avg_speed_mph) as avg_speed
-                FROM trips t
-                INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id
-                GROUP BY vendor_id
-            """)
-            
-            vendor_stats = cursor.fetchall()
-            
-            # Time period distribution
-            cursor.execute("""
-                SELECT 
-                    time_period,
-                    COUNT(*) as trip_count
-                FROM trip_metrics
-                GROUP BY time_period
-                ORDER BY trip_count DESC
-            """)
-            
-            time_periods = cursor.fetchall()
-            
-            # Distance category distribution
-            cursor.execute("""
-                SELECT 
-                    distance_category,
-                    COUNT(*) as trip_count
-                FROM trip_metrics
-                GROUP BY distance_category
-                ORDER BY FIELD(distance_category, 'short', 'medium', 'long', 'very_long')
-            """)
-            
-            distance_distribution = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
             response = {
                 'success': True,
                 'overall': overall_stats,
-                'by_vendor': vendor_stats,
-                'by_time_period': time_periods,
-                'distance_distribution': distance_distribution
+                'by_vendor': results['by_vendor'],
+                'by_time_period': results['by_time_period'],
+                'distance_distribution': results['distance_distribution']
             }
             
             self._send_json_response(response)
             
+        except QueryTimeout as e:
+            print(f"Timeout in handle_get_statistics: {str(e)}")
+            self.send_error(504, f"Statistics query timed out: {str(e)}")
         except Exception as e:
             print(f"Error in handle_get_statistics: {str(e)}")
             self.send_error(500, f"Error fetching statistics: {str(e)}")
     
-    def handle_get_insights(self):
-        """GET /api/insights - Get analytical insights"""
+    def handle_dashboard(self, params=None):
+        """
+        GET /api/dashboard - Statistics and insights from a single table scan
+        One GROUP BY over (vendor, hour, weekend, time period, distance category) produces
+        small pre-aggregated cells; every grouping of /api/statistics and /api/insights is
+        then rolled up from those cells in Python.
+        """
         try:
+            columns = self._trip_columns()
+            if columns is not None:
+                statistics, insights = self._columnar_dashboard(columns)
+                self._send_json_response({
+                    'success': True,
+                    'statistics': statistics,
+                    'insights': insights
+                })
+                return
+            
             conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Insight 1: Peak hours analysis
-            cursor.execute("""
-                SELECT 
-                    hour_of_day,
-                    COUNT(*) as trip_count,
-                    AVG(trip_distance_miles) as avg_distance,
-                    AVG(avg_speed_mph) as avg_speed
-                FROM trip_metrics
-                GROUP BY hour_of_day
-                ORDER BY hour_of_day
-            """)
-            
-            hourly_data = cursor.fetchall()
-            
-            # Insight 2: Weekend vs Weekday patterns
-            cursor.execute("""
-                SELECT 
-                    is_weekend,
-                    COUNT(*) as trip_count,
-                    AVG(trip_distance_miles) as avg_distance,
-                    AVG(avg_speed_mph) as avg_speed,
-                    AVG(trip_efficiency) as avg_efficiency
-                FROM trip_metrics
-                GROUP BY is_weekend
-            """)
-            
-            weekend_comparison = cursor.fetchall()
-            
-            # Insight 3: Speed by time period
-            cursor.execute("""
-                SELECT 
-                    time_period,
-                    AVG(avg_speed_mph) as avg_speed,
-                    COUNT(*) as trip_count
-                FROM trip_metrics
-                GROUP BY time_period
-                ORDER BY avg_speed DESC
-            """)
-            
-            speed_by_period = cursor.fetchall()
+            cursor = conn.cursor()
+            
+            cells = storage.dashboard_cells(cursor)
             
             cursor.close()
             conn.close()
             
+            with self.timer.phase('processing'):
+                statistics, insights = summarize_dashboard_cells(cells)
+            
+            response = {
+                'success': True,
+                'statistics': statistics,
+                'insights': insights
+            }
+            
+            self._send_json_response(response)
+            
+        except Exception as e:
+            print(f"Error in handle_dashboard: {str(e)}")
+            self.send_error(500, f"Error building dashboard: {str(e)}")
+    
+    def handle_get_insights(self, params=None):
+        """GET /api/insights - Get analytical insights"""
+        try:
+            columns = self._trip_columns()
+            if columns is not None:
+                _, insights = self._columnar_dashboard(columns)
+                self._send_json_response(insights)
+                return
+            
+            results = query_executor.run(timer=self.timer, queries={
+                # Peak hours, weekend vs weekday, and speed by time period
+                'hourly_patterns': storage.hourly_statistics,
+                'weekend_vs_weekday': storage.weekend_statistics,
+                'speed_by_time_period': storage.time_period_speeds
+            })
+            
             response = {
                 'success': True,
-                'hourly_patterns': hourly_data,
-                'weekend_vs_weekday': weekend_comparison,
-                'speed_by_time_period': speed_by_period
+                'hourly_patterns': results['hourly_patterns'],
+                'weekend_vs_weekday': results['weekend_vs_weekday'],
+                'speed_by_time_period': results['speed_by_time_period']
             }
             
             self._send_json_response(response)
             
+        except QueryTimeout as e:
+            print(f"Timeout in handle_get_insights: {str(e)}")
+            self.send_error(504, f"Insights query timed out: {str(e)}")
         except Exception as e:
             print(f"Error in handle_get_insights: {str(e)}")
             self.send_error(500, f"Error generating insights: {str(e)}")
     
-    def handle_hourly_patterns(self):
+    def handle_hourly_patterns(self, params=None):
         """GET /api/hourly-patterns - Get hourly trip patterns"""
         try:
+            columns = self._trip_columns()
+            if columns is not None:
+                with self.timer.phase('processing'):
+                    patterns = columns.group_by(
+                        ('day_of_week', 'hour_of_day'),
+                        averages={'avg_distance': 'trip_distance_miles', 'avg_speed': 'avg_speed_mph'}
+                    )
+                    patterns = [{
+                        'hour_of_day': row['hour_of_day'],
+                        'day_of_week': row['day_of_week'],
+                        'trip_count': row['trip_count'],
+                        'avg_distance': row['avg_distance'],
+                        'avg_speed': row['avg_speed']
+                    } for row in patterns]
+                self._send_json_response({'success': True, 'data': patterns})
+                return
+            
             conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT 
-                    hour_of_day,
-                    day_of_week,
-                    COUNT(*) as trip_count,
-                    AVG(trip_distance_miles) as avg_distance,
-                    AVG(avg_speed_mph) as avg_speed
-                FROM trip_metrics
-                GROUP BY hour_of_day, day_of_week
-                ORDER BY day_of_week, hour_of_day
-            """)
-            
-            patterns = cursor.fetchall()
+            cursor = conn.cursor()
+            
+            patterns = storage.hourly_patterns(cursor)
             
             cursor.close()
             conn.close()
@@ -461,142 +1079,778 @@ class TaxiAPIHandler(http.server.BaseHTTPRequestHandler):
             print(f"Error in handle_hourly_patterns: {str(e)}")
             self.send_error(500, f"Error fetching patterns: {str(e)}")
     
-    def handle_top_routes(self, params):
-        """GET /api/top-routes - Get most frequent routes using custom algorithm"""
+    def handle_timeseries(self, params):
+        """
+        GET /api/timeseries - One point per non-empty pickup time bucket
+        Params: metric (trips, distance, duration or speed), granularity
+        (15m, hour, day or week), start and end (ISO dates or datetimes; end is exclusive)
+        """
         try:
-            limit = int(params.get('limit', [10])[0])
-            
+            metric = params.get('metric', ['trips'])[0]
+            granularity = params.get('granularity', ['day'])[0]
+            if metric not in TIMESERIES_METRICS:
+                raise ValueError("Invalid metric. Use: trips, distance, duration, or speed")
+            if granularity not in TIMESERIES_GRANULARITIES:
+                raise ValueError("Invalid granularity. Use: 15m, hour, day, or week")
+            
+            bounds = {}
+            for name in ('start', 'end'):
+                if name in params:
+                    value = datetime.datetime.fromisoformat(params[name][0])
+                    bounds[name] = value.strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        
+        try:
+            total_column = TIMESERIES_METRICS[metric]
             conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Fetch all routes
-            cursor.execute("""
-                SELECT 
-                    pickup_longitude,
-                    pickup_latitude,
-                    dropoff_longitude,
-                    dropoff_latitude
-                FROM trips
-                WHERE pickup_longitude IS NOT NULL 
-                  AND pickup_latitude IS NOT NULL
-                  AND dropoff_longitude IS NOT NULL
-                  AND dropoff_latitude IS NOT NULL
-            """)
-            
-            routes_data = cursor.fetchall()
+            cursor = conn.cursor()
+            
+            # One extra row tells whether the range was cut short
+            rows = storage.timeseries_buckets(cursor, granularity, bounds.get('start'), bounds.get('end'),
+                                              limit=TIMESERIES_MAX_POINTS + 1)
             
             cursor.close()
             conn.close()
             
-            # Use custom algorithm to count route frequencies
-            route_counter = RouteFrequencyCounter()
-            
-            for route in routes_data:
-                pickup = (float(route['pickup_longitude']), float(route['pickup_latitude']))
-                dropoff = (float(route['dropoff_longitude']), float(route['dropoff_latitude']))
-                route_counter.add_route(pickup, dropoff)
-            
-            # Get top routes
-            top_routes = route_counter.get_top_routes(limit)
-            
-            # Format response
-            formatted_routes = []
-            for route_key, frequency in top_routes:
-                pickup_coords, dropoff_coords = route_key
-                formatted_routes.append({
-                    'pickup_longitude': pickup_coords[0],
-                    'pickup_latitude': pickup_coords[1],
-                    'dropoff_longitude': dropoff_coords[0],
-                    'dropoff_latitude': dropoff_coords[1],
-                    'trip_count': frequency
+            truncated = len(rows) > TIMESERIES_MAX_POINTS
+            with self.timer.phase('processing'):
+                points = [{
+                    'bucket_start': row['bucket_start'],
+                    'trip_count': row['trip_count'],
+                    'value': row['trip_count'] if total_column is None
+                             else float(row[total_column]) / row['trip_count']
+                } for row in rows[:TIMESERIES_MAX_POINTS]]
+            
+            response = {
+                'success': True,
+                'metric': metric,
+                'granularity': granularity,
+                'start': bounds.get('start'),
+                'end': bounds.get('end'),
+                'data': points,
+                'truncated': truncated
+            }
+            
+            self._send_json_response(response)
+            
+        except Exception as e:
+            print(f"Error in handle_timeseries: {str(e)}")
+            self.send_error(500, f"Error fetching time series: {str(e)}")
+    
+    def handle_histogram(self, params):
+        """
+        GET /api/histogram - Trip counts per value bin of a metric
+        Params: metric (speed, distance or duration), bins (default 50),
+        range (low,high; default the matching trips' min and max),
+        scale (linear or log), plus the /api/trips filters
+        """
+        try:
+            metric = params.get('metric', ['distance'])[0]
+            if metric not in HISTOGRAM_METRICS:
+                raise ValueError("Invalid metric. Use: speed, distance, or duration")
+            bins = int(params.get('bins', [HISTOGRAM_DEFAULT_BINS])[0])
+            if not 1 <= bins <= HISTOGRAM_MAX_BINS:
+                raise ValueError(f"bins must be between 1 and {HISTOGRAM_MAX_BINS}")
+            scale = params.get('scale', ['linear'])[0]
+            if scale not in ('linear', 'log'):
+                raise ValueError("Invalid scale. Use: linear or log")
+            log = scale == 'log'
+            
+            value_range = None
+            if 'range' in params:
+                bounds = params['range'][0].split(',')
+                if len(bounds) != 2:
+                    raise ValueError("range must be low,high")
+                low, high = float(bounds[0]), float(bounds[1])
+                if not low < high:
+                    raise ValueError("range must be low,high with low < high")
+                if log and low <= 0:
+                    raise ValueError("log scale needs a positive range")
+                value_range = (low, high)
+            
+            filters = self._trip_filters(params)
+        except ValueError as e:
+            self.send_error(400, f"Invalid histogram parameters: {str(e)}")
+            return
+        
+        try:
+            columns = self._trip_columns()
+            if columns is not None:
+                with self.timer.phase('processing'):
+                    result = columns.histogram(HISTOGRAM_METRICS[metric], bins, value_range, log,
+                                               mask=columns.filter_mask(params))
+            else:
+                result = self._histogram_from_sql(metric, bins, value_range, log, filters)
+            
+            if result is None:
+                self._send_json_response({
+                    'success': False,
+                    'error': 'No data available for this metric and filters'
                 })
+                return
+            
+            low, high, counts = result
+            edges = histogram_edges(low, high, bins, log)
+            response = {
+                'success': True,
+                'metric': metric,
+                'scale': scale,
+                'bins': bins,
+                'low': low,
+                'high': high,
+                'total': sum(counts),
+                'data': [{'lower': edges[position], 'upper': edges[position + 1], 'count': count}
+                         for position, count in enumerate(counts)]
+            }
+            
+            self._send_json_response(response)
+            
+        except Exception as e:
+            print(f"Error in handle_histogram: {str(e)}")
+            self.send_error(500, f"Error computing histogram: {str(e)}")
+    
+    def _histogram_from_sql(self, metric, bins, value_range, log, filters):
+        """(low, high, counts) like TripColumns.histogram, grouped by bin in the database"""
+        conn = self.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if value_range is None:
+                low, high = storage.metric_range(cursor, metric, filters, positive=log)
+                if low is None:
+                    return None
+                value_range = (float(low), float(high))
+            low, high = value_range
+            
+            start, stop = (math.log(low), math.log(high)) if log else (low, high)
+            width = (stop - start) / bins or 1.0
+            rows = storage.histogram_bins(cursor, metric, filters, start, width, low, high, log)
+        finally:
+            cursor.close()
+            conn.close()
+        
+        if not rows:
+            return None
+        # The high edge (and float rounding at either end) lands in the outer bins
+        counts = [0] * bins
+        for position, count in rows:
+            counts[min(max(int(position), 0), bins - 1)] += count
+        return low, high, counts
+    
+    def handle_top_routes(self, params):
+        """
+        GET /api/top-routes - Get most frequent routes
+        Optional filters: hour (0-23), is_weekend (true/false)
+        """
+        try:
+            limit = int(params.get('limit', [10])[0])
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            hour = ALL_VALUES
+            if 'hour' in params:
+                hour = int(params['hour'][0])
+                if not 0 <= hour <= 23:
+                    self.send_error(400, "hour must be between 0 and 23")
+                    return
+            is_weekend = ALL_VALUES
+            if 'is_weekend' in params:
+                is_weekend = int(params['is_weekend'][0].lower() == 'true')
+            
+            if TOP_ROUTES_FROM_AGGREGATES:
+                formatted_routes, total_unique = self._top_routes_from_aggregates(limit, hour, is_weekend)
+                exact, error_bound = True, 0
+            else:
+                formatted_routes, total_unique, exact, error_bound = self._top_routes_by_scan(
+                    limit, hour, is_weekend
+                )
             
             response = {
                 'success': True,
                 'data': formatted_routes,
-                'total_unique_routes': route_counter.get_total_unique_routes()
+                'total_unique_routes': total_unique,
+                'exact': exact,
+                'error_bound': error_bound
             }
             
             self._send_json_response(response)
             
+        except ValueError:
+            self.send_error(400, "Invalid limit or hour")
         except Exception as e:
             print(f"Error in handle_top_routes: {str(e)}")
             self.send_error(500, f"Error calculating top routes: {str(e)}")
     
-    def handle_outliers(self, params):
-        """GET /api/outliers - Detect outliers using custom algorithm"""
+    def _top_routes_from_aggregates(self, limit, hour, is_weekend):
+        """Top routes as an index range read of route_counts"""
+        conn = self.get_db_connection()
+        cursor = conn.cursor()
         try:
-            metric = params.get('metric', ['speed'])[0]  # speed, distance, or duration
+            top_routes = storage.top_route_counts(cursor, hour, is_weekend, limit)
+            total_unique = storage.count_route_cells(cursor, hour, is_weekend)
+        finally:
+            cursor.close()
+            conn.close()
+        
+        formatted_routes = [{
+            'pickup_longitude': round(route['pickup_lon_cell'] * ROUTE_CELL_SIZE, 3),
+            'pickup_latitude': round(route['pickup_lat_cell'] * ROUTE_CELL_SIZE, 3),
+            'dropoff_longitude': round(route['dropoff_lon_cell'] * ROUTE_CELL_SIZE, 3),
+            'dropoff_latitude': round(route['dropoff_lat_cell'] * ROUTE_CELL_SIZE, 3),
+            'trip_count': route['trip_count'],
+            'trip_count_error': 0
+        } for route in top_routes]
+        return formatted_routes, total_unique
+    
+    def _top_routes_by_scan(self, limit, hour, is_weekend):
+        """Top routes counted from the trips table with RouteFrequencyCounter"""
+        conn = self.get_db_connection()
+        cursor = conn.cursor(buffered=False)
+        
+        # Stream the routes; the counter holds the counts, not the rows
+        storage.stream_routes(cursor, hour, is_weekend)
+        
+        # Use custom algorithm to count route frequencies
+        route_counter = RouteFrequencyCounter(capacity=TOP_ROUTES_CAPACITY)
+        while True:
+            routes_data = cursor.fetchmany(TOP_ROUTES_FETCH_SIZE)
+            if not routes_data:
+                break
+            with self.timer.phase('processing'):
+                for pickup_lon, pickup_lat, dropoff_lon, dropoff_lat in routes_data:
+                    route_counter.add_route((float(pickup_lon), float(pickup_lat)),
+                                            (float(dropoff_lon), float(dropoff_lat)))
+        
+        cursor.close()
+        conn.close()
+        
+        with self.timer.phase('processing'):
+            # Get top routes (heap selection, O(routes log limit))
+            top_routes = route_counter.get_top_routes_with_errors(limit)
+        
+        # Format response
+        formatted_routes = []
+        for route_key, frequency, error in top_routes:
+            pickup_coords, dropoff_coords = route_key
+            formatted_routes.append({
+                'pickup_longitude': pickup_coords[0],
+                'pickup_latitude': pickup_coords[1],
+                'dropoff_longitude': dropoff_coords[0],
+                'dropoff_latitude': dropoff_coords[1],
+                'trip_count': frequency,
+                'trip_count_error': error
+            })
+        
+        return (formatted_routes, route_counter.get_total_unique_routes(),
+                route_counter.is_exact(), route_counter.get_error_bound())
+    
+    def handle_heatmap(self, params):
+        """
+        GET /api/heatmap - Non-empty pickup/dropoff cells (map tiles) in a viewport
+        Params: zoom (10-17), bbox (west,south,east,north; default NYC),
+        hour (0-23, default all hours)
+        """
+        try:
+            zoom = int(params.get('zoom', [HEATMAP_DEFAULT_ZOOM])[0])
+            if not HEATMAP_MIN_ZOOM <= zoom <= HEATMAP_MAX_ZOOM:
+                raise ValueError(f"zoom must be between {HEATMAP_MIN_ZOOM} and {HEATMAP_MAX_ZOOM}")
+            bbox = HEATMAP_DEFAULT_BBOX
+            if 'bbox' in params:
+                bbox = tuple(float(value) for value in params['bbox'][0].split(','))
+                if len(bbox) != 4 or not (bbox[0] < bbox[2] and bbox[1] < bbox[3]):
+                    raise ValueError("bbox must be west,south,east,north")
+            hour = ALL_VALUES
+            if 'hour' in params:
+                hour = int(params['hour'][0])
+                if not 0 <= hour <= 23:
+                    raise ValueError("hour must be between 0 and 23")
+            
+            west, south, east, north = bbox
+            min_x, max_x = tile_x(west, zoom), tile_x(east, zoom)
+            min_y, max_y = tile_y(north, zoom), tile_y(south, zoom)
+            cell_count = (max_x - min_x + 1) * (max_y - min_y + 1)
+            if cell_count > HEATMAP_MAX_CELLS:
+                raise ValueError(f"bbox covers {cell_count:,} cells at zoom {zoom}; "
+                                 f"use a lower zoom or a smaller bbox")
+        except ValueError as e:
+            self.send_error(400, f"Invalid heatmap parameters: {str(e)}")
+            return
+        
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            
+            rows = storage.heatmap_cells(cursor, zoom, hour, (min_x, max_x), (min_y, max_y))
+            cells = [list(row) for row in rows]
             
+            cursor.close()
+            conn.close()
+            
+            response = {
+                'success': True,
+                'zoom': zoom,
+                'hour': None if hour == ALL_VALUES else hour,
+                'bbox': list(bbox),
+                'fields': ['x', 'y', 'pickup_count', 'dropoff_count'],
+                'cells': cells,
+                'max_pickup_count': max((cell[2] for cell in cells), default=0),
+                'max_dropoff_count': max((cell[3] for cell in cells), default=0)
+            }
+            
+            self._send_json_response(response)
+            
+        except Exception as e:
+            print(f"Error in handle_heatmap: {str(e)}")
+            self.send_error(500, f"Error fetching heatmap: {str(e)}")
+    
+    def handle_outliers(self, params):
+        """
+        GET /api/outliers - Trips flagged as IQR outliers, one page at a time
+        Params: metric (speed, distance, duration or any), limit, cursor
+        (next_cursor of the previous page)
+        """
+        metric = params.get('metric', ['speed'])[0]
+        if metric != 'any' and metric not in OUTLIER_FLAGS:
+            self.send_error(400, "Invalid metric. Use: speed, distance, duration, or any")
+            return
+        try:
+            limit = int(params.get('limit', [OUTLIER_PAGE_SIZE])[0])
+            if limit < 1:
+                raise ValueError("limit must be positive")
+        except ValueError as e:
+            self.send_error(400, f"Invalid limit: {str(e)}")
+            return
+        
+        # Every flag value with the metric's bit set; each is one range of the index
+        mask = sum(OUTLIER_FLAGS.values()) if metric == 'any' else OUTLIER_FLAGS[metric]
+        flag_values = [value for value in range(1, sum(OUTLIER_FLAGS.values()) + 1) if value & mask]
+        
+        cursor_key = f"outliers:{metric}"
+        after = None
+        if 'cursor' in params:
+            try:
+                last_flags, last_trip_id = decode_page_cursor(params['cursor'][0], cursor_key, 'ASC')
+                after = (int(last_flags), last_trip_id)
+            except (ValueError, TypeError) as e:
+                self.send_error(400, f"Invalid cursor: {str(e)}")
+                return
+        
+        try:
             conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Fetch metric data
-            if metric == 'speed':
-                cursor.execute("SELECT avg_speed_mph as value FROM trip_metrics WHERE avg_speed_mph IS NOT NULL")
-            elif metric == 'distance':
-                cursor.execute("SELECT trip_distance_miles as value FROM trip_metrics WHERE trip_distance_miles IS NOT NULL")
-            elif metric == 'duration':
-                cursor.execute("SELECT trip_duration as value FROM trips WHERE trip_duration IS NOT NULL")
-            else:
+            cursor = conn.cursor()
+            
+            metrics = list(OUTLIER_FLAGS) if metric == 'any' else [metric]
+            bounds = storage.outlier_bounds(cursor, metrics)
+            if len(bounds) < len(metrics):
                 cursor.close()
                 conn.close()
-                self.send_error(400, "Invalid metric. Use: speed, distance, or duration")
+                self._send_json_response({
+                    'success': False,
+                    'error': 'Outlier flags have not been computed; run data_processor.py --flag-outliers'
+                })
                 return
+            # NULL flagged_at: the flags are being rewritten (or that run failed) and
+            # may mix old and new bounds
+            if any(bound['flagged_at'] is None for bound in bounds.values()):
+                cursor.close()
+                conn.close()
+                self._send_json_response({
+                    'success': False,
+                    'error': 'Outlier flags are being recomputed; retry when data_processor.py '
+                             'finishes, or run it with --flag-outliers if it stopped'
+                })
+                return
+            
+            # Seek along (outlier_flags, trip_id); one extra row tells whether another page exists
+            columns, trips = storage.select_outlier_trips(cursor, flag_values, limit + 1, after)
+            has_more = len(trips) > limit
+            trips = trips[:limit]
+            
+            next_cursor = None
+            if has_more:
+                last_trip = trips[-1]
+                next_cursor = encode_page_cursor(cursor_key, 'ASC', last_trip[0],
+                                                 last_trip[columns.index('trip_id')])
+            
+            outlier_count = storage.count_outliers(cursor, flag_values)
             
-            data = cursor.fetchall()
             cursor.close()
             conn.close()
             
-            # Extract values and convert Decimal to float
-            values = [float(row['value']) for row in data if row['value'] is not None]
+            response = {
+                'success': True,
+                'metric': metric,
+                'flags': OUTLIER_FLAGS,
+                'bounds': bounds,
+                'outlier_count': outlier_count,
+                'data': row_encoder_for(columns).encode_rows(trips),
+                'limit': limit,
+                'has_more': has_more,
+                'next_cursor': next_cursor
+            }
+            
+            self._send_json_response(response)
+            
+        except Exception as e:
+            print(f"Error in handle_outliers: {str(e)}")
+            self.send_error(500, f"Error listing outliers: {str(e)}")
+    
+    def _metric_slice(self, params):
+        """
+        metric and {column: value} slice for the sketch endpoints; raises
+        ValueError with a message for the client
+        """
+        metric = params.get('metric', ['speed'])[0]
+        if metric not in SKETCH_METRICS:
+            raise ValueError("Invalid metric. Use: speed, distance, or duration")
+        slice_values = {}
+        for name, (column, maximum) in SKETCH_SLICE_PARAMS.items():
+            if name in params:
+                value = int(params[name][0])
+                if not 0 <= value <= maximum:
+                    raise ValueError(f"{name} must be between 0 and {maximum}")
+                slice_values[column] = value
+        return metric, slice_values
+    
+    def _metric_sketch(self, metric, slice_values):
+        """
+        The stored TDigest for a metric slice (None when it has no trips) and how
+        far the sketches lag the loaded trips (storage.sketch_lag)
+        """
+        conn = self.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            sketch = storage.metric_sketch(
+                cursor, metric,
+                *(slice_values.get(column, ALL_VALUES) for column, _ in SKETCH_SLICE_PARAMS.values())
+            )
+            lag = storage.sketch_lag(cursor)
+        finally:
+            cursor.close()
+            conn.close()
+        return (TDigest.from_bytes(sketch) if sketch else None), lag
+    
+    def _metric_values(self, metric, slice_values):
+        """Every value of a metric in a slice, as packed doubles (exact path)"""
+        conn = self.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            return storage.metric_values(cursor, metric, slice_values, OUTLIER_FETCH_SIZE)
+        finally:
+            cursor.close()
+            conn.close()
+    
+    @staticmethod
+    def _slice_description(slice_values):
+        return {name: slice_values.get(column) for name, (column, _) in SKETCH_SLICE_PARAMS.items()}
+    
+    def handle_percentiles(self, params):
+        """
+        GET /api/percentiles - Percentiles of a metric for a slice of trips
+        Params: metric, q (comma-separated fractions), hour, day_of_week, vendor_id,
+        exact (true selects from the raw values instead of reading the sketch)
+        """
+        try:
+            metric, slice_values = self._metric_slice(params)
+            fractions = DEFAULT_PERCENTILES
+            if 'q' in params:
+                fractions = [float(q) for q in params['q'][0].split(',') if q]
+                if not fractions or not all(0 <= q <= 1 for q in fractions):
+                    raise ValueError("q must be fractions between 0 and 1")
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        
+        try:
+            exact = params.get('exact', ['false'])[0].lower() == 'true'
+            if exact:
+                values = self._metric_values(metric, slice_values)
+                count = len(values)
+                with self.timer.phase('processing'):
+                    quantiles = Selection.quantiles(values, fractions) if count else []
+            else:
+                digest, lag = self._metric_sketch(metric, slice_values)
+                count = int(digest.count()) if digest else 0
+                with self.timer.phase('processing'):
+                    quantiles = [digest.quantile(q) for q in fractions] if count else []
             
-            if not values:
-                response = {
+            if not count:
+                self._send_json_response({
                     'success': False,
-                    'error': 'No data available for this metric'
-                }
-                self._send_json_response(response)
+                    'error': 'No data available for this slice'
+                })
                 return
             
-            # Use custom outlier detection algorithm
-            detector = OutlierDetector()
-            outlier_info = detector.detect_outliers(values, multiplier=1.5)
-            basic_stats = detector.calculate_statistics(values)
+            response = {
+                'success': True,
+                'metric': metric,
+                'slice': self._slice_description(slice_values),
+                'exact': exact,
+                'count': count,
+                'percentiles': [{'q': q, 'value': value} for q, value in zip(fractions, quantiles)]
+            }
+            if not exact:
+                # Sketch answers leave out trips loaded after the last sketch flush
+                response.update(lag)
+            
+            self._send_json_response(response)
             
+        except Exception as e:
+            print(f"Error in handle_percentiles: {str(e)}")
+            self.send_error(500, f"Error calculating percentiles: {str(e)}")
+    
+    def handle_outlier_bounds(self, params):
+        """
+        GET /api/outlier-bounds - IQR outlier bounds of a metric for a slice of trips
+        Params: metric, multiplier (default 1.5), hour, day_of_week, vendor_id, exact
+        """
+        try:
+            metric, slice_values = self._metric_slice(params)
+            multiplier = float(params.get('multiplier', [1.5])[0])
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        
+        try:
+            exact = params.get('exact', ['false'])[0].lower() == 'true'
+            if exact:
+                # Same quartile definition as /api/outliers
+                values = self._metric_values(metric, slice_values)
+                count = len(values)
+                with self.timer.phase('processing'):
+                    summary = OutlierDetector.five_number_summary(values) if count else None
+            else:
+                digest, lag = self._metric_sketch(metric, slice_values)
+                count = int(digest.count()) if digest else 0
+                summary = None
+                if count:
+                    summary = {
+                        'min': digest.minimum,
+                        'q1': digest.quantile(0.25),
+                        'median': digest.quantile(0.5),
+                        'q3': digest.quantile(0.75),
+                        'max': digest.maximum,
+                    }
+            
+            if not count:
+                self._send_json_response({
+                    'success': False,
+                    'error': 'No data available for this slice'
+                })
+                return
+            
+            iqr = summary['q3'] - summary['q1']
             response = {
                 'success': True,
                 'metric': metric,
-                'outlier_analysis': outlier_info,
-                'statistics': basic_stats
+                'slice': self._slice_description(slice_values),
+                'exact': exact,
+                'count': count,
+                'min': summary['min'],
+                'q1': summary['q1'],
+                'median': summary['median'],
+                'q3': summary['q3'],
+                'max': summary['max'],
+                'iqr': iqr,
+                'multiplier': multiplier,
+                'lower_bound': summary['q1'] - multiplier * iqr,
+                'upper_bound': summary['q3'] + multiplier * iqr
             }
+            if not exact:
+                response.update(lag)
             
             self._send_json_response(response)
             
         except Exception as e:
-            print(f"Error in handle_outliers: {str(e)}")
-            self.send_error(500, f"Error detecting outliers: {str(e)}")
+            print(f"Error in handle_outlier_bounds: {str(e)}")
+            self.send_error(500, f"Error calculating outlier bounds: {str(e)}")
+    
+    def handle_metrics(self, params=None):
+        """GET /api/metrics - Request metrics in Prometheus text format"""
+        body = metrics_registry.render().encode('utf-8')
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self._set_server_timing_header()
+        self._set_cors_headers()
+        self.end_headers()
+        self._write_body(body)
+    
+    def handle_batch(self):
+        """
+        POST /api/batch - Run several API requests in one round trip
+        Body: {"requests": [{"id": "stats", "path": "/api/statistics", "params": {...}}, ...]}
+        Sub-requests run concurrently on pooled connections; each part reports its own status.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > BATCH_MAX_BODY_BYTES:
+            self.send_error(413 if length > 0 else 400, "Invalid batch body size")
+            return
+        
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+            parts = body['requests']
+            if not isinstance(parts, list) or not parts:
+                raise ValueError("requests must be a non-empty list")
+            if len(parts) > BATCH_MAX_REQUESTS:
+                raise ValueError(f"at most {BATCH_MAX_REQUESTS} requests per batch")
+            
+            sub_requests = []
+            for index, part in enumerate(parts):
+                parsed = urllib.parse.urlparse(part['path'])
+                params = urllib.parse.parse_qs(parsed.query)
+                for key, value in (part.get('params') or {}).items():
+                    values = value if isinstance(value, list) else [value]
+                    params[key] = [str(v).lower() if isinstance(v, bool) else str(v) for v in values]
+                sub_requests.append((str(part.get('id', index)), parsed.path, params))
+            
+            if len({part_id for part_id, _, _ in sub_requests}) != len(sub_requests):
+                raise ValueError("request ids must be unique")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_error(400, f"Invalid batch request: {str(e)}")
+            return
+        
+        futures = [
+            (part_id, path, batch_executor.submit(self._run_batch_part, path, params))
+            for part_id, path, params in sub_requests
+        ]
+        
+        responses = {}
+        for part_id, path, future in futures:
+            status, part_body = future.result()
+            responses[part_id] = {'path': path, 'status': status, 'body': part_body}
+        
+        self._send_json_response({
+            'success': all(part['status'] == 200 for part in responses.values()),
+            'responses': responses
+        })
+    
+    def _run_batch_part(self, path, params):
+        """Execute one sub-request through its normal handler and capture the result"""
+        if path not in API_ROUTES or path in BATCH_EXCLUDED_ROUTES:
+            return 404, {'success': False, 'error': f"Endpoint not available in batch: {path}"}
+        
+        part = BatchPartHandler(self)
+        try:
+            getattr(part, API_ROUTES[path])(params)
+        except Exception as e:
+            print(f"Error in batch part {path}: {str(e)}")
+            part.send_error(500, f"Server error: {str(e)}")
+        
+        if part.status is None:
+            return 500, {'success': False, 'error': 'Handler produced no response'}
+        return part.status, part.body
     
     def log_message(self, format, *args):
         """Override to customize logging"""
         print(f"[{self.log_date_time_string()}] {format % args}")
 
 
+class BatchPartHandler(TaxiAPIHandler):
+    """
+    Handler used for one part of a batch request. It runs the regular handle_*
+    methods but captures their response instead of writing to a socket.
+    """
+    
+    def __init__(self, parent):
+        # No socket: only the request metadata handlers may look at is copied
+        self.headers = parent.headers
+        self.request_version = parent.request_version
+        self.client_address = parent.client_address
+        self.timer = parent.timer  # sub-requests count towards the batch request's phases
+        self.status = None
+        self.body = None
+    
+    def _send_json_response(self, data, status_code=200):
+        self.status = status_code
+        self.body = data
+    
+    def send_error(self, code, message=None, explain=None):
+        self.status = code
+        self.body = {'success': False, 'error': message or self.responses.get(code, ('',))[0]}
+
+
+class TaxiHTTPServer(socketserver.ThreadingTCPServer):
+    """Threaded server so long-running exports do not block other requests"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def enable_columnar_engine():
+    """
+    Create the columnar engine, unless NumPy is missing, and load its first
+    snapshot so no request waits on it
+    """
+    global columnar_engine
+    if not columnar.available():
+        print("Warning: NumPy not installed, columnar engine disabled")
+        return None
+    columnar_engine = ColumnarEngine(storage, refresh_interval=COLUMNAR_REFRESH_INTERVAL)
+    try:
+        columnar_engine.columns(db_pool.acquire)
+    except Exception as e:
+        print(f"Warning: columnar engine not loaded, the first request will retry: {str(e)}")
+    return columnar_engine
+
+
+def configure_storage(new_storage):
+    """Switch the server to another storage backend (used before serving requests)"""
+    global storage, db_pool, total_count_cache, columnar_engine
+    old_pool = db_pool
+    if columnar_engine is not None:
+        columnar_engine = ColumnarEngine(new_storage, refresh_interval=columnar_engine.refresh_interval)
+    storage = new_storage
+    db_pool = ConnectionPool(storage.connect_reader, DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+    query_executor.pool = slow_query_log.pool = db_pool
+    slow_query_log.storage = storage
+    total_count_cache = TotalCountCache()
+    old_pool.close_all()
+
+
 def run_server():
     """Start the HTTP server"""
     try:
-        with socketserver.TCPServer((SERVER_HOST, SERVER_PORT), TaxiAPIHandler) as httpd:
+        serialization.set_backend(JSON_BACKEND)
+        storage.initialize_schema()
+        if COLUMNAR_ENGINE:
+            enable_columnar_engine()
+        
+        # Load frontend assets into memory before accepting requests
+        static_assets.load()
+        if STATIC_RELOAD:
+            static_assets.start_reloader()
+        
+        if SLOW_QUERY_THRESHOLD is not None:
+            slow_query_log.start()
+        
+        with TaxiHTTPServer((SERVER_HOST, SERVER_PORT), TaxiAPIHandler) as httpd:
             print("Backend Server")
             print(f"Server running on http://{SERVER_HOST}:{SERVER_PORT}")
             print(f"Frontend: http://{SERVER_HOST}:{SERVER_PORT}")
             print(f"API Base: http://{SERVER_HOST}:{SERVER_PORT}/api")
+            print(f"Storage: {storage.name}" + (f" ({storage.path})" if storage.name == 'sqlite' else ""))
             print("\nAvailable Endpoints:")
             print("  GET  /api/trips          - Fetch trip data with filters")
+            print("  GET  /api/trips/export   - Stream filtered trips as NDJSON or CSV")
             print("  GET  /api/statistics     - Overall statistics")
             print("  GET  /api/insights       - Analytical insights")
+            print("  GET  /api/dashboard      - Statistics and insights in one scan")
             print("  GET  /api/hourly-patterns - Hourly trip patterns")
+            print("  GET  /api/timeseries     - Trips or averages per 15m/hour/day/week")
+            print("  GET  /api/histogram      - Binned speed, distance or duration counts")
+            print("  GET  /api/heatmap        - Pickup/dropoff density cells in a viewport")
             print("  GET  /api/top-routes     - Most frequent routes")
-            print("  GET  /api/outliers       - Outlier detection")
+            print("  GET  /api/outliers       - Trips flagged as outliers (paginated)")
+            print("  GET  /api/percentiles    - Metric percentiles per hour/day/vendor slice")
+            print("  GET  /api/outlier-bounds - IQR outlier bounds per hour/day/vendor slice")
+            print("  POST /api/batch          - Several API requests in one round trip")
+            print("  GET  /api/metrics        - Prometheus metrics")
+            if SLOW_QUERY_THRESHOLD is not None:
+                print(f"\nLogging queries slower than {SLOW_QUERY_THRESHOLD}s to {SLOW_QUERY_LOG_PATH}")
             print("\nPress Ctrl+C to stop the server")
             print("\n")
             
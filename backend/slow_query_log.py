@@ -0,0 +1,227 @@
+"""
+Slow query log for SQL run by the API server
+
+Statements slower than a threshold are written as one JSON object per line to a
+size-rotated log file. Each entry holds the normalized query shape (literals and
+placeholders replaced by ?), the bound parameters, duration, rows returned and an
+EXPLAIN FORMAT=JSON plan (EXPLAIN QUERY PLAN rows on SQLite). Plans are captured on a background thread so requests
+are not held up by the extra round trip.
+
+Rank the logged query shapes by total time with:
+
+    python backend/slow_query_log.py [log_file]
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from profiling import explain
+
+
+DEFAULT_LOG_PATH = Path(__file__).resolve().parent / 'logs' / 'slow_queries.log'
+
+# Query shape normalization
+_HINT = re.compile(r"/\*\+.*?\*/")
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape so different parameter values group together"""
+    shape = _HINT.sub('', str(sql))
+    shape = _STRING.sub('?', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return ' '.join(shape.split())
+
+
+class SlowQueryLog:
+    """Writes statements slower than threshold seconds to a rotating NDJSON log"""
+
+    def __init__(self, path=DEFAULT_LOG_PATH, threshold=0.5, max_bytes=10 * 1024 * 1024,
+                 backup_count=5, pool=None, storage=None):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.pool = pool  # connections and backend for EXPLAIN; None skips plan capture
+        self.storage = storage
+        self._queue = queue.Queue(maxsize=1000)
+        self._logger = None
+        self._worker = None
+
+    def start(self):
+        """Open the log file and start the background writer"""
+        if self._worker is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._logger = logging.getLogger(f"slow_query_log.{self.path}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.handlers = [handler]
+
+        self._worker = threading.Thread(target=self._write_entries, name='slow-query-log', daemon=True)
+        self._worker.start()
+
+    def record(self, sql, params, seconds, rows, route=None):
+        """Queue a statement for logging if it exceeded the threshold"""
+        if self._worker is None or self.threshold is None or seconds < self.threshold:
+            return
+        try:
+            self._queue.put_nowait((time.time(), sql, params, seconds, rows, route))
+        except queue.Full:
+            pass  # never slow down requests because the log is backed up
+
+    def record_timer(self, timer, route=None):
+        """Log the slow statements recorded by a RequestTimer"""
+        for statement in list(timer.statements):
+            self.record(statement['sql'], statement['params'], statement['seconds'], statement['rows'], route)
+
+    def _write_entries(self):
+        while True:
+            logged_at, sql, params, seconds, rows, route = self._queue.get()
+            plan = None
+            if self.pool is not None and self.storage is not None:
+                plan = explain(self.storage, self.pool, sql, params, plan_format='JSON')
+            if isinstance(plan, str):
+                try:
+                    plan = json.loads(plan)
+                except ValueError:
+                    pass
+
+            entry = {
+                'time': datetime.fromtimestamp(logged_at).isoformat(timespec='milliseconds'),
+                'route': route,
+                'shape': normalize_sql(sql),
+                'sql': ' '.join(str(sql).split()),
+                'params': list(params) if params else [],
+                'duration_ms': round(seconds * 1000, 3),
+                'rows': rows,
+                'explain': plan,
+            }
+            try:
+                self._logger.info(json.dumps(entry, default=str))
+            except Exception as e:
+                print(f"Error writing slow query log: {str(e)}")
+
+
+def _plan_warnings(plan):
+    """
+    Collect full scans, filesorts and temporary tables from a MySQL
+    EXPLAIN FORMAT=JSON plan or SQLite EXPLAIN QUERY PLAN rows
+    """
+    warnings = set()
+
+    def visit(node):
+        if isinstance(node, dict):
+            detail = node.get('detail')
+            if isinstance(detail, str):
+                if detail.startswith('SCAN ') and ' USING ' not in detail:
+                    warnings.add(f"full scan of {detail.split()[1]}")
+                if 'TEMP B-TREE' in detail:
+                    warnings.add('temporary b-tree')
+            if node.get('access_type') == 'ALL':
+                warnings.add(f"full scan of {node.get('table_name', '?')}")
+            if node.get('using_filesort'):
+                warnings.add('filesort')
+            if node.get('using_temporary_table'):
+                warnings.add('temporary table')
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                visit(value)
+
+    visit(plan)
+    return sorted(warnings)
+
+
+def read_entries(path=DEFAULT_LOG_PATH):
+    """Yield entries from the log file and its rotated backups, oldest first"""
+    path = Path(path)
+    files = sorted(path.parent.glob(path.name + '.*'),
+                   key=lambda p: int(p.suffix[1:]) if p.suffix[1:].isdigit() else 0, reverse=True)
+    for log_file in files + [path]:
+        if not log_file.exists():
+            continue
+        with open(log_file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def aggregate(entries):
+    """Group entries by query shape, ranked by total time spent"""
+    shapes = {}
+    for entry in entries:
+        shape = shapes.get(entry['shape'])
+        if shape is None:
+            shape = shapes[entry['shape']] = {
+                'shape': entry['shape'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'total_rows': 0,
+                'routes': set(),
+                'warnings': set(),
+            }
+        shape['count'] += 1
+        shape['total_ms'] += entry['duration_ms']
+        shape['max_ms'] = max(shape['max_ms'], entry['duration_ms'])
+        shape['total_rows'] += entry.get('rows') or 0
+        if entry.get('route'):
+            shape['routes'].add(entry['route'])
+        shape['warnings'].update(_plan_warnings(entry.get('explain')))
+
+    report = []
+    for shape in shapes.values():
+        shape['avg_ms'] = shape['total_ms'] / shape['count']
+        shape['avg_rows'] = shape['total_rows'] / shape['count']
+        shape['routes'] = sorted(shape['routes'])
+        shape['warnings'] = sorted(shape['warnings'])
+        report.append(shape)
+
+    report.sort(key=lambda shape: shape['total_ms'], reverse=True)
+    return report
+
+
+def print_report(path=DEFAULT_LOG_PATH, limit=20):
+    """Print the slowest query shapes with the plan problems seen for each"""
+    report = aggregate(read_entries(path))
+    if not report:
+        print(f"No slow queries logged in {path}")
+        return
+
+    print("=" * 60)
+    print("SLOW QUERY REPORT")
+    print("=" * 60)
+    for rank, shape in enumerate(report[:limit], start=1):
+        print(f"\n{rank}. total {shape['total_ms'] / 1000:.2f}s over {shape['count']} runs "
+              f"(avg {shape['avg_ms']:.1f}ms, max {shape['max_ms']:.1f}ms, avg rows {shape['avg_rows']:.0f})")
+        if shape['routes']:
+            print(f"   routes: {', '.join(shape['routes'])}")
+        if shape['warnings']:
+            print(f"   plan: {', '.join(shape['warnings'])}")
+        print(f"   {shape['shape']}")
+
+
+if __name__ == "__main__":
+    print_report(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG_PATH)
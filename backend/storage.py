@@ -0,0 +1,1007 @@
+"""
+Storage backends for the trip database
+
+The server and DataProcessor talk to the database through a Storage object: it
+creates connections and owns the SQL, both the statements that write data and
+the reads behind every API endpoint. Handlers pass a cursor and plain values
+(filters, slices, limits) and get rows back; they never build SQL themselves.
+Statements that both dialects run as written live on Storage, and each backend
+overrides the ones whose SQL differs, so a dialect's SQL is all in one class.
+Both backends use the same schema (schema.sql / schema_sqlite.sql) and hand out
+connections with the mysql.connector cursor API (%s placeholders, column_names,
+fetchmany).
+
+- MySQLStorage: the MySQL server in DB_CONFIG
+- SQLiteStorage: an embedded database file, for single-node deployments and for
+  benchmarks and tests that should not need a database server
+"""
+
+import math
+import sqlite3
+from array import array
+from decimal import Decimal
+from pathlib import Path
+
+from serialization import TaxiConverter
+
+
+SQLITE_SCHEMA_PATH = Path(__file__).resolve().parent.parent / 'schema_sqlite.sql'
+SQLITE_BUSY_TIMEOUT = 30  # seconds a connection waits for another writer's lock
+
+STORAGE_BACKENDS = ('mysql', 'sqlite')
+
+ALL_VALUES = -1  # slice column value of the pre-aggregated rows that count every hour/day/vendor
+
+TRIP_TABLES = "trips t INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id"
+
+# Tables DataProcessor.rebuild_aggregates recomputes from the trips
+AGGREGATE_TABLES = ('route_counts', 'timeseries_buckets', 'heatmap_cells', 'metric_sketches')
+
+# Columns returned for each trip by /api/trips, /api/trips/export and /api/outliers
+TRIP_COLUMNS = """
+    t.trip_id,
+    t.vendor_id,
+    t.pickup_datetime,
+    t.dropoff_datetime,
+    t.passenger_count,
+    t.pickup_longitude,
+    t.pickup_latitude,
+    t.dropoff_longitude,
+    t.dropoff_latitude,
+    t.trip_duration,
+    tm.trip_distance_miles,
+    tm.avg_speed_mph,
+    tm.trip_efficiency,
+    tm.hour_of_day,
+    tm.day_of_week,
+    tm.is_weekend,
+    tm.time_period,
+    tm.distance_category,
+    tm.duration_category,
+    tm.pickup_zone_id,
+    tm.dropoff_zone_id
+"""
+
+# Trip filter name -> WHERE condition on TRIP_TABLES, with one bound value
+TRIP_FILTER_CONDITIONS = {
+    'min_distance': "tm.trip_distance_miles >= %s",
+    'max_distance': "tm.trip_distance_miles <= %s",
+    'min_duration': "t.trip_duration >= %s",
+    'max_duration': "t.trip_duration <= %s",
+    'vendor_id': "t.vendor_id = %s",
+    'hour': "tm.hour_of_day = %s",
+    'day_of_week': "tm.day_of_week = %s",
+    'is_weekend': "tm.is_weekend = %s",
+    'pickup_zone_id': "tm.pickup_zone_id = %s",
+    'dropoff_zone_id': "tm.dropoff_zone_id = %s",
+}
+
+# Trip sort field -> (column, tie-breaking trip_id). The trip_id comes from the
+# sort column's own table, so ORDER BY and the keyset seek walk that table's
+# (column, trip_id) index instead of sorting the join result
+TRIP_SORT_COLUMNS = {
+    'distance': ('tm.trip_distance_miles', 'tm.trip_id'),
+    'duration': ('t.trip_duration', 't.trip_id'),
+    'speed': ('tm.avg_speed_mph', 'tm.trip_id'),
+    'pickup_datetime': ('t.pickup_datetime', 't.trip_id'),
+}
+
+# Metric -> value column, for histograms and exact percentiles
+METRIC_COLUMNS = {
+    'speed': 'tm.avg_speed_mph',
+    'distance': 'tm.trip_distance_miles',
+    'duration': 't.trip_duration',
+}
+
+# Metric -> value in a single-table UPDATE of trip_metrics (SQLiteStorage.update_outlier_flags)
+SQLITE_OUTLIER_COLUMNS = {
+    'speed': 'avg_speed_mph',
+    'distance': 'trip_distance_miles',
+    'duration': '(SELECT t.trip_duration FROM trips t WHERE t.trip_id = trip_metrics.trip_id)',
+}
+
+# Metric slice column -> qualified column (vendor_id lives on trips)
+SLICE_COLUMNS = {
+    'hour_of_day': 'tm.hour_of_day',
+    'day_of_week': 'tm.day_of_week',
+    'vendor_id': 't.vendor_id',
+}
+
+
+def _outlier_flags(columns, flags, bounds):
+    """
+    outlier_flags expression and its values: the bit of every metric whose value
+    (columns[metric]) is outside [lower, upper], the same rule as OutlierDetector
+    """
+    expression = " + ".join(
+        f"CASE WHEN {columns[metric]} NOT BETWEEN %s AND %s THEN {bit} ELSE 0 END"
+        for metric, bit in flags.items()
+    )
+    return expression, [bound for metric in flags for bound in bounds[metric]]
+
+
+def _trip_conditions(filters):
+    """WHERE conditions and bound values for a {filter name: value} dict"""
+    return [TRIP_FILTER_CONDITIONS[name] for name in filters], list(filters.values())
+
+
+def _where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _records(cursor):
+    """Every remaining row of cursor as a {column: value} dict"""
+    columns = cursor.column_names
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class Storage:
+    """Connection factory plus the statements shared by both backends"""
+
+    name = None
+    Error = Exception  # the backend's base database error
+
+    def connect(self):
+        raise NotImplementedError
+
+    def connect_reader(self):
+        """
+        Connection for the API server's read pool; its rows may come back in
+        JSON-ready types. DataProcessor and other writers use connect().
+        """
+        return self.connect()
+
+    def initialize_schema(self):
+        """Create tables and indexes if the backend can do so itself"""
+
+    def explain(self, cursor, sql, params, plan_format=None):
+        """Return the query plan for a statement"""
+        raise NotImplementedError
+
+    def insert_trips(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO trips (trip_id, vendor_id, pickup_datetime, dropoff_datetime,
+               passenger_count, pickup_longitude, pickup_latitude, dropoff_longitude,
+               dropoff_latitude, store_and_fwd_flag, trip_duration)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            rows
+        )
+
+    def insert_trip_metrics(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO trip_metrics (trip_id, trip_distance_miles, avg_speed_mph,
+               trip_efficiency, hour_of_day, day_of_week, day_of_month, month_of_year,
+               is_weekend, time_period, distance_category, duration_category, speed_category,
+               pickup_zone_id, dropoff_zone_id)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+            rows
+        )
+
+    def upsert_route_counts(self, cursor, rows):
+        """
+        Add (hour_of_day, is_weekend, pickup_lon_cell, pickup_lat_cell,
+        dropoff_lon_cell, dropoff_lat_cell, trip_count) rows to route_counts,
+        summing trip_count into rows that already exist
+        """
+        raise NotImplementedError
+
+    def upsert_metric_sketches(self, cursor, rows):
+        """
+        Write (metric, hour_of_day, day_of_week, vendor_id, sketch) rows to
+        metric_sketches, replacing the sketch of rows that already exist
+        """
+        raise NotImplementedError
+
+    def upsert_sketch_watermark(self, cursor, last_metric_id):
+        """Record that metric_sketches covers every trip up to last_metric_id"""
+        raise NotImplementedError
+
+    def bump_dataset_generation(self, cursor):
+        """Increment dataset_generation (creating it at 1); caller commits"""
+        raise NotImplementedError
+
+    def dataset_generation(self, cursor):
+        """Current dataset_generation, 0 before data_processor.py first bumped it"""
+        cursor.execute("SELECT generation FROM dataset_generation WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def upsert_timeseries_buckets(self, cursor, rows):
+        """
+        Add (granularity, bucket_start, trip_count, total_distance, total_duration,
+        total_speed) rows to timeseries_buckets, summing into rows that already exist
+        """
+        raise NotImplementedError
+
+    def upsert_heatmap_cells(self, cursor, rows):
+        """
+        Add (zoom, hour_of_day, cell_x, cell_y, pickup_count, dropoff_count) rows
+        to heatmap_cells, summing the counts into rows that already exist
+        """
+        raise NotImplementedError
+
+    def update_outlier_flags(self, cursor, flags, bounds, first_id, end_id):
+        """
+        Rewrite trip_metrics.outlier_flags for first_id <= metric_id < end_id from
+        {metric: bit} flags and {metric: (lower_bound, upper_bound)} bounds
+        """
+        raise NotImplementedError
+
+    def replace_zones(self, cursor, rows):
+        """Replace the zones table with (zone_id, zone, borough) rows"""
+        cursor.execute("DELETE FROM zones")
+        cursor.executemany(
+            "INSERT INTO zones (zone_id, zone, borough) VALUES (%s, %s, %s)",
+            rows
+        )
+
+    def replace_outlier_bounds(self, cursor, rows):
+        """
+        Replace outlier_bounds with (metric, q1, q3, lower_bound, upper_bound,
+        trip_count) rows; flagged_at stays NULL until mark_outlier_flags_applied
+        """
+        cursor.execute("DELETE FROM outlier_bounds")
+        cursor.executemany(
+            """INSERT INTO outlier_bounds (metric, q1, q3, lower_bound, upper_bound, trip_count)
+               VALUES (%s, %s, %s, %s, %s, %s)""",
+            rows
+        )
+
+    def mark_outlier_flags_applied(self, cursor):
+        """Record that trip_metrics.outlier_flags now match outlier_bounds"""
+        cursor.execute("UPDATE outlier_bounds SET flagged_at = CURRENT_TIMESTAMP")
+
+    def clear_outlier_flags(self, cursor):
+        """Zero every trip's outlier_flags and delete the bounds behind them"""
+        cursor.execute("UPDATE trip_metrics SET outlier_flags = 0 WHERE outlier_flags <> 0")
+        cursor.execute("DELETE FROM outlier_bounds")
+
+    def clear_aggregates(self, cursor):
+        """Empty the AGGREGATE_TABLES before they are rebuilt"""
+        for table in AGGREGATE_TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+
+    def insert_quality_issues(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO data_quality_log (record_id, issue_type, issue_description,
+               field_name, original_value)
+               VALUES (%s, %s, %s, %s, %s)""",
+            rows
+        )
+
+    # Reads. Every method takes a plain (tuple) cursor; the ones returning
+    # records give {column: value} dicts, the stream_* ones only execute and
+    # leave the rows to cursor.fetchmany().
+
+    def select_trips(self, cursor, filters, sort_by, order, limit, offset=0, after=None):
+        """
+        A page of TRIP_COLUMNS rows ordered by sort_by (a TRIP_SORT_COLUMNS key)
+        and trip_id, order 'ASC' or 'DESC'. after = (sort value, trip_id) of the
+        previous page's last row seeks past it instead of skipping offset rows.
+        Returns (column names, rows).
+        """
+        sort_column, tie_column = TRIP_SORT_COLUMNS[sort_by]
+        conditions, params = _trip_conditions(filters)
+        if after is not None:
+            comparison = '<' if order == 'DESC' else '>'
+            conditions.append(
+                f"{sort_column} {comparison}= %s AND "
+                f"({sort_column} {comparison} %s OR {tie_column} {comparison} %s)"
+            )
+            params.extend([after[0], after[0], after[1]])
+        cursor.execute(f"""
+            SELECT {TRIP_COLUMNS}
+            FROM {TRIP_TABLES}
+            {_where(conditions)}
+            ORDER BY {sort_column} {order}, {tie_column} {order}
+            LIMIT %s OFFSET %s
+        """, params + [limit, offset])
+        return cursor.column_names, cursor.fetchall()
+
+    def count_trips(self, cursor, filters):
+        """Number of trips matching filters"""
+        if not filters:
+            # Every loaded trip has exactly one metrics row, so the narrow table is enough
+            cursor.execute("SELECT COUNT(*) FROM trip_metrics")
+        else:
+            conditions, params = _trip_conditions(filters)
+            cursor.execute(f"SELECT COUNT(*) FROM {TRIP_TABLES} {_where(conditions)}", params)
+        return cursor.fetchone()[0]
+
+    def stream_trips(self, cursor, filters, sort_by=None, order='DESC'):
+        """Execute the export of every matching trip; without sort_by rows come in storage order"""
+        conditions, params = _trip_conditions(filters)
+        order_clause = ""
+        if sort_by is not None:
+            sort_column, tie_column = TRIP_SORT_COLUMNS[sort_by]
+            order_clause = f"ORDER BY {sort_column} {order}, {tie_column} {order}"
+        cursor.execute(f"""
+            SELECT {TRIP_COLUMNS}
+            FROM {TRIP_TABLES}
+            {_where(conditions)}
+            {order_clause}
+        """, params)
+
+    def overall_statistics(self, cursor):
+        cursor.execute(f"""
+            SELECT
+                COUNT(*) as total_trips,
+                AVG(tm.trip_distance_miles) as avg_distance,
+                AVG(tm.avg_speed_mph) as avg_speed,
+                AVG(t.trip_duration) as avg_duration,
+                AVG(t.passenger_count) as avg_passengers,
+                SUM(tm.trip_distance_miles) as total_distance,
+                MIN(t.pickup_datetime) as earliest_trip,
+                MAX(t.pickup_datetime) as latest_trip
+            FROM {TRIP_TABLES}
+        """)
+        records = _records(cursor)
+        return records[0] if records else None
+
+    def vendor_statistics(self, cursor):
+        cursor.execute(f"""
+            SELECT
+                vendor_id,
+                COUNT(*) as trip_count,
+                AVG(tm.trip_distance_miles) as avg_distance,
+                AVG(tm.avg_speed_mph) as avg_speed
+            FROM {TRIP_TABLES}
+            GROUP BY vendor_id
+        """)
+        return _records(cursor)
+
+    def time_period_counts(self, cursor):
+        cursor.execute("""
+            SELECT
+                time_period,
+                COUNT(*) as trip_count
+            FROM trip_metrics
+            GROUP BY time_period
+            ORDER BY trip_count DESC
+        """)
+        return _records(cursor)
+
+    def distance_category_counts(self, cursor):
+        """Trips per distance_category, shortest category first"""
+        raise NotImplementedError
+
+    def dashboard_cells(self, cursor):
+        """
+        Counts, sums and pickup range per (vendor, hour, weekend, time period,
+        distance category): every /api/statistics and /api/insights grouping
+        rolls up from these cells
+        """
+        cursor.execute(f"""
+            SELECT
+                t.vendor_id,
+                tm.hour_of_day,
+                tm.is_weekend,
+                tm.time_period,
+                tm.distance_category,
+                COUNT(*) as trip_count,
+                SUM(tm.trip_distance_miles) as sum_distance,
+                SUM(tm.avg_speed_mph) as sum_speed,
+                SUM(t.trip_duration) as sum_duration,
+                SUM(t.passenger_count) as sum_passengers,
+                SUM(tm.trip_efficiency) as sum_efficiency,
+                MIN(t.pickup_datetime) as earliest_trip,
+                MAX(t.pickup_datetime) as latest_trip
+            FROM {TRIP_TABLES}
+            GROUP BY t.vendor_id, tm.hour_of_day, tm.is_weekend, tm.time_period, tm.distance_category
+        """)
+        return _records(cursor)
+
+    def hourly_statistics(self, cursor):
+        cursor.execute("""
+            SELECT
+                hour_of_day,
+                COUNT(*) as trip_count,
+                AVG(trip_distance_miles) as avg_distance,
+                AVG(avg_speed_mph) as avg_speed
+            FROM trip_metrics
+            GROUP BY hour_of_day
+            ORDER BY hour_of_day
+        """)
+        return _records(cursor)
+
+    def weekend_statistics(self, cursor):
+        cursor.execute("""
+            SELECT
+                is_weekend,
+                COUNT(*) as trip_count,
+                AVG(trip_distance_miles) as avg_distance,
+                AVG(avg_speed_mph) as avg_speed,
+                AVG(trip_efficiency) as avg_efficiency
+            FROM trip_metrics
+            GROUP BY is_weekend
+        """)
+        return _records(cursor)
+
+    def time_period_speeds(self, cursor):
+        cursor.execute("""
+            SELECT
+                time_period,
+                AVG(avg_speed_mph) as avg_speed,
+                COUNT(*) as trip_count
+            FROM trip_metrics
+            GROUP BY time_period
+            ORDER BY avg_speed DESC
+        """)
+        return _records(cursor)
+
+    def hourly_patterns(self, cursor):
+        """Trip count and averages per (hour_of_day, day_of_week)"""
+        cursor.execute("""
+            SELECT
+                hour_of_day,
+                day_of_week,
+                COUNT(*) as trip_count,
+                AVG(trip_distance_miles) as avg_distance,
+                AVG(avg_speed_mph) as avg_speed
+            FROM trip_metrics
+            GROUP BY hour_of_day, day_of_week
+            ORDER BY day_of_week, hour_of_day
+        """)
+        return _records(cursor)
+
+    def timeseries_buckets(self, cursor, granularity, start=None, end=None, limit=None):
+        """
+        timeseries_buckets records of a granularity in bucket_start order,
+        start inclusive and end exclusive ('YYYY-MM-DD HH:MM:SS' or None)
+        """
+        conditions = ["granularity = %s"]
+        params = [granularity]
+        if start is not None:
+            conditions.append("bucket_start >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("bucket_start < %s")
+            params.append(end)
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT %s"
+            params.append(limit)
+        # A primary key range read
+        cursor.execute(f"""
+            SELECT bucket_start, trip_count, total_distance, total_duration, total_speed
+            FROM timeseries_buckets
+            {_where(conditions)}
+            ORDER BY bucket_start
+            {limit_clause}
+        """, params)
+        return _records(cursor)
+
+    @staticmethod
+    def _metric_tables(column, filters):
+        # Only join when a filter needs the other table
+        if filters:
+            return TRIP_TABLES
+        return "trips t" if column.startswith('t.') else "trip_metrics tm"
+
+    def metric_range(self, cursor, metric, filters, positive=False):
+        """(min, max) of a metric over the trips matching filters; (None, None) without any"""
+        column = METRIC_COLUMNS[metric]
+        conditions, params = _trip_conditions(filters)
+        if positive:
+            conditions.append(f"{column} > 0")
+        cursor.execute(
+            f"SELECT MIN({column}), MAX({column}) FROM {self._metric_tables(column, filters)} {_where(conditions)}",
+            params
+        )
+        return tuple(cursor.fetchone())
+
+    def _bin_number(self, expression):
+        """SQL for the bin of a value; expression is never negative beyond float rounding"""
+        raise NotImplementedError
+
+    def histogram_bins(self, cursor, metric, filters, start, width, low, high, log=False):
+        """
+        (bin, count) rows for the matching trips with low <= value <= high, where
+        bin = floor((value - start) / width), of LN(value) when log is set
+        """
+        column = METRIC_COLUMNS[metric]
+        conditions, params = _trip_conditions(filters)
+        if log:
+            conditions.append(f"{column} > 0")
+        conditions.append(f"{column} BETWEEN %s AND %s")
+        expression = f"LN({column})" if log else column
+        cursor.execute(f"""
+            SELECT {self._bin_number(f"({expression} - %s) / %s")} AS bin, COUNT(*)
+            FROM {self._metric_tables(column, filters)}
+            {_where(conditions)}
+            GROUP BY bin
+        """, [start, width] + params + [low, high])
+        return cursor.fetchall()
+
+    def top_route_counts(self, cursor, hour, is_weekend, limit):
+        """The limit busiest route_counts records of a slice (ALL_VALUES = any), an index range read"""
+        cursor.execute("""
+            SELECT pickup_lon_cell, pickup_lat_cell, dropoff_lon_cell, dropoff_lat_cell, trip_count
+            FROM route_counts
+            WHERE hour_of_day = %s AND is_weekend = %s
+            ORDER BY trip_count DESC
+            LIMIT %s
+        """, (hour, is_weekend, limit))
+        return _records(cursor)
+
+    def count_route_cells(self, cursor, hour, is_weekend):
+        """Number of distinct routes in a route_counts slice"""
+        cursor.execute(
+            "SELECT COUNT(*) FROM route_counts WHERE hour_of_day = %s AND is_weekend = %s",
+            (hour, is_weekend)
+        )
+        return cursor.fetchone()[0]
+
+    def stream_routes(self, cursor, hour=ALL_VALUES, is_weekend=ALL_VALUES):
+        """Execute a read of (pickup_lon, pickup_lat, dropoff_lon, dropoff_lat) for trips in a slice"""
+        conditions = [
+            "t.pickup_longitude IS NOT NULL",
+            "t.pickup_latitude IS NOT NULL",
+            "t.dropoff_longitude IS NOT NULL",
+            "t.dropoff_latitude IS NOT NULL",
+        ]
+        params = []
+        tables = "trips t"
+        if hour != ALL_VALUES or is_weekend != ALL_VALUES:
+            tables = TRIP_TABLES
+            if hour != ALL_VALUES:
+                conditions.append("tm.hour_of_day = %s")
+                params.append(hour)
+            if is_weekend != ALL_VALUES:
+                conditions.append("tm.is_weekend = %s")
+                params.append(is_weekend)
+        cursor.execute(f"""
+            SELECT
+                t.pickup_longitude,
+                t.pickup_latitude,
+                t.dropoff_longitude,
+                t.dropoff_latitude
+            FROM {tables}
+            {_where(conditions)}
+        """, params)
+
+    def heatmap_cells(self, cursor, zoom, hour, x_range, y_range):
+        """(cell_x, cell_y, pickup_count, dropoff_count) rows of a (zoom, hour) viewport"""
+        cursor.execute("""
+            SELECT cell_x, cell_y, pickup_count, dropoff_count
+            FROM heatmap_cells
+            WHERE zoom = %s AND hour_of_day = %s
+              AND cell_x BETWEEN %s AND %s
+              AND cell_y BETWEEN %s AND %s
+        """, (zoom, hour) + tuple(x_range) + tuple(y_range))
+        return cursor.fetchall()
+
+    def outlier_bounds(self, cursor, metrics):
+        """{metric: outlier_bounds record} for the metrics that have stored bounds"""
+        cursor.execute(f"""
+            SELECT metric, q1, q3, lower_bound, upper_bound, trip_count, computed_at, flagged_at
+            FROM outlier_bounds
+            WHERE metric IN ({', '.join(['%s'] * len(metrics))})
+        """, list(metrics))
+        return {record.pop('metric'): record for record in _records(cursor)}
+
+    def select_outlier_trips(self, cursor, flag_values, limit, after=None):
+        """
+        outlier_flags plus TRIP_COLUMNS for trips whose flags are one of
+        flag_values, in (outlier_flags, trip_id) order; after = (flags, trip_id)
+        of the previous page's last row. Returns (column names, rows).
+        """
+        conditions = [f"tm.outlier_flags IN ({', '.join(['%s'] * len(flag_values))})"]
+        params = list(flag_values)
+        if after is not None:
+            conditions.append("tm.outlier_flags >= %s AND (tm.outlier_flags > %s OR tm.trip_id > %s)")
+            params.extend([after[0], after[0], after[1]])
+        # Seeks along idx_outlier_flags, one range per flag value
+        cursor.execute(f"""
+            SELECT tm.outlier_flags, {TRIP_COLUMNS}
+            FROM trip_metrics tm
+            INNER JOIN trips t ON t.trip_id = tm.trip_id
+            {_where(conditions)}
+            ORDER BY tm.outlier_flags, tm.trip_id
+            LIMIT %s
+        """, params + [limit])
+        return cursor.column_names, cursor.fetchall()
+
+    def count_outliers(self, cursor, flag_values):
+        """Trips whose outlier_flags is one of flag_values, counted from the index alone"""
+        cursor.execute(
+            f"SELECT COUNT(*) FROM trip_metrics tm WHERE tm.outlier_flags IN ({', '.join(['%s'] * len(flag_values))})",
+            list(flag_values)
+        )
+        return cursor.fetchone()[0]
+
+    def metric_sketch(self, cursor, metric, hour=ALL_VALUES, day_of_week=ALL_VALUES, vendor_id=ALL_VALUES):
+        """The serialized t-digest of a metric_sketches slice, or None"""
+        cursor.execute(
+            """SELECT sketch FROM metric_sketches
+               WHERE metric = %s AND hour_of_day = %s AND day_of_week = %s AND vendor_id = %s""",
+            (metric, hour, day_of_week, vendor_id)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def sketch_watermark(self, cursor):
+        """(last_metric_id, flushed_at) of sketch_watermark, or (0, None) before the first flush"""
+        cursor.execute("SELECT last_metric_id, flushed_at FROM sketch_watermark WHERE id = 1")
+        row = cursor.fetchone()
+        return tuple(row) if row else (0, None)
+
+    def sketch_lag(self, cursor):
+        """Trips loaded after the sketch watermark, and when the sketches were last flushed"""
+        last_metric_id, flushed_at = self.sketch_watermark(cursor)
+        cursor.execute("SELECT COUNT(*) FROM trip_metrics WHERE metric_id > %s", (last_metric_id,))
+        return {'unsketched_trips': cursor.fetchone()[0], 'sketches_flushed_at': flushed_at}
+
+    def metric_sketch_rows(self, cursor):
+        """Every (metric, hour_of_day, day_of_week, vendor_id, sketch) row of metric_sketches"""
+        cursor.execute("SELECT metric, hour_of_day, day_of_week, vendor_id, sketch FROM metric_sketches")
+        return cursor.fetchall()
+
+    def metric_id_range(self, cursor):
+        """(lowest, highest) trip_metrics.metric_id, (None, None) without trips"""
+        cursor.execute("SELECT MIN(metric_id), MAX(metric_id) FROM trip_metrics")
+        return tuple(cursor.fetchone())
+
+    def last_metric_id(self, cursor):
+        """Highest trip_metrics.metric_id, 0 without trips"""
+        cursor.execute("SELECT MAX(metric_id) FROM trip_metrics")
+        return cursor.fetchone()[0] or 0
+
+    def stream_aggregate_trips(self, cursor):
+        """
+        Execute a read of every trip as DataProcessor aggregates it: (pickup_lon,
+        pickup_lat, dropoff_lon, dropoff_lat, hour_of_day, is_weekend, day_of_week,
+        vendor_id, speed, distance, duration, pickup_datetime)
+        """
+        cursor.execute(f"""
+            SELECT t.pickup_longitude, t.pickup_latitude, t.dropoff_longitude, t.dropoff_latitude,
+                   tm.hour_of_day, tm.is_weekend, tm.day_of_week, t.vendor_id,
+                   tm.avg_speed_mph, tm.trip_distance_miles, t.trip_duration, t.pickup_datetime
+            FROM {TRIP_TABLES}
+        """)
+
+    def stream_outlier_values(self, cursor):
+        """Execute a read of (speed, distance, duration) for every trip"""
+        cursor.execute(f"SELECT tm.avg_speed_mph, tm.trip_distance_miles, t.trip_duration FROM {TRIP_TABLES}")
+
+    def stream_columnar_trips(self, cursor):
+        """Execute a read of the columns the columnar engine keeps, for every trip (trips without a zone as 0)"""
+        cursor.execute(f"""
+            SELECT
+                t.vendor_id,
+                t.pickup_datetime,
+                t.trip_duration,
+                t.passenger_count,
+                tm.trip_distance_miles,
+                tm.avg_speed_mph,
+                tm.trip_efficiency,
+                tm.hour_of_day,
+                tm.day_of_week,
+                tm.is_weekend,
+                tm.time_period,
+                tm.distance_category,
+                COALESCE(tm.pickup_zone_id, 0) AS pickup_zone_id,
+                COALESCE(tm.dropoff_zone_id, 0) AS dropoff_zone_id
+            FROM {TRIP_TABLES}
+        """)
+
+    def metric_values(self, cursor, metric, slice_values, fetch_size=50000):
+        """Every value of a metric for trips matching {slice column: value}, as packed doubles"""
+        column = METRIC_COLUMNS[metric]
+        conditions = [f"{column} IS NOT NULL"]
+        params = []
+        for slice_column, value in slice_values.items():
+            conditions.append(f"{SLICE_COLUMNS[slice_column]} = %s")
+            params.append(value)
+        cursor.execute(f"SELECT {column} FROM {TRIP_TABLES} {_where(conditions)}", params)
+        values = array('d')
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            values.extend([float(row[0]) for row in rows])
+        return values
+
+
+class MySQLStorage(Storage):
+    """MySQL server; reader connections convert DECIMAL and DATETIME to JSON-ready types"""
+
+    name = 'mysql'
+
+    def __init__(self, config):
+        self.config = dict(config)
+
+    # mysql.connector is imported on first use so SQLite-only setups do not need it
+    @property
+    def Error(self):
+        import mysql.connector
+        return mysql.connector.Error
+
+    def connect(self):
+        import mysql.connector
+        return mysql.connector.connect(**self.config)
+
+    def connect_reader(self):
+        import mysql.connector
+        return mysql.connector.connect(**self.config, converter_class=TaxiConverter)
+
+    def explain(self, cursor, sql, params, plan_format=None):
+        if plan_format:
+            cursor.execute(f"EXPLAIN FORMAT={plan_format} {sql}", params)
+            rows = cursor.fetchall()
+            return next(iter(rows[0].values())) if rows else None
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return cursor.fetchall()
+
+    def upsert_route_counts(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO route_counts (hour_of_day, is_weekend, pickup_lon_cell, pickup_lat_cell,
+               dropoff_lon_cell, dropoff_lat_cell, trip_count)
+               VALUES (%s, %s, %s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE trip_count = trip_count + VALUES(trip_count)""",
+            rows
+        )
+
+    def upsert_metric_sketches(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO metric_sketches (metric, hour_of_day, day_of_week, vendor_id, sketch)
+               VALUES (%s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE sketch = VALUES(sketch)""",
+            rows
+        )
+
+    def upsert_sketch_watermark(self, cursor, last_metric_id):
+        cursor.execute(
+            """INSERT INTO sketch_watermark (id, last_metric_id) VALUES (1, %s)
+               ON DUPLICATE KEY UPDATE last_metric_id = VALUES(last_metric_id),
+                   flushed_at = CURRENT_TIMESTAMP""",
+            (last_metric_id,)
+        )
+
+    def bump_dataset_generation(self, cursor):
+        cursor.execute(
+            """INSERT INTO dataset_generation (id, generation) VALUES (1, 1)
+               ON DUPLICATE KEY UPDATE generation = generation + 1, changed_at = CURRENT_TIMESTAMP"""
+        )
+
+    def upsert_timeseries_buckets(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO timeseries_buckets (granularity, bucket_start, trip_count,
+               total_distance, total_duration, total_speed)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE trip_count = trip_count + VALUES(trip_count),
+                   total_distance = total_distance + VALUES(total_distance),
+                   total_duration = total_duration + VALUES(total_duration),
+                   total_speed = total_speed + VALUES(total_speed)""",
+            rows
+        )
+
+    def upsert_heatmap_cells(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO heatmap_cells (zoom, hour_of_day, cell_x, cell_y, pickup_count, dropoff_count)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE pickup_count = pickup_count + VALUES(pickup_count),
+                   dropoff_count = dropoff_count + VALUES(dropoff_count)""",
+            rows
+        )
+
+    def update_outlier_flags(self, cursor, flags, bounds, first_id, end_id):
+        # Duration lives on trips: one join per chunk, not a lookup per row
+        expression, params = _outlier_flags(METRIC_COLUMNS, flags, bounds)
+        cursor.execute(f"""
+            UPDATE trip_metrics tm
+            INNER JOIN trips t ON t.trip_id = tm.trip_id
+            SET tm.outlier_flags = {expression}
+            WHERE tm.metric_id >= %s AND tm.metric_id < %s
+        """, params + [first_id, end_id])
+
+    def distance_category_counts(self, cursor):
+        cursor.execute("""
+            SELECT
+                distance_category,
+                COUNT(*) as trip_count
+            FROM trip_metrics
+            GROUP BY distance_category
+            ORDER BY FIELD(distance_category, 'short', 'medium', 'long', 'very_long')
+        """)
+        return _records(cursor)
+
+    def _bin_number(self, expression):
+        return f"FLOOR({expression})"
+
+
+def _ln(value):
+    # LN() for log-scale histograms; SQLite only has it when built with math
+    # functions. NULL for NULL and for values <= 0, like MySQL.
+    return math.log(value) if value is not None and value > 0 else None
+
+
+def _sqlite_params(params):
+    # Keyset cursors decode DECIMAL sort values, which sqlite3 cannot bind
+    return tuple(float(value) if isinstance(value, Decimal) else value for value in params or ())
+
+
+class SQLiteCursor:
+    """sqlite3 cursor with the parts of the mysql.connector cursor API the app uses"""
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    def execute(self, operation, params=None):
+        self._cursor.execute(operation.replace('%s', '?'), _sqlite_params(params))
+
+    def executemany(self, operation, seq_params):
+        self._cursor.executemany(operation.replace('%s', '?'), (_sqlite_params(p) for p in seq_params))
+
+    def _convert(self, rows):
+        if not self._dictionary:
+            return rows
+        columns = self.column_names
+        return [dict(zip(columns, row)) for row in rows]
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._convert([row])[0]
+
+    def fetchmany(self, size=1):
+        return self._convert(self._cursor.fetchmany(size))
+
+    def fetchall(self):
+        return self._convert(self._cursor.fetchall())
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """sqlite3 connection handing out SQLiteCursors; usable from the pool's threads"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.create_function('LN', 1, _ln, deterministic=True)
+
+    def cursor(self, dictionary=False, **kwargs):
+        # buffered= and other mysql.connector options do not apply
+        return SQLiteCursor(self._conn.cursor(), dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteStorage(Storage):
+    """Embedded SQLite database file using schema_sqlite.sql"""
+
+    name = 'sqlite'
+    Error = sqlite3.Error
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def connect(self):
+        return SQLiteConnection(self.path)
+
+    def initialize_schema(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        try:
+            # WAL lets the server keep reading while DataProcessor loads data
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(SQLITE_SCHEMA_PATH.read_text(encoding='utf-8'))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def explain(self, cursor, sql, params, plan_format=None):
+        # SQLite has a single plan format; plan_format is ignored
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return cursor.fetchall()
+
+    def upsert_route_counts(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO route_counts (hour_of_day, is_weekend, pickup_lon_cell, pickup_lat_cell,
+               dropoff_lon_cell, dropoff_lat_cell, trip_count)
+               VALUES (%s, %s, %s, %s, %s, %s, %s)
+               ON CONFLICT (hour_of_day, is_weekend, pickup_lon_cell, pickup_lat_cell,
+                            dropoff_lon_cell, dropoff_lat_cell)
+               DO UPDATE SET trip_count = trip_count + excluded.trip_count""",
+            rows
+        )
+
+    def upsert_metric_sketches(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO metric_sketches (metric, hour_of_day, day_of_week, vendor_id, sketch)
+               VALUES (%s, %s, %s, %s, %s)
+               ON CONFLICT (metric, hour_of_day, day_of_week, vendor_id)
+               DO UPDATE SET sketch = excluded.sketch""",
+            rows
+        )
+
+    def upsert_sketch_watermark(self, cursor, last_metric_id):
+        cursor.execute(
+            """INSERT INTO sketch_watermark (id, last_metric_id) VALUES (1, %s)
+               ON CONFLICT (id) DO UPDATE SET last_metric_id = excluded.last_metric_id,
+                   flushed_at = CURRENT_TIMESTAMP""",
+            (last_metric_id,)
+        )
+
+    def bump_dataset_generation(self, cursor):
+        cursor.execute(
+            """INSERT INTO dataset_generation (id, generation) VALUES (1, 1)
+               ON CONFLICT (id) DO UPDATE SET generation = generation + 1, changed_at = CURRENT_TIMESTAMP"""
+        )
+
+    def upsert_timeseries_buckets(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO timeseries_buckets (granularity, bucket_start, trip_count,
+               total_distance, total_duration, total_speed)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               ON CONFLICT (granularity, bucket_start)
+               DO UPDATE SET trip_count = trip_count + excluded.trip_count,
+                   total_distance = total_distance + excluded.total_distance,
+                   total_duration = total_duration + excluded.total_duration,
+                   total_speed = total_speed + excluded.total_speed""",
+            rows
+        )
+
+    def upsert_heatmap_cells(self, cursor, rows):
+        cursor.executemany(
+            """INSERT INTO heatmap_cells (zoom, hour_of_day, cell_x, cell_y, pickup_count, dropoff_count)
+               VALUES (%s, %s, %s, %s, %s, %s)
+               ON CONFLICT (zoom, hour_of_day, cell_x, cell_y)
+               DO UPDATE SET pickup_count = pickup_count + excluded.pickup_count,
+                   dropoff_count = dropoff_count + excluded.dropoff_count""",
+            rows
+        )
+
+    def update_outlier_flags(self, cursor, flags, bounds, first_id, end_id):
+        # UPDATE cannot join before SQLite 3.33, so duration is read per row through
+        # the trips primary key
+        expression, params = _outlier_flags(SQLITE_OUTLIER_COLUMNS, flags, bounds)
+        cursor.execute(f"""
+            UPDATE trip_metrics SET outlier_flags = {expression}
+            WHERE metric_id >= %s AND metric_id < %s
+        """, params + [first_id, end_id])
+
+    def distance_category_counts(self, cursor):
+        cursor.execute("""
+            SELECT
+                distance_category,
+                COUNT(*) as trip_count
+            FROM trip_metrics
+            GROUP BY distance_category
+            ORDER BY CASE distance_category
+                WHEN 'short' THEN 1 WHEN 'medium' THEN 2 WHEN 'long' THEN 3 WHEN 'very_long' THEN 4
+            END
+        """)
+        return _records(cursor)
+
+    def _bin_number(self, expression):
+        # FLOOR() needs a build with math functions; binned values are >= 0, so truncating is the same
+        return f"CAST({expression} AS INTEGER)"
+
+
+def create_storage(backend, db_config=None, sqlite_path=None):
+    """Build the Storage for a backend name ('mysql' or 'sqlite')"""
+    if backend == 'mysql':
+        return MySQLStorage(db_config)
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(STORAGE_BACKENDS)})")
@@ -0,0 +1,186 @@
+"""
+NYC taxi zone lookup for validation and enrichment
+
+DataProcessor loads the zone polygons from a GeoJSON file in longitude/latitude
+(such as the TLC taxi zones export) into a ZoneIndex, which rasterizes them once
+onto a grid of ZONE_GRID_CELL_SIZE-degree cells:
+
+- a cell that no zone edge passes through lies entirely inside one zone or
+  outside all of them, and stores that answer;
+- a boundary cell keeps the few zones that may contain its points, and a lookup
+  there runs an exact point-in-polygon test against them.
+
+Most lookups are therefore one array read; the polygon math only runs near edges.
+"""
+
+import json
+import math
+from array import array
+from collections import namedtuple
+
+
+ZONE_GRID_CELL_SIZE = 0.001  # degrees; about 85 x 110 m in NYC
+
+# GeoJSON property names (matched case-insensitively), first one present wins
+ZONE_ID_PROPERTIES = ('locationid', 'location_id', 'zone_id')
+ZONE_NAME_PROPERTIES = ('zone', 'name')
+BOROUGH_PROPERTIES = ('borough',)
+
+
+class Zone(namedtuple('Zone', 'zone_id name borough rings bbox')):
+    """One zone: every ring of its polygons as [(lon, lat), ...] and its (west, south, east, north)"""
+
+    __slots__ = ()
+
+    def contains(self, longitude, latitude):
+        """Exact even-odd test over all rings, so holes and multipolygon parts both work"""
+        west, south, east, north = self.bbox
+        if not (west <= longitude <= east and south <= latitude <= north):
+            return False
+        inside = False
+        for ring in self.rings:
+            x1, y1 = ring[-1]
+            for x2, y2 in ring:
+                if (y1 > latitude) != (y2 > latitude) and \
+                        longitude < x1 + (latitude - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+                x1, y1 = x2, y2
+        return inside
+
+
+def _property(properties, names):
+    for name in names:
+        if properties.get(name) is not None:
+            return properties[name]
+    return None
+
+
+class ZoneIndex:
+    """Rasterized zone lookup: zone_at(lon, lat) -> zone_id or None"""
+
+    def __init__(self, zones, cell_size=ZONE_GRID_CELL_SIZE):
+        if not zones:
+            raise ValueError("no zone polygons to index")
+        self.zones = zones
+        self.cell_size = cell_size
+        self.west = min(zone.bbox[0] for zone in zones)
+        self.south = min(zone.bbox[1] for zone in zones)
+        self.columns = int((max(zone.bbox[2] for zone in zones) - self.west) / cell_size) + 1
+        self.rows = int((max(zone.bbox[3] for zone in zones) - self.south) / cell_size) + 1
+        # Per cell: 0 outside every zone, n > 0 inside self.zones[n - 1],
+        # n < 0 boundary cell with candidate zones self.candidates[-n - 1]
+        self.grid = array('l', [0]) * (self.columns * self.rows)
+        self.candidates = []
+        self._rasterize()
+
+    @classmethod
+    def load(cls, path, cell_size=ZONE_GRID_CELL_SIZE):
+        """Build the index from a GeoJSON FeatureCollection of Polygon/MultiPolygon zones"""
+        with open(path, 'r', encoding='utf-8') as f:
+            collection = json.load(f)
+
+        zones = []
+        for feature in collection.get('features', []):
+            geometry = feature.get('geometry')
+            if not geometry:
+                continue  # TLC's "Unknown" zones have no shape
+            if geometry['type'] == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry['type'] == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+
+            properties = {key.lower(): value for key, value in (feature.get('properties') or {}).items()}
+            zone_id = _property(properties, ZONE_ID_PROPERTIES)
+            if zone_id is None:
+                raise ValueError(f"zone feature without an id property ({', '.join(ZONE_ID_PROPERTIES)})")
+
+            rings = [[(float(point[0]), float(point[1])) for point in ring]
+                     for polygon in polygons for ring in polygon if ring]
+            points = [point for ring in rings for point in ring]
+            bbox = (min(x for x, _ in points), min(y for _, y in points),
+                    max(x for x, _ in points), max(y for _, y in points))
+            zones.append(Zone(int(zone_id), _property(properties, ZONE_NAME_PROPERTIES),
+                              _property(properties, BOROUGH_PROPERTIES), rings, bbox))
+        return cls(zones, cell_size)
+
+    def _column(self, longitude):
+        return min(max(math.floor((longitude - self.west) / self.cell_size), 0), self.columns - 1)
+
+    def _row(self, latitude):
+        return min(max(math.floor((latitude - self.south) / self.cell_size), 0), self.rows - 1)
+
+    def _rasterize(self):
+        boundary = {}   # cell -> zone positions with an edge in it, or filling its center
+        crossings = {}  # (zone position, row) -> longitudes where edges cross the row's center line
+        for position, zone in enumerate(self.zones):
+            for ring in zone.rings:
+                for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                    # Split the edge into pieces at most one cell long; every cell of
+                    # a piece's bounding box counts as crossed (conservative)
+                    pieces = max(1, math.ceil(max(abs(x2 - x1), abs(y2 - y1)) / self.cell_size))
+                    for piece in range(pieces):
+                        start, end = piece / pieces, (piece + 1) / pieces
+                        first_column, last_column = sorted((self._column(x1 + (x2 - x1) * start),
+                                                            self._column(x1 + (x2 - x1) * end)))
+                        first_row, last_row = sorted((self._row(y1 + (y2 - y1) * start),
+                                                      self._row(y1 + (y2 - y1) * end)))
+                        for row in range(first_row, last_row + 1):
+                            for column in range(first_column, last_column + 1):
+                                boundary.setdefault(row * self.columns + column, set()).add(position)
+
+                    if y1 == y2:
+                        continue
+                    low, high = min(y1, y2), max(y1, y2)
+                    for row in range(self._row(low), self._row(high) + 1):
+                        center = self.south + (row + 0.5) * self.cell_size
+                        if low <= center < high:
+                            crossings.setdefault((position, row), []).append(
+                                x1 + (center - y1) * (x2 - x1) / (y2 - y1))
+
+        # Scanline fill: cell centers between pairs of crossings are inside the zone
+        for (position, row), longitudes in crossings.items():
+            longitudes.sort()
+            for start, end in zip(longitudes[0::2], longitudes[1::2]):
+                column = max(math.ceil((start - self.west) / self.cell_size - 0.5), 0)
+                while column < self.columns and self.west + (column + 0.5) * self.cell_size < end:
+                    cell = row * self.columns + column
+                    if cell in boundary:
+                        boundary[cell].add(position)
+                    elif not self.grid[cell]:
+                        self.grid[cell] = position + 1
+                    column += 1
+
+        shared = {}
+        for cell, positions in boundary.items():
+            candidates = tuple(sorted(positions))
+            slot = shared.get(candidates)
+            if slot is None:
+                slot = shared[candidates] = len(self.candidates)
+                self.candidates.append(candidates)
+            self.grid[cell] = -slot - 1
+
+    def zone_at(self, longitude, latitude):
+        """zone_id of the zone containing a point, or None when no zone does"""
+        column = math.floor((longitude - self.west) / self.cell_size)
+        row = math.floor((latitude - self.south) / self.cell_size)
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return None
+        value = self.grid[row * self.columns + column]
+        if value > 0:
+            return self.zones[value - 1].zone_id
+        if value < 0:
+            for position in self.candidates[-value - 1]:
+                zone = self.zones[position]
+                if zone.contains(longitude, latitude):
+                    return zone.zone_id
+        return None
+
+    def zone_rows(self):
+        """(zone_id, zone, borough) rows for the zones table, one per zone_id"""
+        # A zone may be split over several features (TLC has a few); the first names it
+        rows = {}
+        for zone in self.zones:
+            rows.setdefault(zone.zone_id, (zone.zone_id, zone.name, zone.borough))
+        return list(rows.values())
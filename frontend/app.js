@@ -6,6 +6,8 @@ const state = {
     currentPage: 1,
     pageSize: 50,
     totalTrips: 0,
+    pageCursors: [null],  // keyset cursor for each visited page (index = page - 1)
+    hasMore: false,
     filters: {},
     charts: {}
 };
@@ -23,13 +25,18 @@ async function initializeApp() {
         // Populate hour filter
         populateHourFilter();
         
-        // Load initial data
-        await Promise.all([
-            loadStatistics(),
-            loadInsights(),
-            loadTrips(),
-            loadTopRoutes()
-        ]);
+        // Load initial data in a single round trip, falling back to separate requests
+        try {
+            await loadDashboardBatch();
+        } catch (batchError) {
+            console.warn('Batch load failed, loading sections separately:', batchError);
+            await Promise.all([
+                loadStatistics(),
+                loadInsights(),
+                loadTrips(),
+                loadTopRoutes()
+            ]);
+        }
         
     } catch (error) {
         console.error('Initialization error:', error);
@@ -72,50 +79,106 @@ async function fetchAPI(endpoint, params = {}) {
     return await response.json();
 }
 
+async function fetchBatch(requests) {
+    const response = await fetch(`${API_BASE}/batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ requests })
+    });
+    if (!response.ok) {
+        throw new Error(`API error: ${response.statusText}`);
+    }
+    
+    return (await response.json()).responses;
+}
+
+async function loadDashboardBatch() {
+    // The dashboard summary covers both statistics and insights in one table scan
+    const responses = await fetchBatch([
+        { id: 'dashboard', path: '/api/dashboard' },
+        { id: 'trips', path: '/api/trips', params: tripsParams() },
+        { id: 'topRoutes', path: '/api/top-routes', params: { limit: 10 } }
+    ]);
+    
+    // Each part carries its own status, so one failing section does not block the others
+    const sections = [
+        ['dashboard', renderDashboard],
+        ['trips', renderTrips],
+        ['topRoutes', renderTopRoutes]
+    ];
+    sections.forEach(([id, render]) => {
+        const part = responses[id];
+        if (part && part.status === 200) {
+            try {
+                render(part.body);
+            } catch (error) {
+                console.error(`Error rendering ${id}:`, error);
+            }
+        } else {
+            console.error(`Error loading ${id}:`, part ? part.body : 'missing response');
+        }
+    });
+}
+
+function renderDashboard(data) {
+    if (data.success) {
+        renderStatistics(data.statistics);
+        renderInsights(data.insights);
+    }
+}
+
 async function loadStatistics() {
     try {
-        const data = await fetchAPI('/statistics');
-        
-        if (data.success) {
-            displayStatistics(data.overall);
-            createVendorChart(data.by_vendor);
-            createDistributionChart(data.distance_distribution);
-        }
+        renderStatistics(await fetchAPI('/statistics'));
     } catch (error) {
         console.error('Error loading statistics:', error);
     }
 }
 
+function renderStatistics(data) {
+    if (data.success) {
+        displayStatistics(data.overall);
+        createVendorChart(data.by_vendor);
+        createDistributionChart(data.distance_distribution);
+    }
+}
+
 async function loadInsights() {
     try {
-        const data = await fetchAPI('/insights');
-        
-        if (data.success) {
-            displayInsights(data);
-            createHourlyChart(data.hourly_patterns);
-            createDayOfWeekChart(data.hourly_patterns);
-            createSpeedChart(data.speed_by_time_period);
-        }
+        renderInsights(await fetchAPI('/insights'));
     } catch (error) {
         console.error('Error loading insights:', error);
     }
 }
 
+function renderInsights(data) {
+    if (data.success) {
+        displayInsights(data);
+        createHourlyChart(data.hourly_patterns);
+        createDayOfWeekChart(data.hourly_patterns);
+        createSpeedChart(data.speed_by_time_period);
+    }
+}
+
+function tripsParams() {
+    const params = {
+        limit: state.pageSize,
+        ...state.filters
+    };
+    
+    // Seek from the previous page's last row; the total only needs counting once per filter set
+    const cursor = state.pageCursors[state.currentPage - 1];
+    if (cursor) {
+        params.cursor = cursor;
+        params.include_total = false;
+    }
+    
+    return params;
+}
+
 async function loadTrips() {
     try {
-        const params = {
-            limit: state.pageSize,
-            offset: (state.currentPage - 1) * state.pageSize,
-            ...state.filters
-        };
-        
-        const data = await fetchAPI('/trips', params);
-        
-        if (data.success) {
-            displayTrips(data.data);
-            updatePagination(data.total);
-            state.totalTrips = data.total;
-        }
+        renderTrips(await fetchAPI('/trips', tripsParams()));
     } catch (error) {
         console.error('Error loading trips:', error);
         document.getElementById('tripsTableBody').innerHTML = 
@@ -123,18 +186,33 @@ async function loadTrips() {
     }
 }
 
+function renderTrips(data) {
+    if (data.success) {
+        if (data.total !== null) {
+            state.totalTrips = data.total;
+        }
+        state.hasMore = data.has_more;
+        state.pageCursors[state.currentPage] = data.next_cursor;
+        
+        displayTrips(data.data);
+        updatePagination(state.totalTrips);
+    }
+}
+
 async function loadTopRoutes() {
     try {
-        const data = await fetchAPI('/top-routes', { limit: 10 });
-        
-        if (data.success) {
-            displayTopRoutes(data.data);
-        }
+        renderTopRoutes(await fetchAPI('/top-routes', { limit: 10 }));
     } catch (error) {
         console.error('Error loading top routes:', error);
     }
 }
 
+function renderTopRoutes(data) {
+    if (data.success) {
+        displayTopRoutes(data.data);
+    }
+}
+
 // Display Functions
 function displayStatistics(stats) {
     document.getElementById('totalTrips').textContent = 
@@ -367,6 +445,7 @@ function applyFilters() {
     
     state.filters = filters;
     state.currentPage = 1;
+    state.pageCursors = [null];
     
     loadTrips();
 }
@@ -385,6 +464,7 @@ function resetFilters() {
     
     state.filters = {};
     state.currentPage = 1;
+    state.pageCursors = [null];
     
     loadTrips();
 }
@@ -402,7 +482,7 @@ function updatePagination(total) {
         `Page ${state.currentPage} of ${totalPages}`;
     
     document.getElementById('prevPage').disabled = state.currentPage === 1;
-    document.getElementById('nextPage').disabled = state.currentPage === totalPages;
+    document.getElementById('nextPage').disabled = !state.hasMore;
 }
 
 function changePage(delta) {
@@ -22,6 +22,15 @@ CREATE TABLE trips (
     INDEX idx_dropoff_location (dropoff_longitude, dropoff_latitude)
 ) ENGINE=InnoDB;
 
+-- Taxi zones loaded by data_processor.py from the zone polygon file (ZONES_FILE_PATH)
+CREATE TABLE zones (
+    zone_id SMALLINT UNSIGNED PRIMARY KEY,     -- TLC LocationID
+    zone VARCHAR(100),
+    borough VARCHAR(50),
+    
+    INDEX idx_borough (borough)
+) ENGINE=InnoDB;
+
 -- Derived metrics table with computed features
 CREATE TABLE trip_metrics (
     metric_id INT AUTO_INCREMENT PRIMARY KEY,
@@ -49,9 +58,17 @@ CREATE TABLE trip_metrics (
     duration_category ENUM('quick', 'moderate', 'lengthy', 'extended') NOT NULL,
     speed_category ENUM('slow', 'normal', 'fast') NOT NULL,
     
+    -- IQR outlier bitmask written by data_processor.py: 1 = speed, 2 = distance, 4 = duration
+    outlier_flags TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    
+    -- Taxi zones of the pickup and dropoff points (NULL when loaded without a zone file)
+    pickup_zone_id SMALLINT UNSIGNED NULL,
+    dropoff_zone_id SMALLINT UNSIGNED NULL,
+    
     -- Indexes for analysis
-    INDEX idx_distance (trip_distance_miles),
-    INDEX idx_speed (avg_speed_mph),
+    -- (sort columns carry trip_id so keyset pagination can seek and stop early)
+    INDEX idx_distance (trip_distance_miles, trip_id),
+    INDEX idx_speed (avg_speed_mph, trip_id),
     INDEX idx_efficiency (trip_efficiency),
     INDEX idx_hour (hour_of_day),
     INDEX idx_day (day_of_week),
@@ -60,6 +77,10 @@ CREATE TABLE trip_metrics (
     INDEX idx_time_period (time_period),
     INDEX idx_distance_cat (distance_category),
     INDEX idx_duration_cat (duration_category),
+    -- outlier listings seek to each flag value and read trip_id in order
+    INDEX idx_outlier_flags (outlier_flags, trip_id),
+    INDEX idx_pickup_zone (pickup_zone_id),
+    INDEX idx_dropoff_zone (dropoff_zone_id),
     
     FOREIGN KEY (trip_id) REFERENCES trips(trip_id) ON DELETE CASCADE
 ) ENGINE=InnoDB;
@@ -90,6 +111,97 @@ CREATE TABLE data_quality_log (
     INDEX idx_record_id (record_id)
 ) ENGINE=InnoDB;
 
+-- Pre-aggregated route counts for /api/top-routes, maintained by data_processor.py
+-- Cells are coordinates rounded to 3 decimals, stored as integer thousandths of a degree.
+-- Rows with hour_of_day = -1 / is_weekend = -1 count all hours / all days.
+CREATE TABLE route_counts (
+    hour_of_day TINYINT NOT NULL,              -- 0-23, or -1 for all hours
+    is_weekend TINYINT NOT NULL,               -- 0/1, or -1 for all days
+    pickup_lon_cell INT NOT NULL,
+    pickup_lat_cell INT NOT NULL,
+    dropoff_lon_cell INT NOT NULL,
+    dropoff_lat_cell INT NOT NULL,
+    trip_count INT NOT NULL,
+    
+    PRIMARY KEY (hour_of_day, is_weekend, pickup_lon_cell, pickup_lat_cell, dropoff_lon_cell, dropoff_lat_cell),
+    -- top-k per (hour, weekend) slice is a backward range scan of this index
+    INDEX idx_route_top (hour_of_day, is_weekend, trip_count)
+) ENGINE=InnoDB;
+
+-- Mergeable quantile sketches (t-digests) of speed, distance and duration, per
+-- (hour_of_day, day_of_week, vendor_id) slice, maintained by data_processor.py.
+-- -1 in a slice column means "all"; the all/all/all row covers every trip.
+CREATE TABLE metric_sketches (
+    metric ENUM('speed', 'distance', 'duration') NOT NULL,
+    hour_of_day TINYINT NOT NULL,              -- 0-23, or -1
+    day_of_week TINYINT NOT NULL,              -- 0-6, or -1
+    vendor_id TINYINT NOT NULL,                -- or -1
+    sketch BLOB NOT NULL,                      -- algorithms.TDigest.to_bytes()
+    
+    PRIMARY KEY (metric, hour_of_day, day_of_week, vendor_id)
+) ENGINE=InnoDB;
+
+-- How far metric_sketches is written: every trip with metric_id <= last_metric_id is
+-- in the sketches. One row, written in the same transaction as the sketches; trips
+-- after it are missing from the sketches until the next flush (or --rebuild-aggregates).
+CREATE TABLE sketch_watermark (
+    id TINYINT PRIMARY KEY,                    -- always 1
+    last_metric_id INT NOT NULL,
+    flushed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- Dataset version for readers that cache trips (the server's columnar engine):
+-- data_processor.py increments it after every load, --rebuild-aggregates and
+-- --flag-outliers run. One row.
+CREATE TABLE dataset_generation (
+    id TINYINT PRIMARY KEY,                    -- always 1
+    generation INT NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- Trip counts and metric totals per pickup time bucket for /api/timeseries,
+-- maintained by data_processor.py. Weeks start on Monday; each granularity is
+-- rolled up from the next finer one (15m -> hour -> day -> week).
+CREATE TABLE timeseries_buckets (
+    granularity ENUM('15m', 'hour', 'day', 'week') NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    trip_count INT NOT NULL,
+    total_distance DOUBLE NOT NULL,            -- miles
+    total_duration BIGINT NOT NULL,            -- seconds
+    total_speed DOUBLE NOT NULL,               -- sum of avg_speed_mph
+    
+    PRIMARY KEY (granularity, bucket_start)
+) ENGINE=InnoDB;
+
+-- Pickup and dropoff counts per Web Mercator tile for /api/heatmap, per hour of day
+-- (-1 = all hours), maintained by data_processor.py. Zoom 17 cells are counted
+-- from trips; each zoom down to 10 is rolled up from the next finer one.
+CREATE TABLE heatmap_cells (
+    zoom TINYINT NOT NULL,
+    hour_of_day TINYINT NOT NULL,              -- 0-23, or -1 for all hours
+    cell_x INT NOT NULL,                       -- tile column
+    cell_y INT NOT NULL,                       -- tile row, from the north
+    pickup_count INT NOT NULL,
+    dropoff_count INT NOT NULL,
+    
+    -- a viewport is one range of cell_x per (zoom, hour)
+    PRIMARY KEY (zoom, hour_of_day, cell_x, cell_y)
+) ENGINE=InnoDB;
+
+-- IQR bounds behind trip_metrics.outlier_flags, one row per metric, written by
+-- the same data_processor.py job that sets the flags. The bounds are stored before
+-- the flags are rewritten; flagged_at stays NULL until the last flag chunk commits.
+CREATE TABLE outlier_bounds (
+    metric ENUM('speed', 'distance', 'duration') PRIMARY KEY,
+    q1 DOUBLE NOT NULL,
+    q3 DOUBLE NOT NULL,
+    lower_bound DOUBLE NOT NULL,
+    upper_bound DOUBLE NOT NULL,
+    trip_count INT NOT NULL,                   -- trips the quartiles were computed from
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    flagged_at TIMESTAMP NULL DEFAULT NULL     -- when outlier_flags matched these bounds
+) ENGINE=InnoDB;
+
 -- Create useful views for common queries
 
 -- View 1: Complete trip details with all computed metrics
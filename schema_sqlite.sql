@@ -0,0 +1,265 @@
+-- Embedded SQLite version of schema.sql (same tables, columns, indexes and views).
+-- ENUM columns become TEXT with CHECK constraints; DECIMAL columns become REAL,
+-- which is what the MySQL backend's converter returns them as anyway.
+
+-- Main trips table with all original CSV fields
+CREATE TABLE IF NOT EXISTS trips (
+    trip_id TEXT PRIMARY KEY,
+    vendor_id INTEGER NOT NULL,
+    pickup_datetime TEXT NOT NULL,
+    dropoff_datetime TEXT NOT NULL,
+    passenger_count INTEGER NOT NULL,
+    pickup_longitude REAL NOT NULL,
+    pickup_latitude REAL NOT NULL,
+    dropoff_longitude REAL NOT NULL,
+    dropoff_latitude REAL NOT NULL,
+    store_and_fwd_flag TEXT DEFAULT 'N',
+    trip_duration INTEGER NOT NULL
+);
+
+-- InnoDB secondary indexes end with the primary key; SQLite's end with the
+-- rowid, so the /api/trips sort indexes name trip_id to serve its tie-break
+CREATE INDEX IF NOT EXISTS idx_pickup_datetime ON trips (pickup_datetime, trip_id);
+CREATE INDEX IF NOT EXISTS idx_dropoff_datetime ON trips (dropoff_datetime);
+CREATE INDEX IF NOT EXISTS idx_vendor ON trips (vendor_id);
+CREATE INDEX IF NOT EXISTS idx_duration ON trips (trip_duration, trip_id);
+CREATE INDEX IF NOT EXISTS idx_passenger_count ON trips (passenger_count);
+CREATE INDEX IF NOT EXISTS idx_pickup_location ON trips (pickup_longitude, pickup_latitude);
+CREATE INDEX IF NOT EXISTS idx_dropoff_location ON trips (dropoff_longitude, dropoff_latitude);
+
+-- Taxi zones loaded by data_processor.py from the zone polygon file (ZONES_FILE_PATH)
+CREATE TABLE IF NOT EXISTS zones (
+    zone_id INTEGER PRIMARY KEY,
+    zone TEXT,
+    borough TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_borough ON zones (borough);
+
+-- Derived metrics table with computed features
+CREATE TABLE IF NOT EXISTS trip_metrics (
+    metric_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trip_id TEXT UNIQUE NOT NULL REFERENCES trips (trip_id) ON DELETE CASCADE,
+    trip_distance_miles REAL NOT NULL,
+    avg_speed_mph REAL NOT NULL,
+    trip_efficiency REAL NOT NULL,
+    hour_of_day INTEGER NOT NULL,
+    day_of_week INTEGER NOT NULL,
+    day_of_month INTEGER NOT NULL,
+    month_of_year INTEGER NOT NULL,
+    is_weekend INTEGER NOT NULL,
+    time_period TEXT NOT NULL CHECK (time_period IN
+        ('early_morning', 'morning_rush', 'midday', 'evening_rush', 'night', 'late_night')),
+    distance_category TEXT NOT NULL CHECK (distance_category IN ('short', 'medium', 'long', 'very_long')),
+    duration_category TEXT NOT NULL CHECK (duration_category IN ('quick', 'moderate', 'lengthy', 'extended')),
+    speed_category TEXT NOT NULL CHECK (speed_category IN ('slow', 'normal', 'fast')),
+    -- IQR outlier bitmask written by data_processor.py: 1 = speed, 2 = distance, 4 = duration
+    outlier_flags INTEGER NOT NULL DEFAULT 0,
+    -- Taxi zones of the pickup and dropoff points (NULL when loaded without a zone file)
+    pickup_zone_id INTEGER,
+    dropoff_zone_id INTEGER
+);
+
+-- (sort columns carry trip_id so keyset pagination can seek and stop early)
+CREATE INDEX IF NOT EXISTS idx_distance ON trip_metrics (trip_distance_miles, trip_id);
+CREATE INDEX IF NOT EXISTS idx_speed ON trip_metrics (avg_speed_mph, trip_id);
+CREATE INDEX IF NOT EXISTS idx_efficiency ON trip_metrics (trip_efficiency);
+CREATE INDEX IF NOT EXISTS idx_hour ON trip_metrics (hour_of_day);
+CREATE INDEX IF NOT EXISTS idx_day ON trip_metrics (day_of_week);
+CREATE INDEX IF NOT EXISTS idx_month ON trip_metrics (month_of_year);
+CREATE INDEX IF NOT EXISTS idx_weekend ON trip_metrics (is_weekend);
+CREATE INDEX IF NOT EXISTS idx_time_period ON trip_metrics (time_period);
+CREATE INDEX IF NOT EXISTS idx_distance_cat ON trip_metrics (distance_category);
+CREATE INDEX IF NOT EXISTS idx_duration_cat ON trip_metrics (duration_category);
+-- outlier listings seek to each flag value and read trip_id in order
+CREATE INDEX IF NOT EXISTS idx_outlier_flags ON trip_metrics (outlier_flags, trip_id);
+CREATE INDEX IF NOT EXISTS idx_pickup_zone ON trip_metrics (pickup_zone_id);
+CREATE INDEX IF NOT EXISTS idx_dropoff_zone ON trip_metrics (dropoff_zone_id);
+
+-- Data quality log table to track cleaning decisions
+CREATE TABLE IF NOT EXISTS data_quality_log (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    record_id TEXT,
+    issue_type TEXT NOT NULL CHECK (issue_type IN (
+        'missing_values',
+        'invalid_coords',
+        'invalid_duration',
+        'invalid_passenger_count',
+        'invalid_datetime',
+        'duplicate_record',
+        'outlier_distance',
+        'outlier_speed',
+        'zero_distance',
+        'negative_duration'
+    )),
+    issue_description TEXT,
+    field_name TEXT,
+    original_value TEXT,
+    action_taken TEXT DEFAULT 'excluded' CHECK (action_taken IN ('excluded', 'corrected', 'flagged')),
+    logged_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_issue_type ON data_quality_log (issue_type);
+CREATE INDEX IF NOT EXISTS idx_record_id ON data_quality_log (record_id);
+
+-- Pre-aggregated route counts for /api/top-routes, maintained by data_processor.py
+-- Cells are coordinates rounded to 3 decimals, stored as integer thousandths of a degree.
+-- Rows with hour_of_day = -1 / is_weekend = -1 count all hours / all days.
+CREATE TABLE IF NOT EXISTS route_counts (
+    hour_of_day INTEGER NOT NULL,
+    is_weekend INTEGER NOT NULL,
+    pickup_lon_cell INTEGER NOT NULL,
+    pickup_lat_cell INTEGER NOT NULL,
+    dropoff_lon_cell INTEGER NOT NULL,
+    dropoff_lat_cell INTEGER NOT NULL,
+    trip_count INTEGER NOT NULL,
+    PRIMARY KEY (hour_of_day, is_weekend, pickup_lon_cell, pickup_lat_cell, dropoff_lon_cell, dropoff_lat_cell)
+) WITHOUT ROWID;
+
+-- top-k per (hour, weekend) slice is a backward range scan of this index
+CREATE INDEX IF NOT EXISTS idx_route_top ON route_counts (hour_of_day, is_weekend, trip_count);
+
+-- Mergeable quantile sketches (t-digests) of speed, distance and duration, per
+-- (hour_of_day, day_of_week, vendor_id) slice, maintained by data_processor.py.
+-- -1 in a slice column means "all"; the all/all/all row covers every trip.
+CREATE TABLE IF NOT EXISTS metric_sketches (
+    metric TEXT NOT NULL CHECK (metric IN ('speed', 'distance', 'duration')),
+    hour_of_day INTEGER NOT NULL,
+    day_of_week INTEGER NOT NULL,
+    vendor_id INTEGER NOT NULL,
+    sketch BLOB NOT NULL,
+    PRIMARY KEY (metric, hour_of_day, day_of_week, vendor_id)
+) WITHOUT ROWID;
+
+-- How far metric_sketches is written (trips with metric_id <= last_metric_id); one row,
+-- written in the same transaction as the sketches.
+CREATE TABLE IF NOT EXISTS sketch_watermark (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_metric_id INTEGER NOT NULL,
+    flushed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Dataset version for the server's columnar engine, incremented by data_processor.py
+-- after every load, --rebuild-aggregates and --flag-outliers run; one row.
+CREATE TABLE IF NOT EXISTS dataset_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL,
+    changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Trip counts and metric totals per pickup time bucket for /api/timeseries,
+-- maintained by data_processor.py. Weeks start on Monday; each granularity is
+-- rolled up from the next finer one (15m -> hour -> day -> week).
+CREATE TABLE IF NOT EXISTS timeseries_buckets (
+    granularity TEXT NOT NULL CHECK (granularity IN ('15m', 'hour', 'day', 'week')),
+    bucket_start TEXT NOT NULL,
+    trip_count INTEGER NOT NULL,
+    total_distance REAL NOT NULL,
+    total_duration INTEGER NOT NULL,
+    total_speed REAL NOT NULL,
+    PRIMARY KEY (granularity, bucket_start)
+) WITHOUT ROWID;
+
+-- Pickup and dropoff counts per Web Mercator tile for /api/heatmap, per hour of day
+-- (-1 = all hours), maintained by data_processor.py. Zoom 17 cells are counted
+-- from trips; each zoom down to 10 is rolled up from the next finer one.
+-- A viewport is one range of cell_x per (zoom, hour).
+CREATE TABLE IF NOT EXISTS heatmap_cells (
+    zoom INTEGER NOT NULL,
+    hour_of_day INTEGER NOT NULL,
+    cell_x INTEGER NOT NULL,
+    cell_y INTEGER NOT NULL,
+    pickup_count INTEGER NOT NULL,
+    dropoff_count INTEGER NOT NULL,
+    PRIMARY KEY (zoom, hour_of_day, cell_x, cell_y)
+) WITHOUT ROWID;
+
+-- IQR bounds behind trip_metrics.outlier_flags, one row per metric, written by
+-- the same data_processor.py job that sets the flags. The bounds are stored before
+-- the flags are rewritten; flagged_at stays NULL until the last flag chunk commits.
+CREATE TABLE IF NOT EXISTS outlier_bounds (
+    metric TEXT PRIMARY KEY CHECK (metric IN ('speed', 'distance', 'duration')),
+    q1 REAL NOT NULL,
+    q3 REAL NOT NULL,
+    lower_bound REAL NOT NULL,
+    upper_bound REAL NOT NULL,
+    trip_count INTEGER NOT NULL,
+    computed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    flagged_at TEXT                            -- NULL until the last flag chunk commits
+);
+
+-- View 1: Complete trip details with all computed metrics
+CREATE VIEW IF NOT EXISTS vw_trip_analysis AS
+SELECT 
+    t.trip_id,
+    t.vendor_id,
+    t.pickup_datetime,
+    t.dropoff_datetime,
+    t.passenger_count,
+    t.pickup_longitude,
+    t.pickup_latitude,
+    t.dropoff_longitude,
+    t.dropoff_latitude,
+    t.trip_duration,
+    tm.trip_distance_miles,
+    tm.avg_speed_mph,
+    tm.trip_efficiency,
+    tm.hour_of_day,
+    tm.day_of_week,
+    tm.month_of_year,
+    tm.is_weekend,
+    tm.time_period,
+    tm.distance_category,
+    tm.duration_category,
+    tm.speed_category,
+    CASE tm.day_of_week
+        WHEN 0 THEN 'Monday'
+        WHEN 1 THEN 'Tuesday'
+        WHEN 2 THEN 'Wednesday'
+        WHEN 3 THEN 'Thursday'
+        WHEN 4 THEN 'Friday'
+        WHEN 5 THEN 'Saturday'
+        WHEN 6 THEN 'Sunday'
+    END AS day_name
+FROM trips t
+INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id;
+
+-- View 2: Hourly trip statistics
+CREATE VIEW IF NOT EXISTS vw_hourly_stats AS
+SELECT 
+    hour_of_day,
+    COUNT(*) as trip_count,
+    AVG(trip_distance_miles) as avg_distance,
+    AVG(avg_speed_mph) as avg_speed,
+    AVG(trip_duration) as avg_duration,
+    SUM(trip_distance_miles) as total_distance
+FROM vw_trip_analysis
+GROUP BY hour_of_day
+ORDER BY hour_of_day;
+
+-- View 3: Daily statistics
+CREATE VIEW IF NOT EXISTS vw_daily_stats AS
+SELECT 
+    day_of_week,
+    day_name,
+    is_weekend,
+    COUNT(*) as trip_count,
+    AVG(trip_distance_miles) as avg_distance,
+    AVG(avg_speed_mph) as avg_speed,
+    AVG(trip_duration) as avg_duration
+FROM vw_trip_analysis
+GROUP BY day_of_week, day_name, is_weekend
+ORDER BY day_of_week;
+
+-- View 4: Vendor comparison
+CREATE VIEW IF NOT EXISTS vw_vendor_stats AS
+SELECT 
+    vendor_id,
+    COUNT(*) as trip_count,
+    AVG(trip_distance_miles) as avg_distance,
+    AVG(avg_speed_mph) as avg_speed,
+    AVG(trip_duration) as avg_duration,
+    AVG(passenger_count) as avg_passengers
+FROM trips t
+INNER JOIN trip_metrics tm ON t.trip_id = tm.trip_id
+GROUP BY vendor_id;
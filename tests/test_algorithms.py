@@ -0,0 +1,184 @@
+"""algorithms.py against the standard library and the original implementations"""
+
+import math
+import random
+from decimal import Decimal
+
+import pytest
+
+from algorithms import QuickSort, TimeSeriesGrouper
+
+
+def sort_inputs():
+    rng = random.Random(7)
+    values = [rng.random() for _ in range(3000)]
+    return {
+        'sorted': sorted(values),
+        'reversed': sorted(values, reverse=True),
+        'duplicates': [rng.randrange(24) for _ in range(3000)],
+        'few ties': [rng.randrange(2000) for _ in range(3000)],
+        'random': values,
+    }
+
+
+@pytest.mark.parametrize('name', list(sort_inputs()))
+@pytest.mark.parametrize('reverse', [False, True])
+def test_stable_sort_keeps_ties_in_input_order(name, reverse):
+    rows = [{'key': value, 'position': position} for position, value in enumerate(sort_inputs()[name])]
+    result = QuickSort.sort(rows, key=lambda row: row['key'], reverse=reverse, stable=True)
+    expected = sorted(rows, key=lambda row: row['key'], reverse=reverse)
+    assert [row['position'] for row in result] == [row['position'] for row in expected]
+
+
+@pytest.mark.parametrize('name', list(sort_inputs()))
+def test_unstable_sort_orders_keys(name):
+    values = sort_inputs()[name]
+    assert QuickSort.sort(values) == sorted(values)
+    assert QuickSort.sort(values, reverse=True) == sorted(values, reverse=True)
+
+
+def test_stable_sort_of_unhashable_keys():
+    rows = [([position % 3], position) for position in range(50)]
+    result = QuickSort.sort(rows, key=lambda row: row[0], stable=True)
+    assert result == sorted(rows, key=lambda row: row[0])
+
+
+def test_sort_returns_a_copy():
+    values = [3, 1, 2]
+    assert QuickSort.sort(values, stable=True) == [1, 2, 3]
+    assert values == [3, 1, 2]
+    assert QuickSort.sort([]) == []
+
+
+def original_aggregate(rows_by_key, metric_keys):
+    """The list-based TimeSeriesGrouper.aggregate this one replaced"""
+    result = {}
+    for key, rows in rows_by_key.items():
+        group = {'count': len(rows)}
+        for metric in metric_keys:
+            values = [row[metric] for row in rows if metric in row and row[metric] is not None]
+            if values:
+                total = 0
+                for value in values:
+                    total += value
+                minimum = maximum = values[0]
+                for value in values[1:]:
+                    if value < minimum:
+                        minimum = value
+                    if value > maximum:
+                        maximum = value
+                group.update({f'{metric}_sum': total, f'{metric}_avg': total / len(values),
+                              f'{metric}_min': minimum, f'{metric}_max': maximum})
+        result[key] = group
+    return result
+
+
+def grouped(rows, **options):
+    grouper = TimeSeriesGrouper(**options)
+    for key, row in rows:
+        grouper.add_to_group(key, row)
+    return grouper
+
+
+def by_key(rows):
+    rows_by_key = {}
+    for key, row in rows:
+        rows_by_key.setdefault(key, []).append(row)
+    return rows_by_key
+
+
+def assert_same_values(actual, expected):
+    """Equal with matching types, NaN equal to NaN"""
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert actual[key].keys() == expected[key].keys(), key
+        for field, value in expected[key].items():
+            if isinstance(value, float) and math.isnan(value):
+                assert math.isnan(actual[key][field]), (key, field)
+            else:
+                assert actual[key][field] == pytest.approx(value) and type(actual[key][field]) is type(value), \
+                    (key, field, actual[key][field], value)
+
+
+def test_grouper_counts_bools_like_the_original():
+    rows = [('a', {'flag': True, 'x': 1}), ('a', {'flag': False, 'x': 2}), ('a', {'flag': True, 'x': 3}),
+            ('b', {'flag': False})]
+    expected = original_aggregate(by_key(rows), ['flag', 'x'])
+    assert expected['a']['flag_sum'] == 2 and expected['b']['flag_max'] is False
+    assert_same_values(grouped(rows).aggregate(['flag', 'x']), expected)
+
+    # numeric_only skips them
+    result = grouped(rows, numeric_only=True).aggregate(['flag', 'x'])
+    assert 'flag_sum' not in result['a'] and result['b'] == {'count': 1}
+
+
+def test_grouper_keeps_decimals_like_the_original():
+    rows = [('a', {'fare': Decimal('12.50')}), ('a', {'fare': Decimal('7.25')}), ('b', {'fare': Decimal('3')})]
+    expected = original_aggregate(by_key(rows), ['fare'])
+    result = grouped(rows).aggregate(['fare'])
+    assert_same_values(result, expected)
+    assert result['a']['fare_sum'] == Decimal('19.75') and result['a']['fare_avg'] == Decimal('9.875')
+
+    # numeric_only converts them to float
+    result = grouped(rows, numeric_only=True).aggregate(['fare'], include_std=True)
+    assert result['a']['fare_sum'] == 19.75 and type(result['a']['fare_sum']) is float
+    assert result['a']['fare_std'] == pytest.approx(2.625)
+
+
+def test_grouper_carries_nan_like_the_original():
+    nan = float('nan')
+    rows = [('a', {'x': 1.0}), ('a', {'x': nan}), ('a', {'x': 3.0}), ('b', {'x': nan}), ('b', {'x': 2.0})]
+    expected = original_aggregate(by_key(rows), ['x'])
+    assert math.isnan(expected['a']['x_sum']) and expected['a']['x_max'] == 3.0
+    assert_same_values(grouped(rows).aggregate(['x']), expected)
+
+    # numeric_only skips NaN
+    result = grouped(rows, numeric_only=True).aggregate(['x'])
+    assert result['a']['x_sum'] == 4.0 and result['b'] == {'count': 2, 'x_sum': 2.0, 'x_avg': 2.0,
+                                                             'x_min': 2.0, 'x_max': 2.0}
+
+
+def test_grouper_fails_on_strings_like_the_original():
+    rows = [('a', {'x': 1.5, 'period': 'Morning'}), ('a', {'x': 2.5, 'period': 'Evening'})]
+    grouper = grouped(rows)
+    # Only asking for the string metric fails, as summing the stored rows did
+    assert_same_values(grouper.aggregate(['x']), original_aggregate(by_key(rows), ['x']))
+    with pytest.raises(TypeError):
+        original_aggregate(by_key(rows), ['period'])
+    with pytest.raises(TypeError):
+        grouper.aggregate(['x', 'period'])
+    with pytest.raises(TypeError):
+        TimeSeriesGrouper().merge(grouper).aggregate(['period'])
+
+    # numeric_only skips them
+    assert grouped(rows, numeric_only=True).aggregate(['x', 'period'])['a'] == {
+        'count': 2, 'x_sum': 4.0, 'x_avg': 2.0, 'x_min': 1.5, 'x_max': 2.5}
+
+
+def test_grouper_counts_rows_that_are_not_dicts():
+    rows = [(hour % 3, f'trip{hour}') for hour in range(10)]
+    grouper = grouped(rows)
+    assert grouper.aggregate(['x']) == {0: {'count': 4}, 1: {'count': 3}, 2: {'count': 3}}
+    assert grouper.get_sorted_groups()[0] == (0, {'count': 4})
+
+
+@pytest.mark.parametrize('numeric_only', [False, True])
+def test_grouper_bulk_path_matches_row_by_row(numeric_only):
+    rng = random.Random(5)
+    size = 2000
+    keys = [rng.randrange(6) for _ in range(size)]
+    values = {
+        'speed': [rng.uniform(2, 40) for _ in range(size)],
+        'passengers': [rng.randrange(1, 7) for _ in range(size)],
+        'flag': [rng.random() < 0.5 for _ in range(size)],
+        'fare': [Decimal(rng.randrange(500, 5000)) / 100 for _ in range(size)],
+        'gaps': [rng.uniform(0, 1) if rng.random() < 0.8 else float('nan') for _ in range(size)],
+        'sparse': [rng.uniform(0, 1) if rng.random() < 0.8 else None for _ in range(size)],
+    }
+    metrics = list(values)
+
+    bulk = TimeSeriesGrouper(numeric_only=numeric_only)
+    bulk.add_many(keys, values)
+    rows = [(key, {metric: values[metric][row] for metric in metrics}) for row, key in enumerate(keys)]
+    expected = grouped(rows, numeric_only=numeric_only).aggregate(metrics)
+    assert_same_values(bulk.aggregate(metrics), expected)
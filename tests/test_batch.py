@@ -0,0 +1,115 @@
+"""POST /api/batch: per-part status, parameter merging and rejected requests"""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import loadtest
+import server
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=300) as embedded:
+        yield embedded
+
+
+def get(embedded, path):
+    with urllib.request.urlopen(embedded.url + path) as response:
+        return json.loads(response.read())
+
+
+def post(embedded, body, path='/api/batch'):
+    data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(embedded.url + path, data=data, method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def test_parts_match_their_own_endpoints(embedded):
+    status, body = post(embedded, {'requests': [
+        {'id': 'stats', 'path': '/api/statistics'},
+        {'id': 'routes', 'path': '/api/top-routes', 'params': {'limit': 3, 'is_weekend': False}},
+        {'id': 'trips', 'path': '/api/trips?sort_by=distance', 'params': {'limit': 5, 'include_total': False}},
+    ]})
+    assert status == 200
+    assert body['success'] is True
+    parts = body['responses']
+    assert set(parts) == {'stats', 'routes', 'trips'}
+    assert all(part['status'] == 200 for part in parts.values())
+
+    assert parts['stats']['path'] == '/api/statistics'
+    assert parts['stats']['body'] == get(embedded, '/api/statistics')
+    # Booleans are passed on as 'true'/'false', like a query string
+    assert parts['routes']['body'] == get(embedded, '/api/top-routes?limit=3&is_weekend=false')
+    # The path's own query string and params are merged
+    assert parts['trips']['body'] == get(embedded, '/api/trips?sort_by=distance&limit=5&include_total=false')
+    assert parts['trips']['body']['total'] is None
+
+
+def test_each_part_reports_its_own_status(embedded):
+    status, body = post(embedded, {'requests': [
+        {'path': '/api/statistics'},
+        {'path': '/api/top-routes', 'params': {'hour': 99}},
+        {'path': '/api/trips', 'params': {'vendor_id': 'abc'}},
+        {'path': '/api/nope'},
+        {'path': '/api/trips/export'},
+        {'path': '/api/metrics'},
+    ]})
+    assert status == 200
+    assert body['success'] is False
+    parts = body['responses']
+    # Parts without an id are keyed by position
+    assert [parts[str(index)]['status'] for index in range(6)] == [200, 400, 400, 404, 404, 404]
+    assert parts['1']['body'] == {'success': False, 'error': 'hour must be between 0 and 23'}
+    for index in ('3', '4', '5'):
+        assert parts[index]['body']['success'] is False
+        assert 'not available in batch' in parts[index]['body']['error']
+
+
+def test_failing_handler_is_a_500_part(embedded, monkeypatch):
+    def broken(self, params):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(server.TaxiAPIHandler, 'handle_get_statistics', broken)
+    status, body = post(embedded, {'requests': [
+        {'id': 'broken', 'path': '/api/statistics'},
+        {'id': 'routes', 'path': '/api/top-routes'},
+    ]})
+    assert status == 200
+    assert body['responses']['broken']['status'] == 500
+    assert 'boom' in body['responses']['broken']['body']['error']
+    assert body['responses']['routes']['status'] == 200
+
+
+@pytest.mark.parametrize('body', [
+    b'not json',
+    {},
+    {'requests': []},
+    {'requests': {'path': '/api/statistics'}},
+    {'requests': [{'id': 'x'}]},
+    {'requests': ['/api/statistics']},
+    {'requests': [{'path': '/api/trips', 'params': ['limit', 5]}]},
+    {'requests': [{'id': 'a', 'path': '/api/statistics'}, {'id': 'a', 'path': '/api/trips'}]},
+    {'requests': [{'path': '/api/statistics'}] * (server.BATCH_MAX_REQUESTS + 1)},
+])
+def test_malformed_batches_are_rejected(embedded, body):
+    status, _ = post(embedded, body)
+    assert status == 400
+
+
+def test_oversized_body_is_rejected(embedded, monkeypatch):
+    monkeypatch.setattr(server, 'BATCH_MAX_BODY_BYTES', 64)
+    status, _ = post(embedded, {'requests': [{'id': 'x' * 64, 'path': '/api/statistics'}]})
+    assert status == 413
+
+
+def test_batch_is_post_only(embedded):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(embedded.url + '/api/batch')
+    assert error.value.code == 404
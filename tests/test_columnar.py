@@ -0,0 +1,84 @@
+"""Columnar engine snapshots: startup load, refreshes and the dataset generation"""
+
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import columnar
+import loadtest
+import server
+from data_processor import DataProcessor
+
+pytestmark = pytest.mark.skipif(not columnar.available(), reason="NumPy not installed")
+
+REQUESTS = 4
+REFRESH_DELAY = 1.5  # longer than the pool timeout
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    monkeypatch.setattr(server, 'DB_POOL_SIZE', 2)
+    monkeypatch.setattr(server, 'DB_POOL_TIMEOUT', 1)
+    with loadtest.EmbeddedServer(trips=500, columnar=True) as embedded:
+        yield embedded
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def test_snapshot_is_loaded_before_serving(embedded):
+    assert server.columnar_engine._columns is not None
+    assert server.columnar_engine._columns.size == 500
+
+
+def test_slow_refresh_does_not_exhaust_the_pool(embedded, monkeypatch):
+    refresh = server.columnar_engine._refresh
+
+    def slow_refresh(connect):
+        conn = connect()
+        try:
+            time.sleep(REFRESH_DELAY)
+        finally:
+            conn.close()
+        refresh(connect)
+
+    # Every request is due for a refresh; one at a time runs it, slowly
+    monkeypatch.setattr(server.columnar_engine, 'refresh_interval', 0)
+    monkeypatch.setattr(server.columnar_engine, '_refresh', slow_refresh)
+    with ThreadPoolExecutor(REQUESTS) as workers:
+        results = list(workers.map(get, [embedded.url + '/api/trips?limit=5'] * REQUESTS))
+
+    for status, body in results:
+        assert status == 200
+        assert body['total'] == 500
+
+
+def test_snapshot_reloads_when_the_generation_changes(embedded, monkeypatch):
+    engine = server.columnar_engine
+    monkeypatch.setattr(engine, 'refresh_interval', 0)
+    snapshot = engine.columns(server.db_pool.acquire)
+    assert engine.columns(server.db_pool.acquire) is snapshot
+
+    # Removing trips alone is not noticed; the processor run that follows bumps the generation
+    processor = DataProcessor(server.storage)
+    processor.conn = server.storage.connect()
+    processor.cursor = processor.conn.cursor()
+    processor.cursor.execute("DELETE FROM trip_metrics WHERE trip_id = 'id0000000'")
+    processor.cursor.execute("DELETE FROM trips WHERE trip_id = 'id0000000'")
+    processor.conn.commit()
+    assert engine.columns(server.db_pool.acquire) is snapshot
+
+    processor.flag_outliers()
+    processor.conn.close()
+    reloaded = engine.columns(server.db_pool.acquire)
+    assert reloaded.generation == snapshot.generation + 1
+    assert reloaded.size == 499
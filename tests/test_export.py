@@ -0,0 +1,129 @@
+"""/api/trips/export: chunked NDJSON and CSV streams against /api/trips pages"""
+
+import csv
+import io
+import json
+import socket
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+import pytest
+
+import loadtest
+import server
+
+TRIPS = 300
+FETCH_SIZE = 64  # several chunks per export
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=TRIPS) as embedded:
+        yield embedded
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(server, 'EXPORT_FETCH_SIZE', FETCH_SIZE)
+
+
+def raw_get(embedded, path, version='HTTP/1.1'):
+    """(status line, headers, raw body) as sent on the wire"""
+    url = urlparse(embedded.url)
+    with socket.create_connection((url.hostname, url.port)) as sock:
+        sock.sendall(f"GET {path} {version}\r\nHost: {url.hostname}\r\nConnection: close\r\n\r\n".encode('ascii'))
+        data = b''
+        while True:
+            received = sock.recv(65536)
+            if not received:
+                break
+            data += received
+    head, _, body = data.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode('latin-1').split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status_line, headers, body
+
+
+def dechunk(body):
+    """Split a chunked body into its chunks, checking the framing and the terminator"""
+    chunks = []
+    while True:
+        size_line, _, body = body.partition(b"\r\n")
+        size = int(size_line, 16)
+        if size == 0:
+            assert body == b"\r\n"
+            return chunks
+        chunk, terminator, body = body[:size], body[size:size + 2], body[size + 2:]
+        assert len(chunk) == size and terminator == b"\r\n"
+        chunks.append(chunk)
+
+
+def trip_page(embedded, query):
+    with urllib.request.urlopen(f"{embedded.url}/api/trips?limit={TRIPS}&include_total=false&{query}") as response:
+        return json.loads(response.read())['data']
+
+
+def test_ndjson_is_streamed_in_chunks(embedded):
+    status, headers, body = raw_get(embedded, '/api/trips/export?sort_by=distance&order=asc')
+    assert status.split()[1] == '200'
+    assert headers['transfer-encoding'] == 'chunked'
+    assert 'content-length' not in headers
+    assert headers['content-type'].startswith('application/x-ndjson')
+    assert headers['content-disposition'] == 'attachment; filename="trips.ndjson"'
+
+    chunks = dechunk(body)
+    assert len(chunks) == -(-TRIPS // FETCH_SIZE)
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    rows = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+    assert rows == trip_page(embedded, 'sort_by=distance&order=asc')
+
+
+def test_csv_matches_the_trip_rows(embedded):
+    status, headers, body = raw_get(embedded, '/api/trips/export?format=CSV&sort_by=speed&vendor_id=2')
+    assert status.split()[1] == '200'
+    assert headers['content-type'].startswith('text/csv')
+    assert headers['content-disposition'] == 'attachment; filename="trips.csv"'
+
+    reader = csv.reader(io.StringIO(b''.join(dechunk(body)).decode('utf-8')))
+    columns = next(reader)
+    rows = list(reader)
+    expected = trip_page(embedded, 'sort_by=speed&vendor_id=2')
+    assert 0 < len(rows) == len(expected) < TRIPS
+    assert columns == list(expected[0])
+    for row, trip in zip(rows, expected):
+        assert row[columns.index('trip_id')] == trip['trip_id']
+        assert row[columns.index('vendor_id')] == '2'
+        assert float(row[columns.index('avg_speed_mph')]) == pytest.approx(trip['avg_speed_mph'])
+
+
+def test_unsorted_export_has_every_trip_once(embedded):
+    _, _, body = raw_get(embedded, '/api/trips/export')
+    ids = [json.loads(line)['trip_id'] for line in b''.join(dechunk(body)).splitlines()]
+    assert len(ids) == len(set(ids)) == TRIPS
+
+
+def test_http_10_reads_until_close(embedded):
+    status, headers, body = raw_get(embedded, '/api/trips/export?format=csv', version='HTTP/1.0')
+    assert status.split()[1] == '200'
+    assert 'transfer-encoding' not in headers
+    assert headers['connection'] == 'close'
+    lines = body.decode('utf-8').splitlines()
+    assert len(lines) == TRIPS + 1
+
+
+def test_empty_export(embedded):
+    _, _, body = raw_get(embedded, '/api/trips/export?min_distance=100000')
+    assert dechunk(body) == []
+    _, _, body = raw_get(embedded, '/api/trips/export?format=csv&min_distance=100000')
+    assert len(b''.join(dechunk(body)).decode('utf-8').splitlines()) == 1
+
+
+@pytest.mark.parametrize('query', ['format=xml', 'format=json', 'vendor_id=abc', 'min_distance=far'])
+def test_bad_requests_are_rejected(embedded, query):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{embedded.url}/api/trips/export?{query}")
+    assert error.value.code == 400
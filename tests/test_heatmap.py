@@ -0,0 +1,180 @@
+"""heatmap.py tile math and the /api/heatmap viewport reads"""
+
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+import loadtest
+import server
+from heatmap import (ALL_VALUES, HEATMAP_MAX_ZOOM, HEATMAP_MIN_ZOOM, MAX_MERCATOR_LATITUDE, count_cells,
+                     pyramid_rows, tile_bounds, tile_x, tile_y)
+
+TRIPS = 600
+
+
+def random_points(count, seed=7):
+    generator = random.Random(seed)
+    return [(generator.uniform(-179.9, 179.9), generator.uniform(-85, 85)) for _ in range(count)]
+
+
+def test_whole_world_tile():
+    assert tile_x(-180, 0) == tile_x(179.99, 0) == 0
+    assert tile_y(85, 0) == tile_y(-85, 0) == 0
+    west, south, east, north = tile_bounds(0, 0, 0)
+    assert (west, east) == (-180, 180)
+    assert north == pytest.approx(MAX_MERCATOR_LATITUDE) and south == pytest.approx(-MAX_MERCATOR_LATITUDE)
+
+
+def test_known_tiles():
+    # Zoom 1 quarters the world at the equator and the antimeridian; rows count from the north
+    assert (tile_x(-1, 1), tile_y(1, 1)) == (0, 0)
+    assert (tile_x(1, 1), tile_y(-1, 1)) == (1, 1)
+    # Times Square, by the slippy-map formula y = (1 - ln(tan(lat) + sec(lat)) / pi) / 2 * 2**zoom
+    assert (tile_x(-73.9855, 12), tile_y(40.7580, 12)) == (1206, 1539)
+    assert (tile_x(-73.9855, 17), tile_y(40.7580, 17)) == (38598, 49258)
+
+
+def test_out_of_range_coordinates_clamp_to_edge_tiles():
+    for zoom in (HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM):
+        last = (1 << zoom) - 1
+        assert tile_x(-200, zoom) == 0 and tile_x(180, zoom) == tile_x(500, zoom) == last
+        assert tile_y(90, zoom) == 0 and tile_y(-90, zoom) == last
+        assert tile_y(MAX_MERCATOR_LATITUDE + 1, zoom) == 0
+
+
+@pytest.mark.parametrize('zoom', [0, HEATMAP_MIN_ZOOM, 12, HEATMAP_MAX_ZOOM])
+def test_points_fall_inside_their_tile(zoom):
+    for longitude, latitude in random_points(500):
+        west, south, east, north = tile_bounds(tile_x(longitude, zoom), tile_y(latitude, zoom), zoom)
+        assert west <= longitude < east
+        assert south <= latitude <= north
+
+
+def test_tiles_split_into_four_children():
+    for longitude, latitude in random_points(500, seed=11):
+        for zoom in range(HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM):
+            assert tile_x(longitude, zoom + 1) >> 1 == tile_x(longitude, zoom)
+            assert tile_y(latitude, zoom + 1) >> 1 == tile_y(latitude, zoom)
+
+    west, south, east, north = tile_bounds(5, 9, 4)
+    children = [tile_bounds(x, y, 5) for x in (10, 11) for y in (18, 19)]
+    assert min(child[0] for child in children) == pytest.approx(west)
+    assert max(child[2] for child in children) == pytest.approx(east)
+    assert min(child[1] for child in children) == pytest.approx(south)
+    assert max(child[3] for child in children) == pytest.approx(north)
+
+
+def test_pyramid_matches_direct_counts_at_every_zoom():
+    generator = random.Random(3)
+    trips = [(generator.uniform(-74.05, -73.75), generator.uniform(40.6, 40.9),
+              generator.uniform(-74.05, -73.75), generator.uniform(40.6, 40.9), generator.randrange(24))
+             for _ in range(2000)]
+    rows = pyramid_rows(count_cells(trips))
+    assert {row[0] for row in rows} == set(range(HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM + 1))
+
+    for zoom in range(HEATMAP_MIN_ZOOM, HEATMAP_MAX_ZOOM + 1):
+        expected = {}
+        for pickup_lon, pickup_lat, dropoff_lon, dropoff_lat, hour in trips:
+            for hour_key in (hour, ALL_VALUES):
+                for position, (lon, lat) in enumerate(((pickup_lon, pickup_lat), (dropoff_lon, dropoff_lat))):
+                    counts = expected.setdefault((hour_key, tile_x(lon, zoom), tile_y(lat, zoom)), [0, 0])
+                    counts[position] += 1
+        actual = {(hour, x, y): [pickups, dropoffs] for row_zoom, hour, x, y, pickups, dropoffs in rows
+                  if row_zoom == zoom}
+        assert actual == expected, zoom
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=TRIPS) as embedded:
+        yield embedded
+
+
+@pytest.fixture(scope='module')
+def trips(embedded):
+    return get(embedded, f"/api/trips?limit={TRIPS}&include_total=false")[1]['data']
+
+
+def get(embedded, path):
+    try:
+        with urllib.request.urlopen(embedded.url + path) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def expected_cells(trips, zoom, bbox, hour=None):
+    west, south, east, north = bbox
+    x_range = range(tile_x(west, zoom), tile_x(east, zoom) + 1)
+    y_range = range(tile_y(north, zoom), tile_y(south, zoom) + 1)
+    cells = {}
+    for trip in trips:
+        if hour is not None and trip['hour_of_day'] != hour:
+            continue
+        for position, prefix in enumerate(('pickup', 'dropoff')):
+            cell = (tile_x(trip[f'{prefix}_longitude'], zoom), tile_y(trip[f'{prefix}_latitude'], zoom))
+            if cell[0] in x_range and cell[1] in y_range:
+                cells.setdefault(cell, [0, 0])[position] += 1
+    return cells
+
+
+@pytest.mark.parametrize('zoom', [HEATMAP_MIN_ZOOM, 13, HEATMAP_MAX_ZOOM])
+def test_default_viewport_matches_the_trips(embedded, trips, zoom):
+    status, body = get(embedded, f"/api/heatmap?zoom={zoom}")
+    assert status == 200
+    assert body['zoom'] == zoom and body['hour'] is None
+    assert body['bbox'] == list(server.HEATMAP_DEFAULT_BBOX)
+    assert body['fields'] == ['x', 'y', 'pickup_count', 'dropoff_count']
+
+    cells = {(x, y): [pickups, dropoffs] for x, y, pickups, dropoffs in body['cells']}
+    assert cells == expected_cells(trips, zoom, server.HEATMAP_DEFAULT_BBOX)
+    assert body['max_pickup_count'] == max(counts[0] for counts in cells.values())
+    assert body['max_dropoff_count'] == max(counts[1] for counts in cells.values())
+
+
+def test_bbox_and_hour_select_cells(embedded, trips):
+    hour = max(range(24), key=lambda h: sum(trip['hour_of_day'] == h for trip in trips))
+    bbox = (-74.0, 40.70, -73.95, 40.78)
+    query = f"zoom=15&bbox={','.join(map(str, bbox))}&hour={hour}"
+    status, body = get(embedded, f"/api/heatmap?{query}")
+    assert status == 200
+    assert body['hour'] == hour and body['bbox'] == list(bbox)
+    cells = {(x, y): [pickups, dropoffs] for x, y, pickups, dropoffs in body['cells']}
+    assert cells and cells == expected_cells(trips, 15, bbox, hour)
+
+
+def test_empty_viewport(embedded):
+    status, body = get(embedded, "/api/heatmap?zoom=12&bbox=10,10,10.5,10.5")
+    assert status == 200
+    assert body['cells'] == [] and body['max_pickup_count'] == 0 and body['max_dropoff_count'] == 0
+
+
+@pytest.mark.parametrize('query', [
+    f'zoom={HEATMAP_MIN_ZOOM - 1}',
+    f'zoom={HEATMAP_MAX_ZOOM + 1}',
+    'zoom=twelve',
+    'bbox=-74,40,-73',
+    'bbox=-73,40,-74,41',
+    'bbox=-74,41,-73,40',
+    'bbox=a,b,c,d',
+    'hour=24',
+    'hour=-1',
+    f'zoom={HEATMAP_MAX_ZOOM}&bbox=-75,40,-73,42',
+])
+def test_bad_parameters_are_rejected(embedded, query):
+    status, _ = get(embedded, f"/api/heatmap?{query}")
+    assert status == 400
+
+
+def test_cell_cap_counts_the_covered_tiles(embedded, monkeypatch):
+    west, south, east, north = server.HEATMAP_DEFAULT_BBOX
+    covered = ((tile_x(east, HEATMAP_MIN_ZOOM) - tile_x(west, HEATMAP_MIN_ZOOM) + 1)
+               * (tile_y(south, HEATMAP_MIN_ZOOM) - tile_y(north, HEATMAP_MIN_ZOOM) + 1))
+    monkeypatch.setattr(server, 'HEATMAP_MAX_CELLS', covered)
+    status, _ = get(embedded, f"/api/heatmap?zoom={HEATMAP_MIN_ZOOM}")
+    assert status == 200
+    status, _ = get(embedded, f"/api/heatmap?zoom={HEATMAP_MIN_ZOOM + 1}")
+    assert status == 400
@@ -0,0 +1,147 @@
+"""MetricsRegistry and /api/metrics: the Prometheus text exposition format"""
+
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+import loadtest
+import server
+from metrics import LATENCY_BUCKETS, MetricsRegistry, RequestTimer
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(,|$)')
+
+
+def parse(text):
+    """
+    Parse the exposition format strictly enough to catch malformed output.
+    Returns ({family: type}, [(name, {label: value}, value)]).
+    """
+    assert text.endswith('\n')
+    types, helps, samples = {}, set(), []
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            family = line.split()[2]
+            assert family not in helps, family
+            helps.add(family)
+        elif line.startswith('# TYPE '):
+            _, _, family, kind = line.split()
+            assert family in helps and family not in types, family
+            assert kind in ('counter', 'gauge', 'histogram')
+            types[family] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name, _, label_text, value = match.groups()
+            labels = {}
+            if label_text:
+                position = 0
+                for label in LABEL.finditer(label_text):
+                    assert label.start() == position, line
+                    labels[label.group(1)] = label.group(2)
+                    position = label.end()
+                assert position == len(label_text), line
+            family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in types else name
+            assert family in types, f"sample before its TYPE line: {line}"
+            samples.append((name, labels, float(value)))
+    return types, samples
+
+
+def check_histograms(samples):
+    """Buckets are cumulative, end in +Inf, and +Inf equals _count"""
+    series = {}
+    for name, labels, value in samples:
+        if name.endswith('_bucket'):
+            key = (name[:-len('_bucket')], tuple(sorted((k, v) for k, v in labels.items() if k != 'le')))
+            series.setdefault(key, []).append((labels['le'], value))
+    counts = {(name[:-len('_count')], tuple(sorted(labels.items()))): value
+              for name, labels, value in samples if name.endswith('_count')}
+    for key, buckets in series.items():
+        assert [le for le, _ in buckets] == [repr(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        values = [value for _, value in buckets]
+        assert values == sorted(values)
+        assert values[-1] == counts[key]
+    return series
+
+
+def timer(rows=0, **phases):
+    request_timer = RequestTimer()
+    for phase, seconds in phases.items():
+        request_timer.add(phase, seconds)
+    request_timer.add_rows(rows)
+    return request_timer
+
+
+def test_registry_renders_every_family():
+    registry = MetricsRegistry()
+    registry.observe_request('/api/trips', 200, 0.004, timer(rows=10, db_execute=0.003), 500)
+    registry.observe_request('/api/trips', 200, 0.2, timer(rows=5, db_execute=0.15), 250)
+    registry.observe_request('/api/trips', 400, 0.0005, timer(), 80)
+    registry.observe_request('unmatched', 404, 100.0, timer(), 10)
+
+    types, samples = parse(registry.render())
+    assert types == {
+        'taxi_api_requests_total': 'counter',
+        'taxi_api_request_duration_seconds': 'histogram',
+        'taxi_api_request_phase_seconds': 'histogram',
+        'taxi_api_rows_fetched_total': 'counter',
+        'taxi_api_response_bytes_total': 'counter',
+        'taxi_api_start_time_seconds': 'gauge',
+    }
+    values = {(name, tuple(sorted(labels.items()))): value for name, labels, value in samples}
+    assert values[('taxi_api_requests_total', (('route', '/api/trips'), ('status', '200')))] == 2
+    assert values[('taxi_api_requests_total', (('route', '/api/trips'), ('status', '400')))] == 1
+    assert values[('taxi_api_rows_fetched_total', (('route', '/api/trips'),))] == 15
+    assert values[('taxi_api_response_bytes_total', (('route', '/api/trips'),))] == 830
+    assert values[('taxi_api_request_duration_seconds_sum',
+                   (('route', '/api/trips'), ('status', '200')))] == pytest.approx(0.204)
+
+    series = check_histograms(samples)
+    trips_ok = dict(series[('taxi_api_request_duration_seconds', (('route', '/api/trips'), ('status', '200')))])
+    assert trips_ok['0.0025'] == 0 and trips_ok['0.005'] == 1 and trips_ok['0.25'] == 2
+    # Slower than the last bound: only the +Inf bucket counts it
+    unmatched = dict(series[('taxi_api_request_duration_seconds', (('route', 'unmatched'), ('status', '404')))])
+    assert unmatched[repr(LATENCY_BUCKETS[-1])] == 0 and unmatched['+Inf'] == 1
+    phases = dict(series[('taxi_api_request_phase_seconds', (('phase', 'db_execute'), ('route', '/api/trips')))])
+    assert phases['0.005'] == 2 and phases['0.25'] == 3
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.observe_request('/api/"odd"\\route\n', 200, 0.01, timer(), 1)
+    _, samples = parse(registry.render())
+    routes = {labels['route'] for _, labels, _ in samples if 'route' in labels}
+    assert routes == {'/api/\\"odd\\"\\\\route\\n'}
+
+
+def test_empty_registry_is_valid():
+    types, samples = parse(MetricsRegistry().render())
+    assert len(types) == 6
+    assert [name for name, _, _ in samples] == ['taxi_api_start_time_seconds']
+
+
+def test_metrics_endpoint_counts_requests(monkeypatch):
+    monkeypatch.setattr(server, 'metrics_registry', MetricsRegistry())
+    with loadtest.EmbeddedServer(trips=200) as embedded:
+        for path in ('/api/statistics', '/api/statistics', '/api/trips?limit=3', '/api/nope'):
+            try:
+                urllib.request.urlopen(embedded.url + path).read()
+            except urllib.error.HTTPError:
+                pass
+        with urllib.request.urlopen(embedded.url + '/api/metrics') as response:
+            content_type = response.headers['Content-Type']
+            text = response.read().decode('utf-8')
+
+    assert content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    _, samples = parse(text)
+    check_histograms(samples)
+    requests = {(labels['route'], labels['status']): value
+                for name, labels, value in samples if name == 'taxi_api_requests_total'}
+    # The scrape itself is recorded after it is rendered
+    assert requests == {('/api/statistics', '200'): 2, ('/api/trips', '200'): 1, ('unmatched', '404'): 1}
+    rows = {labels['route']: value for name, labels, value in samples if name == 'taxi_api_rows_fetched_total'}
+    assert rows['/api/trips'] >= 3
+    sent = {labels['route']: value for name, labels, value in samples if name == 'taxi_api_response_bytes_total'}
+    assert sent['/api/statistics'] > 0
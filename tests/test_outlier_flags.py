@@ -0,0 +1,76 @@
+"""DataProcessor.flag_outliers against the embedded SQLite backend"""
+
+import pytest
+
+import data_processor
+import loadtest
+from data_processor import DataProcessor
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def processor(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'trips.sqlite3')
+    loadtest.build_standin_database(storage, trips=3000)
+    processor = DataProcessor(storage)
+    processor.conn = storage.connect()
+    processor.cursor = processor.conn.cursor()
+    yield processor
+    processor.conn.close()
+
+
+def stored_flags(processor):
+    processor.cursor.execute("SELECT trip_id, outlier_flags FROM trip_metrics ORDER BY trip_id")
+    return processor.cursor.fetchall()
+
+
+def flagged_at(processor):
+    processor.cursor.execute("SELECT metric, flagged_at FROM outlier_bounds")
+    return dict(processor.cursor.fetchall())
+
+
+def test_flags_match_bounds_once_complete(processor):
+    bounds = processor.storage.outlier_bounds(processor.cursor, list(data_processor.OUTLIER_FLAGS))
+    assert all(record['flagged_at'] is not None for record in bounds.values())
+
+    processor.cursor.execute("""
+        SELECT tm.outlier_flags, tm.avg_speed_mph, tm.trip_distance_miles, t.trip_duration
+        FROM trip_metrics tm INNER JOIN trips t ON t.trip_id = tm.trip_id
+    """)
+    for flags, *values in processor.cursor.fetchall():
+        expected = sum(bit for (metric, bit), value in zip(data_processor.OUTLIER_FLAGS.items(), values)
+                       if not bounds[metric]['lower_bound'] <= value <= bounds[metric]['upper_bound'])
+        assert flags == expected
+
+
+def test_interrupted_run_leaves_bounds_unapplied(processor, monkeypatch):
+    monkeypatch.setattr(data_processor, 'OUTLIER_UPDATE_CHUNK', 500)
+    execute = processor.cursor.execute
+    chunks = []
+
+    def failing_execute(operation, params=None):
+        if operation.lstrip().startswith('UPDATE trip_metrics'):
+            chunks.append(operation)
+            if len(chunks) == 3:
+                raise processor.storage.Error("connection lost")
+        return execute(operation, params)
+
+    monkeypatch.setattr(processor.cursor, 'execute', failing_execute)
+    with pytest.raises(processor.storage.Error):
+        processor.flag_outliers()
+    assert set(flagged_at(processor).values()) == {None}
+
+    monkeypatch.setattr(processor.cursor, 'execute', execute)
+    processor.flag_outliers()
+    assert None not in flagged_at(processor).values()
+
+
+def test_too_few_trips_clears_previous_flags(processor):
+    assert any(flags for _, flags in stored_flags(processor))
+
+    processor.cursor.execute("DELETE FROM trips WHERE trip_id NOT IN ('id0000000', 'id0000001')")
+    processor.conn.commit()
+    processor.flag_outliers()
+
+    assert all(flags == 0 for _, flags in stored_flags(processor))
+    assert flagged_at(processor) == {}
@@ -0,0 +1,55 @@
+"""QueryExecutor timeouts for SQL and callable queries (SQLite pool)"""
+
+import time
+
+import pytest
+
+import query_executor
+from db_pool import ConnectionPool
+from query_executor import Query, QueryExecutor, QueryTimeout
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def executor(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'trips.sqlite3')
+    storage.initialize_schema()
+    pool = ConnectionPool(storage.connect, 4, timeout=5)
+    yield QueryExecutor(pool, max_workers=4, default_timeout=30)
+    pool.close_all()
+
+
+def count_trips(cursor):
+    cursor.execute("SELECT COUNT(*) FROM trips")
+    return cursor.fetchone()[0]
+
+
+def slow_count(cursor):
+    time.sleep(1.0)
+    return count_trips(cursor)
+
+
+def test_callables_run_with_their_own_timeout(executor, monkeypatch):
+    hinted = []
+    with_time_limit = query_executor.with_time_limit
+
+    def recording_time_limit(sql, timeout):
+        hinted.append(timeout)
+        return with_time_limit(sql, timeout)
+
+    monkeypatch.setattr(query_executor, 'with_time_limit', recording_time_limit)
+    results = executor.run({'bare': count_trips, 'limited': Query(count_trips, timeout=2)})
+
+    assert results == {'bare': 0, 'limited': 0}
+    assert sorted(hinted) == [2, 30]
+
+
+def test_short_timeout_cancels_a_slow_callable(executor):
+    started = time.monotonic()
+    with pytest.raises(QueryTimeout, match="'slow'"):
+        executor.run({'fast': count_trips, 'slow': Query(slow_count, timeout=0.2)})
+    assert time.monotonic() - started < 0.8
+
+
+def test_sql_queries_return_dict_rows(executor):
+    assert executor.run({'sql': Query("SELECT 1 AS one", fetch='one', timeout=5)}) == {'sql': {'one': 1}}
@@ -0,0 +1,100 @@
+"""DataProcessor.rebuild_aggregates against the pre-aggregates a batch load writes (SQLite)"""
+
+import pytest
+
+import loadtest
+from algorithms import TDigest
+from data_processor import DataProcessor
+from storage import AGGREGATE_TABLES, SQLiteStorage
+
+TRIPS = 1000
+BATCH = 150
+TRIP_COLUMNS = ('trip_id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'passenger_count',
+                'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude',
+                'store_and_fwd_flag', 'trip_duration')
+
+
+def open_processor(storage):
+    processor = DataProcessor(storage)
+    processor.conn = storage.connect()
+    processor.cursor = processor.conn.cursor()
+    return processor
+
+
+@pytest.fixture
+def loaded(tmp_path):
+    """A processor on a database filled through insert_batch, like a CSV load"""
+    source = SQLiteStorage(tmp_path / 'source.sqlite3')
+    loadtest.build_standin_database(source, trips=TRIPS)
+    conn = source.connect()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(TRIP_COLUMNS)} FROM trips ORDER BY trip_id")
+    rows = [dict(zip(TRIP_COLUMNS, values)) for values in cursor.fetchall()]
+    conn.close()
+
+    storage = SQLiteStorage(tmp_path / 'loaded.sqlite3')
+    storage.initialize_schema()
+    processor = open_processor(storage)
+    records = []
+    for row in rows:
+        row['id'] = row.pop('trip_id')
+        distance = processor.haversine_distance(row['pickup_longitude'], row['pickup_latitude'],
+                                                row['dropoff_longitude'], row['dropoff_latitude'])
+        records.append({'row': row, 'features': processor.compute_derived_features(row, distance)})
+    for start in range(0, len(records), BATCH):
+        processor.insert_batch(records[start:start + BATCH])
+    processor.flush_aggregates()
+    yield processor
+    processor.conn.close()
+
+
+def table_rows(processor, table):
+    processor.cursor.execute(f"SELECT * FROM {table}")
+    return sorted(processor.cursor.fetchall(), key=lambda row: [str(value) for value in row])
+
+
+def sketches(processor):
+    return {tuple(row[:4]): TDigest.from_bytes(row[4])
+            for row in processor.storage.metric_sketch_rows(processor.cursor)}
+
+
+def test_rebuild_reproduces_the_batch_load(loaded):
+    incremental = {table: table_rows(loaded, table) for table in ('route_counts', 'heatmap_cells')}
+    buckets = table_rows(loaded, 'timeseries_buckets')
+    digests = sketches(loaded)
+    generation = loaded.storage.dataset_generation(loaded.cursor)
+
+    loaded.rebuild_aggregates()
+
+    for table, rows in incremental.items():
+        assert table_rows(loaded, table) == rows, table
+    rebuilt_buckets = table_rows(loaded, 'timeseries_buckets')
+    assert len(rebuilt_buckets) == len(buckets)
+    for rebuilt, original in zip(rebuilt_buckets, buckets):
+        assert rebuilt[:3] == original[:3]
+        assert rebuilt[3:] == pytest.approx(original[3:])
+
+    rebuilt_digests = sketches(loaded)
+    assert rebuilt_digests.keys() == digests.keys()
+    for key, digest in digests.items():
+        assert rebuilt_digests[key].count() == digest.count()
+        assert rebuilt_digests[key].minimum == digest.minimum
+        assert rebuilt_digests[key].maximum == digest.maximum
+    assert digests[('speed', -1, -1, -1)].count() == TRIPS
+
+    assert loaded.storage.sketch_lag(loaded.cursor)['unsketched_trips'] == 0
+    assert loaded.storage.dataset_generation(loaded.cursor) == generation + 1
+
+
+def test_rebuild_replaces_stale_aggregates(loaded):
+    expected = {table: table_rows(loaded, table) for table in ('route_counts', 'heatmap_cells')}
+    loaded.storage.upsert_route_counts(loaded.cursor, [(-1, -1, 0, 0, 0, 0, 99)])
+    loaded.cursor.execute("UPDATE heatmap_cells SET pickup_count = pickup_count + 5")
+    loaded.conn.commit()
+
+    loaded.rebuild_aggregates()
+
+    for table, rows in expected.items():
+        assert table_rows(loaded, table) == rows, table
+    for table in AGGREGATE_TABLES:
+        assert table_rows(loaded, table)
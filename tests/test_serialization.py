@@ -0,0 +1,109 @@
+"""serialization output against the original json.dumps(_convert_decimals(payload)) path"""
+
+import json
+import math
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import serialization
+from serialization import TaxiConverter, row_encoder_for
+from storage import MySQLStorage, SQLiteStorage
+
+COLUMNS = ('trip_id', 'vendor_id', 'pickup_datetime', 'passenger_count', 'trip_distance_miles',
+           'avg_speed_mph', 'time_period', 'store_and_fwd_flag')
+ROWS = [
+    ('id0000001', 2, datetime(2016, 3, 14, 17, 24, 55), 1, Decimal('1.50'), Decimal('11.856'),
+     'Evening', 'N'),
+    ('id0000002', 1, datetime(2016, 6, 12, 0, 43, 35), None, Decimal('0'), float('nan'),
+     'Late Night', None),
+    ('idé"\\\n', 2, datetime(2016, 1, 19, 11, 35, 24, 500000), 6, Decimal('-3.25E+2'), float('inf'),
+     'Morning ☕', 'Y'),
+]
+
+
+def convert_decimals(data):
+    # server.py's original helper
+    if isinstance(data, list):
+        return [convert_decimals(item) for item in data]
+    elif isinstance(data, dict):
+        return {key: convert_decimals(value) for key, value in data.items()}
+    elif isinstance(data, Decimal):
+        return float(data)
+    else:
+        return data
+
+
+def baseline_body(rows):
+    """What the original handlers sent: dict rows, datetimes str()'d, then json.dumps"""
+    trips = []
+    for row in rows:
+        trip = dict(zip(COLUMNS, row))
+        if trip.get('pickup_datetime'):
+            trip['pickup_datetime'] = str(trip['pickup_datetime'])
+        trips.append(trip)
+    payload = {'success': True, 'data': trips, 'total': len(trips), 'stats': {'mean': Decimal('2.5'), 'none': None}}
+    return json.dumps(convert_decimals(payload)).encode('utf-8')
+
+
+def current_body(rows):
+    payload = {'success': True, 'data': row_encoder_for(COLUMNS).encode_rows(rows), 'total': len(rows),
+               'stats': {'mean': Decimal('2.5'), 'none': None}}
+    return serialization.dumps(payload)
+
+
+@pytest.fixture
+def backend():
+    previous = serialization.get_backend()
+    yield serialization.set_backend
+    serialization.set_backend(previous)
+
+
+def test_stdlib_output_is_byte_identical(backend):
+    backend('stdlib')
+    assert current_body(ROWS) == baseline_body(ROWS)
+    assert current_body([]) == baseline_body([])
+    for row in ROWS:
+        assert current_body([row]) == baseline_body([row])
+
+
+def test_orjson_output_has_the_same_values(backend):
+    if backend('orjson') != 'orjson':
+        pytest.skip("orjson >= 3.9 not installed")
+    # Compact separators, and NaN/Infinity become null (orjson only writes strict JSON)
+    expected = json.loads(baseline_body(ROWS))
+    for trip in expected['data']:
+        if not math.isfinite(trip['avg_speed_mph']):
+            trip['avg_speed_mph'] = None
+    actual = json.loads(current_body(ROWS))
+    assert actual == expected
+
+
+def test_converter_matches_the_handler_conversions():
+    converter = TaxiConverter.__new__(TaxiConverter)
+    assert converter._DECIMAL_to_python(b'11.856') == float(Decimal('11.856'))
+    assert converter._NEWDECIMAL_to_python(b'-325.00') == -325.0
+    assert converter._DATETIME_to_python(b'2016-03-14 17:24:55') == str(datetime(2016, 3, 14, 17, 24, 55))
+    assert converter._TIMESTAMP_to_python(datetime(2016, 1, 1)) == '2016-01-01 00:00:00'
+
+
+def test_converter_is_only_on_reader_connections(monkeypatch):
+    connects = []
+    mysql = pytest.importorskip('mysql.connector')
+    monkeypatch.setattr(mysql, 'connect', lambda **kwargs: connects.append(kwargs))
+    storage = MySQLStorage({'host': 'localhost'})
+    storage.connect()
+    storage.connect_reader()
+    assert 'converter_class' not in connects[0]
+    assert connects[1]['converter_class'] is TaxiConverter
+
+
+def test_sqlite_reader_is_a_plain_connection(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'trips.sqlite3')
+    storage.initialize_schema()
+    conn = storage.connect_reader()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1")
+    assert cursor.fetchone() == (1,)
+    conn.close()
@@ -0,0 +1,87 @@
+"""metric_sketches watermark: how many loaded trips the sketches leave out"""
+
+import pytest
+
+import data_processor
+import loadtest
+from data_processor import DataProcessor
+from storage import SQLiteStorage
+
+BATCH = 100
+TRIP_COLUMNS = ('trip_id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'passenger_count',
+                'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude',
+                'store_and_fwd_flag', 'trip_duration')
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(tmp_path / 'trips.sqlite3')
+    loadtest.build_standin_database(storage, trips=1000)
+    return storage
+
+
+def open_processor(storage):
+    """A DataProcessor as a fresh data_processor.py run would start"""
+    processor = DataProcessor(storage)
+    processor.conn = storage.connect()
+    processor.cursor = processor.conn.cursor()
+    return processor
+
+
+def copied_batches(processor, count):
+    """count batches of records copying stored trips under new ids"""
+    processor.cursor.execute(f"SELECT {', '.join(TRIP_COLUMNS)} FROM trips ORDER BY trip_id LIMIT %s",
+                             (count * BATCH,))
+    records = []
+    for values in processor.cursor.fetchall():
+        row = dict(zip(TRIP_COLUMNS, values))
+        row['id'] = 'copy' + row.pop('trip_id')
+        distance = processor.haversine_distance(row['pickup_longitude'], row['pickup_latitude'],
+                                                row['dropoff_longitude'], row['dropoff_latitude'])
+        records.append({'row': row, 'features': processor.compute_derived_features(row, distance)})
+    return [records[start:start + BATCH] for start in range(0, len(records), BATCH)]
+
+
+def unsketched(processor):
+    return processor.storage.sketch_lag(processor.cursor)['unsketched_trips']
+
+
+def test_watermark_follows_flushes(storage, monkeypatch):
+    monkeypatch.setattr(data_processor, 'SKETCH_FLUSH_BATCHES', 3)
+    processor = open_processor(storage)
+    assert unsketched(processor) == 0
+
+    batches = copied_batches(processor, 4)
+    for loaded, batch in enumerate(batches[:2], 1):
+        processor.insert_batch(batch)
+        assert unsketched(processor) == loaded * BATCH
+    processor.insert_batch(batches[2])
+    assert unsketched(processor) == 0
+
+    processor.insert_batch(batches[3])
+    processor.flush_aggregates()
+    assert unsketched(processor) == 0
+    processor.cursor.execute("SELECT COUNT(*) FROM trip_metrics")
+    total = processor.cursor.fetchone()[0]
+    assert processor.sketches[('speed', -1, -1, -1)].count() == total
+    processor.conn.close()
+
+
+def test_interrupted_load_holds_watermark_until_rebuild(storage, monkeypatch):
+    monkeypatch.setattr(data_processor, 'SKETCH_FLUSH_BATCHES', 2)
+    processor = open_processor(storage)
+    batches = copied_batches(processor, 3)
+    processor.insert_batch(batches[0])
+    processor.conn.close()  # stopped before its first sketch flush
+
+    # The next run merges into sketches that miss the first batch, so the
+    # watermark cannot move past it
+    processor = open_processor(storage)
+    processor.insert_batch(batches[1])
+    processor.insert_batch(batches[2])
+    assert not processor.sketches_complete
+    assert unsketched(processor) == 3 * BATCH
+
+    processor.rebuild_aggregates()
+    assert unsketched(processor) == 0
+    processor.conn.close()
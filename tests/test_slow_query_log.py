@@ -0,0 +1,104 @@
+"""slow_query_log: statement shapes, the NDJSON log and the per-shape report"""
+
+import json
+import time
+import urllib.request
+
+import pytest
+
+import loadtest
+import server
+from slow_query_log import SlowQueryLog, aggregate, normalize_sql, read_entries
+
+
+@pytest.mark.parametrize('sql, shape', [
+    ("SELECT * FROM trips WHERE trip_id = 'id0001'", "SELECT * FROM trips WHERE trip_id = ?"),
+    ("SELECT * FROM t WHERE a = 'it''s' AND b = 'x\\'y'", "SELECT * FROM t WHERE a = ? AND b = ?"),
+    ("SELECT * FROM t WHERE a > -5 AND b < 1.25 AND c = 3e-4", "SELECT * FROM t WHERE a > ? AND b < ? AND c = ?"),
+    ("SELECT t1.col2, idx_3 FROM t1 LIMIT 10", "SELECT t1.col2, idx_3 FROM t1 LIMIT ?"),
+    ("SELECT * FROM t WHERE a = %s AND b = %(name)s", "SELECT * FROM t WHERE a = ? AND b = ?"),
+    ("SELECT * FROM t WHERE a IN (1, 2, 3) OR b in (%s,%s)", "SELECT * FROM t WHERE a IN (...) OR b IN (...)"),
+    ("SELECT /*+ MAX_EXECUTION_TIME(1000) */ COUNT(*) FROM t", "SELECT COUNT(*) FROM t"),
+    ("SELECT *\n    FROM t\n\tWHERE a = 1", "SELECT * FROM t WHERE a = ?"),
+])
+def test_normalize_sql(sql, shape):
+    assert normalize_sql(sql) == shape
+
+
+def test_values_share_a_shape():
+    shapes = {normalize_sql(f"SELECT * FROM t WHERE a = {value} AND b IN ({', '.join(['%s'] * count)})")
+              for value, count in [(1, 1), (-20, 3), ("'text'", 7), (2.5, 2)]}
+    assert len(shapes) == 1
+
+
+def entry(shape, duration_ms, rows=0, route=None, explain=None):
+    return {'shape': shape, 'duration_ms': duration_ms, 'rows': rows, 'route': route, 'explain': explain}
+
+
+def test_aggregate_ranks_shapes_by_total_time():
+    mysql_plan = {'query_block': {'ordering_operation': {'using_filesort': True, 'table': {
+        'table_name': 'tm', 'access_type': 'ALL'}}}}
+    sqlite_plan = [{'id': 3, 'parent': 0, 'detail': 'SCAN t'},
+                   {'id': 9, 'parent': 0, 'detail': 'USE TEMP B-TREE FOR ORDER BY'},
+                   {'id': 12, 'parent': 0, 'detail': 'SCAN tm USING INDEX idx_speed'}]
+    report = aggregate([
+        entry('A', 600, rows=10, route='/api/trips', explain=mysql_plan),
+        entry('B', 900, rows=1, route='/api/statistics', explain=sqlite_plan),
+        entry('A', 700, rows=30, route='/api/export'),
+        entry('A', 500, rows=20, route='/api/trips', explain={'error': 'gone away'}),
+        entry('C', 50, rows=None),
+    ])
+    assert [shape['shape'] for shape in report] == ['A', 'B', 'C']
+
+    first = report[0]
+    assert first['count'] == 3
+    assert first['total_ms'] == 1800 and first['max_ms'] == 700 and first['avg_ms'] == 600
+    assert first['total_rows'] == 60 and first['avg_rows'] == 20
+    assert first['routes'] == ['/api/export', '/api/trips']
+    assert first['warnings'] == ['filesort', 'full scan of tm']
+    assert report[1]['warnings'] == ['full scan of t', 'temporary b-tree']
+    assert report[2]['total_rows'] == 0 and report[2]['routes'] == [] and report[2]['warnings'] == []
+
+
+def test_read_entries_follows_rotation(tmp_path):
+    path = tmp_path / 'slow.log'
+    (tmp_path / 'slow.log.2').write_text(json.dumps(entry('oldest', 1)) + '\n', encoding='utf-8')
+    (tmp_path / 'slow.log.1').write_text(json.dumps(entry('older', 1)) + '\nnot json\n', encoding='utf-8')
+    path.write_text(json.dumps(entry('newest', 1)) + '\n', encoding='utf-8')
+    assert [item['shape'] for item in read_entries(path)] == ['oldest', 'older', 'newest']
+    assert list(read_entries(tmp_path / 'missing.log')) == []
+
+
+def test_below_threshold_is_not_queued(tmp_path):
+    log = SlowQueryLog(tmp_path / 'slow.log', threshold=0.5)
+    log.record("SELECT 1", (), 1.0, 1)  # not started: nothing to write to
+    log.start()
+    log.record("SELECT 1", (), 0.1, 1)
+    assert log._queue.empty()
+
+
+def test_server_statements_are_logged_with_plans(tmp_path, monkeypatch):
+    with loadtest.EmbeddedServer(trips=200) as embedded:
+        log = SlowQueryLog(tmp_path / 'slow.log', threshold=0, pool=server.db_pool, storage=server.storage)
+        log.start()
+        monkeypatch.setattr(server, 'slow_query_log', log)
+        for vendor in (1, 2):
+            urllib.request.urlopen(f"{embedded.url}/api/trips?sort_by=speed&vendor_id={vendor}&limit=5").read()
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and not (log._queue.empty() and len(list(read_entries(log.path))) >= 4):
+            time.sleep(0.05)
+        time.sleep(0.1)  # let the worker finish writing its last entry
+
+    entries = list(read_entries(log.path))
+    pages = [item for item in entries if item['shape'].startswith('SELECT') and 'ORDER BY' in item['shape']]
+    assert len(pages) == 2
+    assert {json.dumps(item['params']) for item in pages} == {'[1, 6, 0]', '[2, 6, 0]'}
+    assert all(item['route'] == '/api/trips' and item['duration_ms'] >= 0 for item in pages)
+    assert all('?' in item['shape'] and '%s' not in item['shape'] for item in pages)
+    # SQLite EXPLAIN QUERY PLAN rows, captured on the worker's own connection
+    assert all(item['explain'] and all('detail' in step for step in item['explain']) for item in pages)
+
+    report = aggregate(entries)
+    page_shape = next(shape for shape in report if shape['shape'] == pages[0]['shape'])
+    assert page_shape['count'] == 2 and page_shape['routes'] == ['/api/trips']
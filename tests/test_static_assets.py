@@ -0,0 +1,161 @@
+"""StaticAssetCache and serve_static: preloaded bodies, ETag revalidation and gzip negotiation"""
+
+import gzip
+import http.client
+import os
+from urllib.parse import urlparse
+
+import pytest
+
+import loadtest
+import server
+from server import StaticAssetCache
+
+FILES = {
+    '/': ('index.html', 'text/html; charset=utf-8'),
+    '/index.html': ('index.html', 'text/html; charset=utf-8'),
+    '/app.js': ('app.js', 'application/javascript; charset=utf-8'),
+    '/tiny.css': ('tiny.css', 'text/css; charset=utf-8'),
+    '/missing.js': ('missing.js', 'application/javascript; charset=utf-8'),
+}
+INDEX = '<!DOCTYPE html>\n<title>Taxi trips ☕</title>\n' + '<div class="row">trip</div>\n' * 200
+APP = 'const rows = [];\n' * 300
+
+
+@pytest.fixture
+def frontend(tmp_path):
+    (tmp_path / 'index.html').write_text(INDEX, encoding='utf-8')
+    (tmp_path / 'app.js').write_text(APP, encoding='utf-8')
+    (tmp_path / 'tiny.css').write_text('a{}', encoding='utf-8')
+    return tmp_path
+
+
+@pytest.fixture
+def assets(frontend, monkeypatch):
+    cache = StaticAssetCache(frontend, FILES)
+    cache.load()
+    monkeypatch.setattr(server, 'static_assets', cache)
+    monkeypatch.setattr(server, 'STATIC_FILES', FILES)
+    return cache
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=100) as embedded:
+        yield embedded
+
+
+def fetch(embedded, path, **headers):
+    url = urlparse(embedded.url)
+    conn = http.client.HTTPConnection(url.hostname, url.port)
+    try:
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_assets_are_encoded_once_per_file(assets):
+    index = assets.get('/index.html')
+    assert assets.get('/') is index
+    assert index.body == INDEX.encode('utf-8')
+    assert index.content_length == str(len(index.body))
+    assert gzip.decompress(index.gzip_body) == index.body
+    assert index.gzip_length == str(len(index.gzip_body))
+    assert index.etag != index.gzip_etag
+
+    # Compression that saves nothing is not kept
+    assert assets.get('/tiny.css').gzip_body is None
+    assert assets.get('/missing.js') is None
+
+
+def test_etag_follows_content(frontend):
+    first = StaticAssetCache.build_asset(frontend / 'app.js', 'application/javascript')
+    again = StaticAssetCache.build_asset(frontend / 'app.js', 'application/javascript')
+    assert first.etag == again.etag and first.gzip_body == again.gzip_body
+    (frontend / 'app.js').write_text(APP + '// changed\n', encoding='utf-8')
+    changed = StaticAssetCache.build_asset(frontend / 'app.js', 'application/javascript')
+    assert changed.etag != first.etag
+
+
+def test_identity_response(embedded, assets):
+    status, headers, body = fetch(embedded, '/index.html')
+    assert status == 200
+    assert body == INDEX.encode('utf-8')
+    assert 'Content-Encoding' not in headers
+    assert headers['Content-Length'] == str(len(body))
+    assert headers['ETag'] == assets.get('/index.html').etag
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert headers['Cache-Control'] == 'no-cache'
+
+
+@pytest.mark.parametrize('accept, compressed', [
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('*', True),
+    ('gzip;q=0', False),
+    ('br, deflate', False),
+    ('gzip;q=bad', False),
+])
+def test_gzip_negotiation(embedded, assets, accept, compressed):
+    status, headers, body = fetch(embedded, '/app.js', **{'Accept-Encoding': accept})
+    asset = assets.get('/app.js')
+    assert status == 200
+    if compressed:
+        assert headers['Content-Encoding'] == 'gzip'
+        assert headers['ETag'] == asset.gzip_etag
+        assert gzip.decompress(body) == APP.encode('utf-8')
+    else:
+        assert 'Content-Encoding' not in headers
+        assert headers['ETag'] == asset.etag
+        assert body == APP.encode('utf-8')
+    assert headers['Content-Length'] == str(len(body))
+
+
+def test_uncompressible_asset_is_sent_as_is(embedded, assets):
+    status, headers, body = fetch(embedded, '/tiny.css', **{'Accept-Encoding': 'gzip'})
+    assert status == 200 and body == b'a{}'
+    assert 'Content-Encoding' not in headers
+
+
+def test_conditional_requests(embedded, assets):
+    asset = assets.get('/app.js')
+
+    status, headers, body = fetch(embedded, '/app.js', **{'If-None-Match': asset.etag})
+    assert status == 304 and body == b''
+    assert headers['ETag'] == asset.etag
+
+    status, _, _ = fetch(embedded, '/app.js', **{'If-None-Match': f'"other", {asset.etag}'})
+    assert status == 304
+    status, _, _ = fetch(embedded, '/app.js', **{'If-None-Match': '*'})
+    assert status == 304
+
+    # Each encoding is its own representation
+    status, _, _ = fetch(embedded, '/app.js', **{'If-None-Match': asset.etag, 'Accept-Encoding': 'gzip'})
+    assert status == 200
+    status, headers, _ = fetch(embedded, '/app.js', **{'If-None-Match': asset.gzip_etag, 'Accept-Encoding': 'gzip'})
+    assert status == 304 and headers['ETag'] == asset.gzip_etag
+
+    status, _, _ = fetch(embedded, '/app.js', **{'If-None-Match': '"stale"'})
+    assert status == 200
+
+
+def test_missing_file_is_a_404(embedded, assets):
+    status, _, _ = fetch(embedded, '/missing.js')
+    assert status == 404
+
+
+def test_reload_swaps_the_table(frontend, assets):
+    before = assets.get('/app.js')
+    assert not assets.is_stale()
+
+    (frontend / 'app.js').write_text('const changed = true;\n' * 100, encoding='utf-8')
+    stat = (frontend / 'app.js').stat()
+    os.utime(frontend / 'app.js', (stat.st_atime, before.mtime + 10))
+    assert assets.is_stale()
+
+    assets.load()
+    assert not assets.is_stale()
+    assert assets.get('/app.js').etag != before.etag
+    assert before.body == APP.encode('utf-8')
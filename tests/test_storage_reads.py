@@ -0,0 +1,135 @@
+"""
+Read paths against the embedded SQLite backend: the server runs in-process on a
+synthetic dataset (loadtest.EmbeddedServer), so no MySQL server is needed.
+"""
+
+import json
+import math
+import urllib.request
+
+import pytest
+
+import loadtest
+import server
+
+TRIPS = 2000
+
+
+@pytest.fixture(scope='module')
+def api():
+    with loadtest.EmbeddedServer(trips=TRIPS) as embedded:
+        def get(path):
+            with urllib.request.urlopen(embedded.url + path) as response:
+                return json.loads(response.read())
+        yield get
+
+
+def assert_same(actual, expected, path='response'):
+    """Equal up to float rounding, recursing into lists and dicts"""
+    if isinstance(expected, float) or isinstance(actual, float):
+        assert actual == pytest.approx(expected, rel=1e-9), path
+    elif isinstance(expected, dict):
+        assert set(actual) == set(expected), path
+        for key in expected:
+            assert_same(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected), path
+        for position, (left, right) in enumerate(zip(actual, expected)):
+            assert_same(left, right, f"{path}[{position}]")
+    else:
+        assert actual == expected, path
+
+
+@pytest.mark.parametrize('sort_by,order', [('distance', 'desc'), ('pickup_datetime', 'asc')])
+def test_keyset_pages_cover_every_trip_once_in_order(api, sort_by, order):
+    first = api(f"/api/trips?sort_by={sort_by}&order={order}&limit={TRIPS}&include_total=false")
+    expected = [trip['trip_id'] for trip in first['data']]
+    assert len(expected) == TRIPS and not first['has_more']
+
+    seen = []
+    path = f"/api/trips?sort_by={sort_by}&order={order}&limit=150"
+    page = api(path)
+    while True:
+        seen.extend(trip['trip_id'] for trip in page['data'])
+        if not page['has_more']:
+            break
+        page = api(f"{path}&include_total=false&cursor={page['next_cursor']}")
+    assert seen == expected
+
+
+def test_keyset_pages_respect_filters(api):
+    total = api("/api/trips?vendor_id=1&min_distance=2&limit=1")['total']
+    seen = []
+    page = api("/api/trips?vendor_id=1&min_distance=2&sort_by=speed&limit=40")
+    while True:
+        assert all(trip['vendor_id'] == 1 and trip['trip_distance_miles'] >= 2 for trip in page['data'])
+        seen.extend(trip['trip_id'] for trip in page['data'])
+        if not page['has_more']:
+            break
+        page = api(f"/api/trips?vendor_id=1&min_distance=2&sort_by=speed&limit=40&cursor={page['next_cursor']}")
+    assert len(seen) == len(set(seen)) == total
+
+
+def test_dashboard_matches_statistics_and_insights(api):
+    dashboard = api("/api/dashboard")
+    statistics = api("/api/statistics")
+    insights = api("/api/insights")
+    assert statistics['overall']['total_trips'] == TRIPS
+
+    assert_same(dashboard['statistics']['overall'], statistics['overall'])
+    assert_same(dashboard['statistics']['by_vendor'], statistics['by_vendor'])
+    assert_same(dashboard['statistics']['distance_distribution'], statistics['distance_distribution'])
+    by_period = {row['time_period']: row['trip_count'] for row in statistics['by_time_period']}
+    assert {row['time_period']: row['trip_count'] for row in dashboard['statistics']['by_time_period']} == by_period
+    assert_same(dashboard['insights']['hourly_patterns'], insights['hourly_patterns'])
+    assert_same(dashboard['insights']['weekend_vs_weekday'], insights['weekend_vs_weekday'])
+
+
+@pytest.mark.parametrize('scale', ['linear', 'log'])
+def test_histogram_counts_match_trips(api, scale):
+    bins = 25
+    histogram = api(f"/api/histogram?metric=distance&bins={bins}&scale={scale}")
+    assert histogram['total'] == TRIPS
+
+    # Recount from the raw values with the same bin rule
+    trips = api(f"/api/trips?limit={TRIPS}&include_total=false")['data']
+    low, high = histogram['low'], histogram['high']
+    transform = math.log if scale == 'log' else float
+    start, width = transform(low), (transform(high) - transform(low)) / bins
+    counts = [0] * bins
+    for trip in trips:
+        position = math.floor((transform(trip['trip_distance_miles']) - start) / width)
+        counts[min(max(position, 0), bins - 1)] += 1
+    assert [row['count'] for row in histogram['data']] == counts
+
+
+def test_histogram_filters_and_range(api):
+    filtered = api("/api/histogram?metric=duration&bins=10&range=300,1200&vendor_id=2")
+    expected = api("/api/trips?vendor_id=2&min_duration=300&max_duration=1200&limit=1")['total']
+    assert filtered['total'] == expected
+    assert filtered['data'][0]['lower'] == 300 and filtered['data'][-1]['upper'] == pytest.approx(1200)
+
+
+@pytest.mark.parametrize('query', ['', '&hour=8', '&is_weekend=true', '&hour=18&is_weekend=false'])
+def test_top_routes_from_aggregates_match_full_scan(api, monkeypatch, query):
+    aggregated = api(f"/api/top-routes?limit={TRIPS}{query}")
+    monkeypatch.setattr(server, 'TOP_ROUTES_FROM_AGGREGATES', False)
+    scanned = api(f"/api/top-routes?limit={TRIPS}{query}")
+
+    assert scanned['exact'] and aggregated['exact']
+    assert aggregated['total_unique_routes'] == scanned['total_unique_routes']
+
+    def counts(response):
+        return {(route['pickup_longitude'], route['pickup_latitude'],
+                 route['dropoff_longitude'], route['dropoff_latitude']): route['trip_count']
+                for route in response['data']}
+    assert counts(aggregated) == counts(scanned)
+    assert [route['trip_count'] for route in aggregated['data']] == \
+        [route['trip_count'] for route in scanned['data']]
+
+
+def test_sketch_responses_report_unsketched_trips(api):
+    for path in ('/api/percentiles?metric=speed', '/api/outlier-bounds?metric=duration&hour=8'):
+        sketched = api(path)
+        assert sketched['unsketched_trips'] == 0 and sketched['sketches_flushed_at']
+        assert 'unsketched_trips' not in api(path + '&exact=true')
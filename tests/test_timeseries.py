@@ -0,0 +1,133 @@
+"""/api/timeseries: granularity rollups against the raw trips, and range bounds"""
+
+import json
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+import pytest
+
+import loadtest
+import server
+
+TRIPS = 800
+TRUNCATE = {
+    '15m': lambda pickup: pickup.replace(minute=pickup.minute - pickup.minute % 15, second=0),
+    'hour': lambda pickup: pickup.replace(minute=0, second=0),
+    'day': lambda pickup: pickup.replace(hour=0, minute=0, second=0),
+    'week': lambda pickup: (pickup - timedelta(days=pickup.weekday())).replace(hour=0, minute=0, second=0),
+}
+METRIC_FIELDS = {'distance': 'trip_distance_miles', 'duration': 'trip_duration', 'speed': 'avg_speed_mph'}
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=TRIPS) as embedded:
+        yield embedded
+
+
+@pytest.fixture(scope='module')
+def trips(embedded):
+    return get(embedded, f"/api/trips?limit={TRIPS}&include_total=false")[1]['data']
+
+
+def get(embedded, path):
+    try:
+        with urllib.request.urlopen(embedded.url + path) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def expected_points(trips, granularity, metric):
+    """Bucket the raw trips directly at the requested granularity"""
+    buckets = {}
+    for trip in trips:
+        start = TRUNCATE[granularity](datetime.fromisoformat(trip['pickup_datetime']))
+        buckets.setdefault(start.strftime('%Y-%m-%d %H:%M:%S'), []).append(trip)
+    points = []
+    for start in sorted(buckets):
+        rows = buckets[start]
+        value = len(rows) if metric == 'trips' else sum(row[METRIC_FIELDS[metric]] for row in rows) / len(rows)
+        points.append((start, len(rows), value))
+    return points
+
+
+@pytest.mark.parametrize('granularity', server.TIMESERIES_GRANULARITIES)
+@pytest.mark.parametrize('metric', sorted(server.TIMESERIES_METRICS))
+def test_rollups_match_the_raw_trips(embedded, trips, granularity, metric):
+    status, body = get(embedded, f"/api/timeseries?metric={metric}&granularity={granularity}")
+    assert status == 200
+    assert body['metric'] == metric and body['granularity'] == granularity
+    assert body['start'] is None and body['end'] is None and body['truncated'] is False
+
+    expected = expected_points(trips, granularity, metric)
+    assert [(point['bucket_start'], point['trip_count']) for point in body['data']] == \
+        [(start, count) for start, count, _ in expected]
+    assert [point['value'] for point in body['data']] == pytest.approx([value for _, _, value in expected])
+    assert sum(point['trip_count'] for point in body['data']) == TRIPS
+
+
+def test_weeks_start_on_monday(embedded):
+    _, body = get(embedded, "/api/timeseries?granularity=week")
+    starts = [datetime.fromisoformat(point['bucket_start']) for point in body['data']]
+    assert starts and all(start.weekday() == 0 and start.time() == datetime.min.time() for start in starts)
+
+
+def test_range_is_start_inclusive_end_exclusive(embedded):
+    _, body = get(embedded, "/api/timeseries?granularity=hour")
+    starts = [point['bucket_start'] for point in body['data']]
+    assert len(starts) > 10
+    low, high = starts[3], starts[9]
+
+    query = f"granularity=hour&start={low.replace(' ', 'T')}&end={high.replace(' ', 'T')}"
+    status, ranged = get(embedded, f"/api/timeseries?{query}")
+    assert status == 200
+    assert ranged['start'] == low and ranged['end'] == high
+    assert [point['bucket_start'] for point in ranged['data']] == starts[3:9]
+
+
+def test_bounds_select_whole_buckets(embedded):
+    _, body = get(embedded, "/api/timeseries?granularity=day")
+    days = [point['bucket_start'] for point in body['data']]
+    first = datetime.fromisoformat(days[1])
+
+    # A start inside a day skips that day's bucket; date-only bounds are midnight
+    _, ranged = get(embedded, f"/api/timeseries?granularity=day&start={(first + timedelta(hours=12)).isoformat()}")
+    assert [point['bucket_start'] for point in ranged['data']] == days[2:]
+    _, ranged = get(embedded, f"/api/timeseries?granularity=day&start={first.date().isoformat()}&end={days[4][:10]}")
+    assert ranged['start'] == days[1]
+    assert [point['bucket_start'] for point in ranged['data']] == days[1:4]
+
+    _, empty = get(embedded, "/api/timeseries?start=2030-01-01")
+    assert empty['data'] == [] and empty['truncated'] is False
+    _, inverted = get(embedded, f"/api/timeseries?start={days[3][:10]}&end={days[1][:10]}")
+    assert inverted['data'] == []
+
+
+def test_long_ranges_are_truncated(embedded, monkeypatch):
+    _, weeks = get(embedded, "/api/timeseries?granularity=week")
+    _, quarters = get(embedded, "/api/timeseries?granularity=15m")
+
+    monkeypatch.setattr(server, 'TIMESERIES_MAX_POINTS', 5)
+    _, cut = get(embedded, "/api/timeseries?granularity=15m&start=2000-01-01")
+    assert cut['truncated'] is True
+    assert cut['data'] == quarters['data'][:5]
+
+    # Exactly the limit is not truncated
+    monkeypatch.setattr(server, 'TIMESERIES_MAX_POINTS', len(weeks['data']))
+    _, exact = get(embedded, "/api/timeseries?granularity=week")
+    assert exact['truncated'] is False and exact['data'] == weeks['data']
+
+
+@pytest.mark.parametrize('query', [
+    'metric=fare',
+    'granularity=month',
+    'granularity=15min',
+    'start=yesterday',
+    'end=2016-13-01',
+    'start=2016-01-01T25:00',
+])
+def test_bad_parameters_are_rejected(embedded, query):
+    status, _ = get(embedded, f"/api/timeseries?{query}")
+    assert status == 400
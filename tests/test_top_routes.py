@@ -0,0 +1,38 @@
+"""/api/top-routes from route_counts: limit validation and ordering"""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import loadtest
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=500) as embedded:
+        yield embedded
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'ten'])
+def test_bad_limit_is_rejected(embedded, limit):
+    status, _ = get(f"{embedded.url}/api/top-routes?limit={limit}")
+    assert status == 400
+
+
+def test_top_routes_are_ordered_by_count(embedded):
+    status, body = get(f"{embedded.url}/api/top-routes?limit=5&hour=8&is_weekend=false")
+    assert status == 200
+    counts = [route['trip_count'] for route in body['data']]
+    assert 0 < len(counts) <= 5
+    assert counts == sorted(counts, reverse=True)
+    assert body['total_unique_routes'] >= len(counts)
@@ -0,0 +1,122 @@
+"""/api/trips pages: index-ordered sorts, keyset pagination and parameter validation"""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import loadtest
+import server
+from storage import TRIP_SORT_COLUMNS, SQLiteStorage
+
+TRIPS = 600
+
+
+class RecordingCursor:
+    """Wraps a cursor and keeps the statements executed through it"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+        return self.cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+@pytest.fixture(scope='module')
+def storage(tmp_path_factory):
+    storage = SQLiteStorage(tmp_path_factory.mktemp('trips') / 'trips.sqlite3')
+    loadtest.build_standin_database(storage, trips=TRIPS)
+    return storage
+
+
+@pytest.fixture(scope='module')
+def embedded():
+    with loadtest.EmbeddedServer(trips=TRIPS) as embedded:
+        yield embedded
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def plan(storage, cursor, run):
+    recording = RecordingCursor(cursor)
+    run(recording)
+    sql, params = recording.statements[-1]
+    return [row[-1] for row in storage.explain(cursor, sql, params)]
+
+
+@pytest.mark.parametrize('sort_by', sorted(TRIP_SORT_COLUMNS))
+@pytest.mark.parametrize('order', ['ASC', 'DESC'])
+def test_sorted_pages_read_the_sort_index(storage, sort_by, order):
+    conn = storage.connect()
+    cursor = conn.cursor()
+    columns, rows = storage.select_trips(cursor, {}, sort_by, order, 1)
+    after = (rows[0][columns.index(server.TRIP_SORT_FIELDS[sort_by])], rows[0][columns.index('trip_id')])
+
+    plans = [
+        plan(storage, cursor, lambda c: storage.select_trips(c, {}, sort_by, order, 10)),
+        plan(storage, cursor, lambda c: storage.select_trips(c, {}, sort_by, order, 10, after=after)),
+        plan(storage, cursor, lambda c: storage.stream_trips(c, {}, sort_by, order)),
+    ]
+    conn.close()
+    for steps in plans:
+        assert not any('TEMP B-TREE' in step for step in steps), steps
+        assert any('USING INDEX idx_' in step for step in steps), steps
+
+
+@pytest.mark.parametrize('sort_by', ['distance', 'speed'])
+def test_cursor_pages_match_one_sorted_read(embedded, sort_by):
+    # Distances and speeds repeat, so some page boundaries fall inside runs of ties
+    status, body = get(f"{embedded.url}/api/trips?sort_by={sort_by}&limit={TRIPS}&include_total=false")
+    assert status == 200
+    expected = [trip['trip_id'] for trip in body['data']]
+
+    seen = []
+    url = f"{embedded.url}/api/trips?sort_by={sort_by}&limit=37&include_total=false"
+    status, body = get(url)
+    while True:
+        assert status == 200
+        seen.extend(trip['trip_id'] for trip in body['data'])
+        if not body['has_more']:
+            break
+        status, body = get(f"{url}&cursor={body['next_cursor']}")
+    assert seen == expected
+
+
+@pytest.mark.parametrize('limit, expected', [
+    ('0', 1),
+    ('-5', 1),
+    ('3', 3),
+    ('51', 50),
+])
+def test_limit_is_clamped(embedded, monkeypatch, limit, expected):
+    monkeypatch.setattr(server, 'TRIPS_MAX_LIMIT', 50)
+    status, body = get(f"{embedded.url}/api/trips?limit={limit}&include_total=false")
+    assert status == 200
+    assert body['limit'] == expected
+    assert len(body['data']) == expected
+    assert body['has_more'] is True
+    assert body['next_cursor'] is not None
+
+
+@pytest.mark.parametrize('query', [
+    'vendor_id=abc',
+    'min_distance=far',
+    'hour=1.5',
+    'limit=ten',
+    'offset=x',
+])
+def test_bad_parameter_values_are_rejected(embedded, query):
+    status, _ = get(f"{embedded.url}/api/trips?{query}")
+    assert status == 400
@@ -0,0 +1,168 @@
+"""ZoneIndex lookups against an exact point-in-polygon scan over every zone"""
+
+import json
+import math
+import random
+
+import pytest
+
+from zones import Zone, ZoneIndex
+
+CELL_SIZE = 0.001
+
+
+def square(west, south, size):
+    return [[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]
+
+
+def star(center_lon, center_lat, outer, inner, points=7):
+    """A concave ring with 2 * points vertices"""
+    ring = []
+    for index in range(2 * points):
+        radius = outer if index % 2 == 0 else inner
+        angle = math.pi * index / points
+        ring.append([center_lon + radius * math.cos(angle), center_lat + radius * math.sin(angle)])
+    return ring + [ring[0]]
+
+
+def feature(properties, geometry):
+    return {'type': 'Feature', 'properties': properties, 'geometry': geometry}
+
+
+FEATURES = [
+    # Two squares sharing an edge that does not fall on a cell boundary
+    feature({'LocationID': 1, 'zone': 'West Square', 'borough': 'Manhattan'},
+            {'type': 'Polygon', 'coordinates': [square(-74.00037, 40.70013, 0.0173)]}),
+    feature({'LocationID': 2, 'zone': 'East Square', 'borough': 'Manhattan'},
+            {'type': 'Polygon', 'coordinates': [square(-73.98307, 40.70013, 0.0173)]}),
+    # A ring with a hole, and a zone filling part of that hole
+    feature({'location_id': 3, 'Name': 'Donut', 'Borough': 'Brooklyn'},
+            {'type': 'Polygon', 'coordinates': [square(-74.0, 40.65, 0.03), square(-73.99, 40.66, 0.01)]}),
+    feature({'zone_id': '4', 'zone': 'Island', 'borough': 'Brooklyn'},
+            {'type': 'Polygon', 'coordinates': [star(-73.985, 40.665, 0.0045, 0.002)]}),
+    # Concave zone, and a zone split into two parts
+    feature({'LocationID': 5, 'zone': 'Star', 'borough': 'Queens'},
+            {'type': 'Polygon', 'coordinates': [star(-73.93, 40.72, 0.02, 0.007, points=9)]}),
+    feature({'LocationID': 6, 'zone': 'Islands', 'borough': 'Bronx'},
+            {'type': 'MultiPolygon', 'coordinates': [
+                [[[-73.90, 40.80], [-73.88, 40.81], [-73.885, 40.825], [-73.90, 40.80]]],
+                [square(-73.87, 40.80, 0.004)],
+            ]}),
+    # A thin sliver narrower than a cell
+    feature({'LocationID': 7, 'zone': 'Sliver', 'borough': 'Queens'},
+            {'type': 'Polygon', 'coordinates': [[[-73.95, 40.76], [-73.90, 40.7604], [-73.90, 40.7606],
+                                                  [-73.95, 40.7601], [-73.95, 40.76]]]}),
+    # A zone split over two features, and TLC-style zones without a shape
+    feature({'LocationID': 8, 'zone': 'Split (north)', 'borough': 'Staten Island'},
+            {'type': 'Polygon', 'coordinates': [square(-74.10, 40.60, 0.01)]}),
+    feature({'LocationID': 8, 'zone': 'Split (south)', 'borough': 'Staten Island'},
+            {'type': 'Polygon', 'coordinates': [square(-74.10, 40.58, 0.01)]}),
+    feature({'LocationID': 264, 'zone': 'NV', 'borough': 'Unknown'}, None),
+    feature({'LocationID': 265, 'zone': 'NA', 'borough': 'Unknown'},
+            {'type': 'Point', 'coordinates': [-73.9, 40.7]}),
+]
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    path = tmp_path_factory.mktemp('zones') / 'taxi_zones.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': FEATURES}), encoding='utf-8')
+    return ZoneIndex.load(path, cell_size=CELL_SIZE)
+
+
+def exact(index, longitude, latitude):
+    """The zone an exact test over every zone finds (the zones do not overlap)"""
+    matches = {zone.zone_id for zone in index.zones if zone.contains(longitude, latitude)}
+    assert len(matches) <= 1, (longitude, latitude, matches)
+    return matches.pop() if matches else None
+
+
+def test_zones_are_loaded(index):
+    assert [zone.zone_id for zone in index.zones] == [1, 2, 3, 4, 5, 6, 7, 8, 8]
+    assert index.zones[2].name == 'Donut' and index.zones[2].borough == 'Brooklyn'
+    assert len(index.zones[2].rings) == 2 and len(index.zones[5].rings) == 2
+    assert index.zone_rows() == [
+        (1, 'West Square', 'Manhattan'), (2, 'East Square', 'Manhattan'), (3, 'Donut', 'Brooklyn'),
+        (4, 'Island', 'Brooklyn'), (5, 'Star', 'Queens'), (6, 'Islands', 'Bronx'), (7, 'Sliver', 'Queens'),
+        (8, 'Split (north)', 'Staten Island'),
+    ]
+
+
+def test_uniform_points_match_exact_lookup(index):
+    generator = random.Random(1)
+    west, south = index.west - 0.01, index.south - 0.01
+    east = index.west + index.columns * CELL_SIZE + 0.01
+    north = index.south + index.rows * CELL_SIZE + 0.01
+    found = set()
+    for _ in range(40000):
+        longitude, latitude = generator.uniform(west, east), generator.uniform(south, north)
+        zone_id = index.zone_at(longitude, latitude)
+        assert zone_id == exact(index, longitude, latitude), (longitude, latitude)
+        found.add(zone_id)
+    assert found == {None, 1, 2, 3, 4, 5, 6, 7, 8}
+
+
+def test_points_near_edges_match_exact_lookup(index):
+    # Points within a fraction of a cell of every vertex and edge, where the grid defers to the polygons
+    generator = random.Random(2)
+    checked = 0
+    for zone in index.zones:
+        for ring in zone.rings:
+            for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                for _ in range(20):
+                    along = generator.random()
+                    longitude = x1 + (x2 - x1) * along + generator.uniform(-1, 1) * CELL_SIZE * 0.3
+                    latitude = y1 + (y2 - y1) * along + generator.uniform(-1, 1) * CELL_SIZE * 0.3
+                    assert index.zone_at(longitude, latitude) == exact(index, longitude, latitude)
+                    checked += 1
+    assert checked > 1000
+
+
+def test_known_points(index):
+    assert index.zone_at(-73.99, 40.71) == 1
+    assert index.zone_at(-73.97, 40.71) == 2
+    assert index.zone_at(-73.995, 40.655) == 3   # the donut's ring
+    assert index.zone_at(-73.985, 40.665) == 4   # inside the hole, on the island
+    assert index.zone_at(-73.9895, 40.6695) is None  # inside the hole, off the island
+    assert index.zone_at(-73.93, 40.72) == 5
+    assert index.zone_at(-73.93 + 0.013, 40.72 + 0.0045) is None  # between two star points
+    assert index.zone_at(-73.868, 40.802) == 6
+    assert index.zone_at(-73.92, 40.76025) == 7
+    assert index.zone_at(-74.095, 40.605) == index.zone_at(-74.095, 40.585) == 8
+    assert index.zone_at(-74.095, 40.595) is None
+    assert index.zone_at(-75.0, 40.7) is None and index.zone_at(-73.9, 42.0) is None
+
+
+def test_interior_cells_skip_the_polygon_test(index, monkeypatch):
+    calls = []
+    original = Zone.contains
+    monkeypatch.setattr(Zone, 'contains', lambda zone, lon, lat: calls.append(zone.zone_id) or original(zone, lon, lat))
+    assert index.zone_at(-73.99, 40.71) == 1
+    assert index.zone_at(-73.9, 40.9) is None
+    assert calls == []
+    interior = sum(1 for value in index.grid if value > 0)
+    boundary = sum(1 for value in index.grid if value < 0)
+    assert interior > boundary > 0
+
+
+@pytest.mark.parametrize('cell_size', [0.0005, 0.003, 0.01])
+def test_cell_size_does_not_change_answers(index, cell_size):
+    coarse = ZoneIndex(index.zones, cell_size=cell_size)
+    generator = random.Random(3)
+    for _ in range(5000):
+        longitude = generator.uniform(-74.11, -73.86)
+        latitude = generator.uniform(40.57, 40.83)
+        assert coarse.zone_at(longitude, latitude) == index.zone_at(longitude, latitude)
+
+
+def test_bad_zone_files(tmp_path):
+    path = tmp_path / 'zones.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        feature({'zone': 'No id'}, {'type': 'Polygon', 'coordinates': [square(-74, 40, 0.01)]}),
+    ]}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        ZoneIndex.load(path)
+
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [FEATURES[-1]]}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        ZoneIndex.load(path)